@@ -0,0 +1,121 @@
+"""Measures what an Epic promotions poll costs in each case, and !egs with and without the poller's cache.
+
+Usage:
+    python -m benchmarks.egs_poll --polls 200 --latency 0.05
+
+A local server stands in for the promotions endpoint, serving benchmarks/fixtures/egs_promotions.json after --latency
+seconds. Each poll mode runs the poller against it:
+    not_modified   the server honours If-None-Match, so repeat polls get a bodiless 304
+    unchanged      the server sends no validators, so every poll downloads the same body and only hashes it
+    changed        every response is a different payload, so every poll parses, fingerprints and rebuilds the embed
+"per_command" is the old !egs, which fetched and parsed the payload on every call, and "cached" is the new one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.loadtest import percentile
+from modules.egs import EGS_PARAMS, PromotionsPoller, build_embed, parse_game_list
+from utils.metrics import Metrics
+
+PAYLOAD = (Path(__file__).parent / "fixtures" / "egs_promotions.json").read_bytes()
+ETAG = '"fixture"'
+
+
+async def start_server(latency: float):
+    stats = {"mode": "not_modified", "bytes": 0, "served": 0}
+
+    async def promotions(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        if stats["mode"] == "not_modified":
+            if request.headers.get("If-None-Match") == ETAG:
+                return web.Response(status=304)
+            body, headers = PAYLOAD, {"ETag": ETAG}
+        elif stats["mode"] == "changed":
+            payload = json.loads(PAYLOAD)
+            payload["data"]["Catalog"]["searchStore"]["elements"][0]["title"] = "Game {}".format(stats["served"])
+            body, headers = json.dumps(payload).encode("utf-8"), {}
+        else:
+            body, headers = PAYLOAD, {}
+        stats["served"] += 1
+        stats["bytes"] += len(body)
+        return web.Response(body=body, headers=headers, content_type="application/json")
+
+    app = web.Application()
+    app.router.add_get("/freeGamesPromotions", promotions)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, stats, "http://127.0.0.1:{}/freeGamesPromotions".format(port)
+
+
+def report(name: str, timings: List[float], downloaded: int, results: List[str]) -> dict:
+    return {"mode": name, "p50_ms": percentile(timings, 0.5) * 1000, "p99_ms": percentile(timings, 0.99) * 1000,
+            "kb_per_call": downloaded / len(timings) / 1024, "changes": results.count("changed")}
+
+
+async def run(args) -> List[dict]:
+    runner, stats, url = await start_server(args.latency)
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            for mode in ("not_modified", "unchanged", "changed"):
+                stats["mode"], stats["bytes"] = mode, 0
+                poller = PromotionsPoller(Metrics(), lambda: session, url)
+                # The first poll of every mode is a change, it's the steady state being measured
+                await poller.poll()
+                stats["bytes"] = 0
+                timings, outcomes = [], []
+                for _ in range(args.polls):
+                    started = time.perf_counter()
+                    outcomes.append(await poller.poll())
+                    timings.append(time.perf_counter() - started)
+                results.append(report("poll_" + mode, timings, stats["bytes"], outcomes))
+
+            stats["mode"], stats["bytes"] = "unchanged", 0
+            timings = []
+            for _ in range(args.polls):
+                started = time.perf_counter()
+                async with session.get(url, params=EGS_PARAMS) as response:
+                    build_embed(*parse_game_list(await response.json()))
+                timings.append(time.perf_counter() - started)
+            results.append(report("per_command", timings, stats["bytes"], []))
+
+            timings = []
+            for _ in range(args.polls):
+                started = time.perf_counter()
+                assert poller.embed is not None
+                timings.append(time.perf_counter() - started)
+            results.append(report("cached", timings, 0, []))
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Epic promotions poll cost and !egs latency")
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the stand-in endpoint takes to answer")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    columns = ["p50_ms", "p99_ms", "kb_per_call", "changes"]
+    print("{:<18} ".format("mode") + " ".join("{:>12}".format(column) for column in columns))
+    for result in results:
+        print("{:<18} ".format(result["mode"]) + " ".join("{:>12.3f}".format(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compares answering !f1 from the API on every call with answering it from the cached season calendar.
+
+Usage:
+    python -m benchmarks.f1_calendar --commands 200 --latency 0.15
+
+Both run against benchmarks/f1_stub.py, which answers after --latency seconds like a distant API would. "per_call"
+is the old path: fetch next.json and build the embed for every command. "cached" fetches the calendar and standings
+once, then answers !f1, !f1 schedule's lookup and !f1 standings from memory. "warm_restart" loads the calendar from
+the on-disk cache the way the cog does at startup, and times the first answer.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+import aiohttp
+import discord
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.f1_stub import DEFAULT_NOW, start_stub
+from benchmarks.loadtest import percentile
+from modules.f1 import fetch_calendar, load_calendar, next_race_embed, save_calendar
+
+
+async def old_f1(session: aiohttp.ClientSession, base_url: str) -> discord.Embed:
+    """What !f1 did before the calendar: a request and a fresh embed every time"""
+    async with session.get(base_url + "/current/next.json") as response:
+        root = (await response.json())["MRData"]
+    race = root["RaceTable"]["Races"][0]
+    embed = discord.Embed(title="[#{}] {} **{}**".format(race["round"], race["season"], race["raceName"]))
+    embed.add_field(name="Circuit", value=race["Circuit"]["circuitName"], inline=False)
+    embed.add_field(name="Location", value="{}, {}".format(race["Circuit"]["Location"]["locality"],
+                                                           race["Circuit"]["Location"]["country"]), inline=False)
+    embed.add_field(name="Time", value="{} {}".format(race["date"], race["time"]), inline=False)
+    return embed
+
+
+def report(name: str, timings: List[float], setup: float, requests: int) -> dict:
+    return {"mode": name, "setup_ms": setup * 1000, "p50_us": percentile(timings, 0.5) * 1e6,
+            "p99_us": percentile(timings, 0.99) * 1e6, "requests": requests}
+
+
+async def run(args) -> List[dict]:
+    runner, base_url = await start_stub(args.latency)
+    stats = runner.app["stats"]
+    now = DEFAULT_NOW.timestamp()
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            timings = []
+            for _ in range(args.commands):
+                started = time.perf_counter()
+                await old_f1(session, base_url)
+                timings.append(time.perf_counter() - started)
+            results.append(report("per_call", timings, 0.0, stats["requests"]))
+
+            stats["requests"] = 0
+            started = time.perf_counter()
+            calendar = await fetch_calendar(session, base_url)
+            setup = time.perf_counter() - started
+            embeds, timings = {}, []
+            for _ in range(args.commands):
+                started = time.perf_counter()
+                next_race_embed(calendar, embeds, now)
+                timings.append(time.perf_counter() - started)
+            results.append(report("cached", timings, setup, stats["requests"]))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "f1_cache.json")
+            save_calendar(calendar, path)
+            stats["requests"] = 0
+            started = time.perf_counter()
+            warm = load_calendar(path)
+            embed = next_race_embed(warm, {}, now)
+            elapsed = time.perf_counter() - started
+            assert embed is not None and warm.races == calendar.races
+            results.append(report("warm_restart", [elapsed], elapsed, stats["requests"]))
+            results[-1]["cache_bytes"] = os.path.getsize(path)
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="F1 command path with and without the calendar cache")
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.15, help="seconds the stub API takes to answer")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    columns = ["setup_ms", "p50_us", "p99_us", "requests"]
+    print("{:<14} ".format("mode") + " ".join("{:>12}".format(column) for column in columns))
+    for result in results:
+        print("{:<14} ".format(result["mode"]) + " ".join("{:>12.1f}".format(result[column]) for column in columns))
+    print("on-disk cache: {} bytes".format(results[-1]["cache_bytes"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""A local stand-in for the Ergast F1 API, serving the recorded 2024 season from benchmarks/fixtures.
+
+Usage:
+    python -m benchmarks.f1_stub --port 8765 --latency 0.2
+    F1_API_URL=http://127.0.0.1:8765/api/f1 python brobot.py
+
+Serves current.json, current/next.json, current/driverStandings.json and current/constructorStandings.json, each
+after --latency seconds. next.json is the first race after --now, since the fixture season is in the past.
+"""
+import argparse
+import asyncio
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Tuple
+
+from aiohttp import web
+
+FIXTURES = Path(__file__).parent / "fixtures"
+# Partway through the fixture season
+DEFAULT_NOW = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+def next_race(schedule: dict, now: datetime) -> dict:
+    table = schedule["MRData"]["RaceTable"]
+    races = [race for race in table["Races"] if race["date"] >= now.strftime("%Y-%m-%d")][:1]
+    result = json.loads(json.dumps(schedule))
+    result["MRData"]["total"] = str(len(races))
+    result["MRData"]["RaceTable"] = {"season": table["season"], "round": races[0]["round"] if races else "",
+                                     "Races": races}
+    return result
+
+
+def build_app(latency: float = 0.0, now: datetime = DEFAULT_NOW) -> web.Application:
+    schedule = json.loads((FIXTURES / "f1_current.json").read_text(encoding="utf-8"))
+    documents = {
+        "current.json": schedule,
+        "current/next.json": next_race(schedule, now),
+        "current/driverStandings.json": json.loads((FIXTURES / "f1_driver_standings.json").read_text("utf-8")),
+        "current/constructorStandings.json": json.loads(
+            (FIXTURES / "f1_constructor_standings.json").read_text("utf-8")),
+    }
+    app = web.Application()
+    app["stats"] = {"requests": 0}
+
+    async def serve(request: web.Request) -> web.Response:
+        document = documents.get(request.match_info["path"])
+        if document is None:
+            raise web.HTTPNotFound()
+        app["stats"]["requests"] += 1
+        await asyncio.sleep(latency)
+        return web.json_response(document)
+
+    app.router.add_get("/api/f1/{path:.+}", serve)
+    return app
+
+
+async def start_stub(latency: float = 0.0, port: int = 0, now: datetime = DEFAULT_NOW) -> Tuple[web.AppRunner, str]:
+    """Starts the stub and returns its runner and the base URL to use as F1_API_URL"""
+    runner = web.AppRunner(build_app(latency, now), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, "http://127.0.0.1:{}/api/f1".format(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ergast F1 API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before every response")
+    args = parser.parse_args()
+    web.run_app(build_app(args.latency), host="127.0.0.1", port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
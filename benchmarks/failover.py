@@ -0,0 +1,126 @@
+"""Measures how long a standby takes over from a killed primary, and what happens to interactions in between.
+
+Usage:
+    python -m benchmarks.failover --lease 5 --rate 50 --kill-after 3
+    python -m benchmarks.failover --graceful
+    python -m benchmarks.failover --redis-outage 6
+
+A primary and a standby Brobot run in this process against one in-memory Redis. The fake gateway delivers every slots
+interaction to both, the way Discord does for two sessions on the same shard. By default the primary is killed: its
+lease renewals stop but the lease isn't released, like a SIGKILL or a crash. With --graceful it shuts down normally
+and releases the lease on the way out. With --redis-outage both stay up and Redis stops answering for that many
+seconds instead: the primary should keep handling everything (slots say they're paused) and keep the lead once Redis
+is back, with the standby never answering alongside it.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def wait_for(predicate, timeout: float, step: float = 0.01) -> Optional[float]:
+    """Polls predicate and returns when it became true, or None on timeout"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if predicate():
+            return time.perf_counter()
+        await asyncio.sleep(step)
+    return None
+
+
+async def run(args) -> dict:
+    from benchmarks.fakes import FlakyRedis, MemoryRedis
+    from benchmarks.loadtest import Harness
+
+    store = FlakyRedis(MemoryRedis())
+    primary = Harness([1], "memory", store=store, role="primary")
+    standby = Harness([1], "memory", store=store, role="standby")
+    await primary.start()
+    await standby.start()
+    if await wait_for(lambda: primary.bot.active, args.lease * 2) is None:
+        raise RuntimeError("The primary never became active")
+
+    rng = random.Random(1)
+    alive = [primary, standby]
+    outcomes: List[tuple] = []  # (sent at, handled by primary, handled by standby)
+    killed_at = took_over_at = None
+    started = time.perf_counter()
+    duration = args.kill_after + args.redis_outage + args.lease * 2 + 2
+    index = 0
+    while time.perf_counter() - started < duration:
+        now = time.perf_counter()
+        if args.redis_outage:
+            store.down = args.kill_after <= now - started < args.kill_after + args.redis_outage
+        elif killed_at is None and now - started >= args.kill_after:
+            killed_at = now
+            alive.remove(primary)
+            if args.graceful:
+                await primary.bot.stop_singletons()
+            else:
+                # Stop renewing without releasing, the lease has to run out
+                for singleton in primary.bot._singletons.values():
+                    singleton._task.cancel()
+        if killed_at is not None and took_over_at is None and standby.bot.active:
+            took_over_at = now
+
+        event = {"type": "interaction", "guild": 1, "channel": "main", "author": 10_000 + rng.randrange(50),
+                 "custom_id": "slots:spin:normal"}
+        interactions = await asyncio.gather(*(harness._interaction(event) for harness in alive))
+        handled = {harness: interaction.response.is_done() for harness, interaction in zip(alive, interactions)}
+        outcomes.append((now, handled.get(primary, False), handled.get(standby, False)))
+        index += 1
+        await asyncio.sleep(max(0.0, started + index / args.rate - time.perf_counter()))
+
+    await standby.stop()
+    await primary.stop()
+
+    if args.redis_outage:
+        result = {"mode": "redis_outage", "lease_seconds": args.lease, "outage_s": args.redis_outage,
+                  "primary_active_at_end": primary.bot.active, "standby_active_at_end": standby.bot.active}
+        gap = [outcome for outcome in outcomes
+               if started + args.kill_after <= outcome[0] < started + args.kill_after + args.redis_outage]
+    else:
+        result = {"mode": "graceful" if args.graceful else "kill", "lease_seconds": args.lease,
+                  "takeover_s": round(took_over_at - killed_at, 3) if took_over_at else None}
+        gap = [outcome for outcome in outcomes if killed_at <= outcome[0] < (took_over_at or float("inf"))]
+    result.update({
+        "interactions": len(outcomes),
+        "handled_by_primary": sum(1 for _, by_primary, _ in outcomes if by_primary),
+        "handled_by_standby": sum(1 for _, _, by_standby in outcomes if by_standby),
+        "handled_twice": sum(1 for _, by_primary, by_standby in outcomes if by_primary and by_standby),
+        "missed": sum(1 for _, by_primary, by_standby in outcomes if not (by_primary or by_standby)),
+        "missed_during_takeover": sum(1 for _, by_primary, by_standby in gap if not (by_primary or by_standby)),
+    })
+    # A standby answering alongside the leader would write every spin twice
+    assert result["handled_twice"] == 0, "{} interactions were handled twice".format(result["handled_twice"])
+    if args.redis_outage:
+        # The primary answers through the outage, so nothing goes unanswered
+        assert result["missed"] == 0, "{} interactions went unanswered".format(result["missed"])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Primary/standby failover measurement")
+    parser.add_argument("--lease", type=float, default=5.0, help="leader lease TTL in seconds")
+    parser.add_argument("--rate", type=float, default=50, help="interactions per second")
+    parser.add_argument("--kill-after", type=float, default=3.0, help="seconds before the primary goes away")
+    parser.add_argument("--graceful", action="store_true", help="shut the primary down cleanly instead")
+    parser.add_argument("--redis-outage", type=float, default=0,
+                        help="take Redis away for this many seconds instead of the primary")
+    args = parser.parse_args()
+
+    # The bot reads these at import time
+    os.environ["LEADER_LEASE_SECONDS"] = str(args.lease)
+    os.environ.setdefault("METRICS_PORT", "0")
+    result = asyncio.run(run(args))
+    for name, value in result.items():
+        print("{:<24} {}".format(name, value))
+
+
+if __name__ == "__main__":
+    main()
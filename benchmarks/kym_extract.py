@@ -0,0 +1,161 @@
+"""Compares the old BeautifulSoup KYM lookup with the streaming extractors, on recorded pages.
+
+Usage:
+    python -m benchmarks.kym_extract --lookups 20 --latency 0.1 --kbps 2000
+
+benchmarks/fixtures/kym_search.html and kym_entry.html are a search results page and an entry page. First both ways
+parse them from memory, which shows the parse time on its own. Then a local server plays them back, answering after
+--latency seconds and sending at --kbps kilobytes a second, and both ways run the whole lookup:
+    bs4         the old code: download both pages whole and parse each with BeautifulSoup
+    streaming   kym(): stop reading the search page at the first result and the entry page at </head>
+    cached      !kym's per-query cache in front of kym(), so only the first lookup goes out
+Bytes are what the server actually sent, averaged over the lookups.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+
+import aiohttp
+import bs4
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.loadtest import percentile
+from utils.metrics import Metrics
+from utils.parsers import KYM_PROPERTIES, FirstResultLink, HeadMeta, kym_entry_from_meta
+
+FIXTURES = Path(__file__).parent / "fixtures"
+SEARCH = (FIXTURES / "kym_search.html").read_bytes()
+ENTRY = (FIXTURES / "kym_entry.html").read_bytes()
+# How much the server writes at a time
+WRITE_BYTES = 4096
+
+
+def bs4_search_link(page: bytes) -> Optional[str]:
+    """The parser kym() used before the streaming one"""
+    try:
+        return bs4.BeautifulSoup(page, "html.parser").find_all("tbody")[0].tr.td.a["href"]
+    except (IndexError, AttributeError, KeyError, TypeError):
+        return None
+
+
+def bs4_entry(page: bytes) -> Optional[Tuple[str, str, str]]:
+    soup = bs4.BeautifulSoup(page, "html.parser")
+    tags = [soup.find("meta", attrs={"property": name}) for name in KYM_PROPERTIES]
+    if not all(tags):
+        return None
+    title, about, uri = (tag.get("content", "") for tag in tags)
+    return title, about, uri
+
+
+def streamed(extractor, page: bytes, chunk: int = 8192):
+    for start in range(0, len(page), chunk):
+        if extractor.feed_bytes(page[start:start + chunk]):
+            break
+    extractor.finish()
+    return extractor
+
+
+async def start_server(latency: float, kbps: float):
+    sent = {"bytes": 0}
+
+    async def play(request: web.Request, page: bytes) -> web.StreamResponse:
+        await asyncio.sleep(latency)
+        response = web.StreamResponse(headers={"Content-Type": "text/html; charset=utf-8"})
+        response.content_length = len(page)
+        await response.prepare(request)
+        try:
+            for start in range(0, len(page), WRITE_BYTES):
+                await response.write(page[start:start + WRITE_BYTES])
+                sent["bytes"] += len(page[start:start + WRITE_BYTES])
+                await asyncio.sleep(WRITE_BYTES / (kbps * 1024))
+        except (ConnectionResetError, ConnectionError):
+            # The client stopped reading, which is the point
+            pass
+        return response
+
+    app = web.Application()
+    app.router.add_get("/search", lambda request: play(request, SEARCH))
+    app.router.add_get("/memes/{name}", lambda request: play(request, ENTRY))
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, sent, "http://127.0.0.1:{}".format(site._server.sockets[0].getsockname()[1])
+
+
+def parse_only(repeat: int) -> List[dict]:
+    results = []
+    for mode, search, entry in (
+            ("bs4", lambda: bs4_search_link(SEARCH), lambda: bs4_entry(ENTRY)),
+            ("streaming", lambda: streamed(FirstResultLink(), SEARCH).href,
+             lambda: kym_entry_from_meta(streamed(HeadMeta(KYM_PROPERTIES), ENTRY).found))):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            assert search() == "/memes/distracted-boyfriend" and entry() is not None
+            timings.append(time.perf_counter() - started)
+        read = len(SEARCH) + len(ENTRY) if mode == "bs4" else (
+                streamed(FirstResultLink(), SEARCH).bytes_read + streamed(HeadMeta(KYM_PROPERTIES), ENTRY).bytes_read)
+        results.append({"mode": "parse_" + mode, "p50_ms": percentile(timings, 0.5) * 1000,
+                        "p99_ms": percentile(timings, 0.99) * 1000, "kb": read / 1024})
+    return results
+
+
+async def end_to_end(args) -> List[dict]:
+    runner, sent, base_url = await start_server(args.latency, args.kbps)
+    os.environ["KYM_URL"] = base_url
+    from modules.kym import HEADERS, KYM, kym
+
+    async def old_kym(session: aiohttp.ClientSession, query: str):
+        async with session.get(base_url + "/search", params={"q": query}, headers=HEADERS) as response:
+            link = bs4_search_link(await response.read())
+        async with session.get(base_url + link, headers=HEADERS) as response:
+            return bs4_entry(await response.read())
+
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            cog = KYM(SimpleNamespace(metrics=Metrics(), session=session))
+
+            async def cached_kym(session: aiohttp.ClientSession, query: str):
+                return await cog.results.get_or_load(query, lambda: kym(session, query))
+
+            for mode, lookup in (("bs4", old_kym), ("streaming", kym), ("cached", cached_kym)):
+                sent["bytes"] = 0
+                timings = []
+                for _ in range(args.lookups):
+                    started = time.perf_counter()
+                    assert (await lookup(session, "boyfriend"))[0] == "Distracted Boyfriend"
+                    timings.append(time.perf_counter() - started)
+                # Let the server notice the dropped connections before counting
+                await asyncio.sleep(0.2)
+                results.append({"mode": "lookup_" + mode, "p50_ms": percentile(timings, 0.5) * 1000,
+                                "p99_ms": percentile(timings, 0.99) * 1000, "kb": sent["bytes"] / args.lookups / 1024})
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KYM lookups with BeautifulSoup against streaming extraction")
+    parser.add_argument("--lookups", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds before the stand-in server answers")
+    parser.add_argument("--kbps", type=float, default=2000, help="kilobytes a second the stand-in server sends")
+    args = parser.parse_args()
+
+    results = parse_only(args.lookups) + asyncio.run(end_to_end(args))
+    columns = ["p50_ms", "p99_ms", "kb"]
+    print("{:<18} ".format("mode") + " ".join("{:>10}".format(column) for column in columns))
+    for result in results:
+        print("{:<18} ".format(result["mode"]) + " ".join("{:>10.2f}".format(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
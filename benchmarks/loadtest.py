@@ -0,0 +1,300 @@
+"""Replays message, reaction, voice and interaction streams through the real cogs without a Discord connection.
+
+Usage:
+    python -m benchmarks.loadtest --events 5000 --rate 500
+    python -m benchmarks.loadtest --record stream.jsonl --events 2000
+    python -m benchmarks.loadtest --replay stream.jsonl --rate 0 --json report.json
+
+Each event is a JSON object with a "type" of message, reaction, voice or interaction. For example:
+    {"type": "message", "guild": 1, "channel": "main", "author": 10003, "content": "!roll", "mentions": [10004]}
+    {"type": "interaction", "guild": 1, "channel": "main", "author": 10003, "custom_id": "slots:spin:normal"}
+
+The bot's HTTP session only reaches local addresses, so the background jobs that poll outside APIs fail straight away
+instead of depending on (or hitting) the real services.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# The bot reads its configuration at import time
+os.environ.setdefault("METRICS_PORT", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import (AsyncMemoryRedis, FakeContext, FakeGuild, FakeInteraction, FakeMessage, FakeUser,
+                              MemoryRedis, MemoryRedisService, Recorder, offline_session)
+from brobot import Brobot, brobot_modules
+
+CHATTER = ["lol", "anyone on tonight?", "that was a great game", "brb", "did you see the patch notes",
+           "I can't believe that worked", "gg", "what time is it there?", "nice"]
+TRIGGERS = ["good bot", "bad bot", "everybody", "EVERYBODYYY", "stop please"]
+COMMANDS = ["!ping", "!roll", "!roll 10 20", "!choose pizza | tacos | sushi", "!8 will it work?", "!mock hello there",
+            "!lenny", "!lines", "!mentions", "!lines me"]
+SPINS = ["slots:spin:normal", "slots:spin:mega"]
+
+
+def synthetic_events(count: int, guild_ids: Sequence[int], seed: int = 1) -> List[dict]:
+    rng = random.Random(seed)
+    events = []
+    for _ in range(count):
+        guild = rng.choice(guild_ids)
+        author = guild * 10_000 + rng.randrange(50)
+        roll = rng.random()
+        if roll < 0.55:
+            mentions = [guild * 10_000 + rng.randrange(50)] if rng.random() < 0.1 else []
+            event = {"type": "message", "content": rng.choice(CHATTER), "mentions": mentions}
+        elif roll < 0.65:
+            event = {"type": "message", "content": rng.choice(TRIGGERS)}
+        elif roll < 0.85:
+            event = {"type": "message", "content": rng.choice(COMMANDS)}
+        elif roll < 0.93:
+            event = {"type": "interaction", "custom_id": rng.choice(SPINS)}
+        elif roll < 0.97:
+            event = {"type": "reaction", "emoji": "✅"}
+        else:
+            event = {"type": "voice", "voice_channel": rng.choice(["General", None])}
+        event.update({"guild": guild, "channel": rng.choice(["main", "games"]), "author": author})
+        events.append(event)
+    return events
+
+
+def read_events(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Harness:
+    def __init__(self, guild_ids: Iterable[int], redis_mode: str, store: Optional[AsyncMemoryRedis] = None,
+                 role: Optional[str] = None):
+        self.recorder = Recorder()
+        self.redis_mode = redis_mode
+        self.bot = Brobot(role)
+        self.me = FakeUser(1, "Brobot", bot=True)
+        self.guilds: Dict[int, FakeGuild] = {}
+        for guild_id in guild_ids:
+            self.guilds[guild_id] = FakeGuild(guild_id, self.recorder, me=self.me)
+        self.store = store or AsyncMemoryRedis(MemoryRedis())
+        self.pending = set()
+        self.loop_lag: List[float] = []
+        self.event_errors = 0
+        self.interaction_duration = self.bot.metrics.histogram(
+            "brobot_interaction_duration_seconds", "Time spent handling a component interaction", ["custom_id"])
+        self.guild_duration = self.bot.metrics.histogram(
+            "brobot_guild_duration_seconds", "Time spent on commands and interactions, per guild", ["guild"])
+
+    async def start(self):
+        bot = self.bot
+        await bot._async_setup_hook()
+        bot._connection.user = self.me
+        # Replies from commands go through the fake channels
+        bot.get_context = lambda origin, /, *, cls=FakeContext: Brobot.get_context(bot, origin, cls=cls)
+
+        # Keep a handle on every event task so the run can wait for them to finish
+        schedule = bot._schedule_event
+
+        def tracked_schedule(*args, **kwargs):
+            task = schedule(*args, **kwargs)
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+            return task
+
+        bot._schedule_event = tracked_schedule
+        bot.on_error = self._on_error
+
+        after_command = bot._after_invoke
+
+        async def timed_after_command(ctx):
+            await after_command(ctx)
+            self.guild_duration.observe(str(ctx.guild.id), value=time.perf_counter() - ctx.started_at)
+
+        bot._after_invoke = timed_after_command
+        bot.session = offline_session()
+        if self.redis_mode == "memory":
+            # The bot only builds its own Redis service when it doesn't have one yet
+            bot.redis = MemoryRedisService(self.store)
+        await bot.setup_hook()
+        # Lets anything waiting for the gateway, like the singleton duties, get going
+        bot._ready.set()
+
+    async def stop(self):
+        await self.bot.stop_singletons()
+        await self.bot.scheduler.stop()
+        await self.bot.timers.stop()
+        await self.bot.parsers.close()
+        await self.bot.session.close()
+        await self.bot.redis.close()
+
+    def _message(self, event: dict) -> FakeMessage:
+        guild = self.guilds[event["guild"]]
+        channel = guild.channel_named(event.get("channel", "main"))
+        author = guild.get_member(event["author"])
+        mentions = [guild.get_member(user_id) for user_id in event.get("mentions", ())]
+        content = event["content"]
+        if mentions:
+            content += " " + " ".join(member.mention for member in mentions)
+        return FakeMessage(content, author, channel, mentions=mentions)
+
+    async def handle(self, event: dict):
+        kind = event["type"]
+        if kind == "message":
+            self.bot.dispatch("message", self._message(event))
+        elif kind == "interaction":
+            task = asyncio.create_task(self._interaction(event))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+        elif kind == "reaction":
+            payload = SimpleNamespace(guild_id=event["guild"], user_id=event["author"], emoji=event.get("emoji"),
+                                      message_id=0, channel_id=0, event_type="REACTION_ADD")
+            self.bot.dispatch("raw_reaction_add", payload)
+        elif kind == "voice":
+            member = self.guilds[event["guild"]].get_member(event["author"])
+            after = SimpleNamespace(channel=event.get("voice_channel") and SimpleNamespace(name=event["voice_channel"]))
+            self.bot.dispatch("voice_state_update", member, SimpleNamespace(channel=None), after)
+
+    async def _on_error(self, event_method: str, *args, **kwargs):
+        self.event_errors += 1
+        if self.event_errors == 1:
+            logging.exception("First error while handling %s", event_method)
+
+    async def _interaction(self, event: dict) -> FakeInteraction:
+        guild = self.guilds[event["guild"]]
+        custom_id = event["custom_id"]
+        interaction = FakeInteraction(self.bot, guild.get_member(event["author"]),
+                                      guild.channel_named(event.get("channel", "main")), custom_id)
+        found = next(((view, item) for view in self.bot.persistent_views for item in view.children
+                      if getattr(item, "custom_id", None) == custom_id), None)
+        if found is None:
+            return interaction
+        view, item = found
+        start = time.perf_counter()
+        try:
+            # Like discord.py's view dispatch, the callback only runs if the view's check lets it through
+            if await view.interaction_check(interaction):
+                await item.callback(interaction)
+        except Exception:
+            await self._on_error("interaction")
+        finally:
+            elapsed = time.perf_counter() - start
+            self.interaction_duration.observe(custom_id, value=elapsed)
+            self.guild_duration.observe(str(guild.id), value=elapsed)
+        return interaction
+
+    async def _watch_loop(self, interval: float = 0.01):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(time.perf_counter() - start - interval)
+
+    async def run(self, events: Iterable[dict], rate: float) -> dict:
+        events = list(events)
+        watcher = asyncio.create_task(self._watch_loop())
+        started = time.perf_counter()
+        for index, event in enumerate(events):
+            if rate:
+                delay = started + index / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)
+            await self.handle(event)
+        while self.pending:
+            await asyncio.gather(*list(self.pending), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        watcher.cancel()
+        return self.report(len(events), elapsed)
+
+    def report(self, event_count: int, elapsed: float) -> dict:
+        handlers = {}
+        metrics = self.bot.metrics
+        for histogram, prefix in ((metrics.command_duration, "command"), (metrics.listener_duration, "listener"),
+                                  (self.interaction_duration, "interaction")):
+            for labels in histogram.values:
+                handlers["{}:{}".format(prefix, "/".join(labels))] = {
+                    "count": histogram.count(*labels),
+                    "p50_ms": round((histogram.quantile(0.5, *labels) or 0) * 1000, 3),
+                    "p99_ms": round((histogram.quantile(0.99, *labels) or 0) * 1000, 3),
+                }
+        # Per-guild percentiles, summarised across guilds so a run with 500 guilds compares directly with one guild
+        guild_p50 = [self.guild_duration.quantile(0.5, *labels) or 0 for labels in self.guild_duration.values]
+        guild_p99 = [self.guild_duration.quantile(0.99, *labels) or 0 for labels in self.guild_duration.values]
+        errors = sum(metrics.command_errors.values.values()) + self.event_errors
+        return {
+            "events": event_count,
+            "seconds": round(elapsed, 3),
+            "throughput_per_s": round(event_count / elapsed, 1) if elapsed else 0.0,
+            "outputs": len(self.recorder.outputs),
+            "errors": errors,
+            "loop_lag_ms": {
+                "p50": round(percentile(self.loop_lag, 0.5) * 1000, 3),
+                "p99": round(percentile(self.loop_lag, 0.99) * 1000, 3),
+                "max": round(max(self.loop_lag, default=0.0) * 1000, 3),
+                "mean": round(statistics.fmean(self.loop_lag) * 1000, 3) if self.loop_lag else 0.0,
+            },
+            "handlers": handlers,
+            "guilds": {
+                "count": len(guild_p50),
+                "median_p50_ms": round(statistics.median(guild_p50) * 1000, 3) if guild_p50 else 0.0,
+                "median_p99_ms": round(statistics.median(guild_p99) * 1000, 3) if guild_p99 else 0.0,
+                "worst_p99_ms": round(max(guild_p99, default=0.0) * 1000, 3),
+            },
+        }
+
+
+def print_report(report: dict):
+    print("\n{events} events in {seconds}s -> {throughput_per_s}/s, {outputs} outputs, {errors} errors".format(**report))
+    print("loop lag ms: p50={p50} p99={p99} max={max}".format(**report["loop_lag_ms"]))
+    print("per-guild ms across {count} guilds: median p50={median_p50_ms} median p99={median_p99_ms} "
+          "worst p99={worst_p99_ms}".format(**report["guilds"]))
+    print("\n{:<60} {:>7} {:>9} {:>9}".format("handler", "count", "p50 ms", "p99 ms"))
+    for name, stats in sorted(report["handlers"].items()):
+        print("{:<60} {:>7} {:>9} {:>9}".format(name[:60], stats["count"], stats["p50_ms"], stats["p99_ms"]))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Offline load test for Brobot")
+    parser.add_argument("--replay", help="JSONL event stream to replay instead of a synthetic one")
+    parser.add_argument("--record", help="write the synthetic stream to this JSONL file and exit")
+    parser.add_argument("--events", type=int, default=2000, help="synthetic events to generate")
+    parser.add_argument("--guilds", type=int, default=1, help="guilds to spread the synthetic stream across")
+    parser.add_argument("--rate", type=float, default=500, help="events per second, 0 for as fast as possible")
+    parser.add_argument("--redis", choices=["memory", "real"], default="memory",
+                        help="in-memory stand-in or the Redis configured through the usual env variables")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    events = read_events(args.replay) if args.replay else synthetic_events(args.events, range(1, args.guilds + 1))
+    if args.record:
+        with open(args.record, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(event) + "\n" for event in events)
+        return
+
+    harness = Harness(sorted({event["guild"] for event in events}) or [1], args.redis)
+    await harness.start()
+    try:
+        report = await harness.run(events, args.rate)
+    finally:
+        await harness.stop()
+    report["modules"] = brobot_modules
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""Measures what logging a spin event costs the caller with each logging setup.
+
+Usage:
+    python -m benchmarks.logging_overhead --events 5000 --rate 2000 --sink-delay-us 50
+
+  * direct: the old setup, a stream handler formatting and writing on the caller's thread
+  * direct_json: the same, writing JSON lines to a rotating file
+  * queue: utils.logs.setup_logging writing both, from its listener thread
+  * queue_sampled: the queue, with LOG_SAMPLE_RATES=spin=0.1
+
+Events are logged --rate per second (0 for as fast as possible) into files in a temporary directory. --sink-delay-us
+adds a pause to every write, standing in for a slow disk or a terminal that's behind. The report shows caller-side
+time per event and, for the queued setups, how long the listener took to catch up afterwards and how many records the
+full queue dropped.
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.loadtest import percentile
+from utils import logs
+
+MODES = ("direct", "direct_json", "queue", "queue_sampled")
+
+
+class SlowFile(logging.StreamHandler):
+    """A file handler whose every write takes at least delay seconds"""
+
+    def __init__(self, path: str, delay: float):
+        super().__init__(open(path, "a", encoding="utf-8"))
+        self.delay = delay
+
+    def emit(self, record: logging.LogRecord):
+        super().emit(record)
+        if self.delay:
+            # Busy-wait, sleep() can't do tens of microseconds
+            until = time.perf_counter() + self.delay
+            while time.perf_counter() < until:
+                pass
+
+    def close(self):
+        self.stream.close()
+        super().close()
+
+
+def handlers(mode: str, directory: str, delay: float) -> List[logging.Handler]:
+    text = SlowFile(os.path.join(directory, mode + ".log"), delay)
+    text.setFormatter(logs.TextFormatter())
+    if mode == "direct":
+        return [text]
+    rotating = logging.handlers.RotatingFileHandler(os.path.join(directory, mode + ".jsonl"),
+                                                    maxBytes=logs.LOG_MAX_BYTES, backupCount=1, encoding="utf-8")
+    rotating.setFormatter(logs.JsonFormatter())
+    return [rotating] if mode == "direct_json" else [text, rotating]
+
+
+def run_mode(mode: str, args, directory: str) -> dict:
+    root = logging.getLogger()
+    chosen = handlers(mode, directory, args.sink_delay_us / 1e6)
+    logs.SAMPLE_RATES.clear()
+    pipeline = None
+    if mode.startswith("queue"):
+        if mode == "queue_sampled":
+            logs.SAMPLE_RATES["spin"] = 0.1
+        pipeline = logs.setup_logging("INFO", handlers=chosen, queue_size=args.queue_size)
+    else:
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        for handler in chosen:
+            root.addHandler(handler)
+        root.setLevel(logging.INFO)
+
+    timings = []
+    interval = 1 / args.rate if args.rate else 0.0
+    started = time.perf_counter()
+    for index in range(args.events):
+        if interval:
+            ahead = started + index * interval - time.perf_counter()
+            if ahead > 0:
+                time.sleep(ahead)
+        before = time.perf_counter()
+        logs.event("spin", guild=1234, user=5678 + index % 50, name="player", mega=index % 20 == 0,
+                   net=index % 700, multiplier=1.5, jackpot=0, spins=index, points=index * 3)
+        timings.append(time.perf_counter() - before)
+    caller = sum(timings)
+
+    drain_started = time.perf_counter()
+    dropped = 0
+    if pipeline is not None:
+        pipeline.stop()
+        dropped = pipeline.dropped
+    drain = time.perf_counter() - drain_started
+    for handler in chosen:
+        root.removeHandler(handler)
+        handler.close()
+    return {
+        "mode": mode,
+        "us_per_event": caller / args.events * 1e6,
+        "p50_us": percentile(timings, 0.5) * 1e6,
+        "p99_us": percentile(timings, 0.99) * 1e6,
+        "max_us": max(timings) * 1e6,
+        "drain_ms": drain * 1000,
+        "dropped": dropped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Logging overhead per event")
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=2000, help="events per second, 0 for as fast as possible")
+    parser.add_argument("--sink-delay-us", type=float, default=0.0, help="extra time every write takes")
+    parser.add_argument("--queue-size", type=int, default=logs.LOG_QUEUE_SIZE)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [run_mode(mode, args, directory) for mode in args.modes]
+    columns = ["us_per_event", "p50_us", "p99_us", "max_us", "drain_ms", "dropped"]
+    print("{:<14} ".format("mode") + " ".join("{:>12}".format(column) for column in columns))
+    for result in results:
+        print("{:<14} ".format(result["mode"]) + " ".join("{:>12.1f}".format(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Compares the default member cache with LEAN_MEMBER_CACHE on a large synthetic guild.
+
+Usage:
+    python -m benchmarks.member_cache --members 100000 --active 2000
+
+Both modes parse the same GUILD_CREATE payload through discord.py's real ConnectionState. The default mode then
+parses every member the way GUILD_MEMBERS_CHUNK delivers them, while lean mode only keeps the members sitting in
+voice plus the display names of the --active members that send messages. The time reported is CPU time spent
+parsing; the gateway round trips for chunking (one per 1000 members) come on top of it in production.
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+import discord
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.members import MemberResolver
+
+GUILD_ID = 1
+CHUNK_SIZE = 1000
+
+
+def member_payload(user_id: int) -> dict:
+    return {
+        "user": {"id": str(user_id), "username": "user{}".format(user_id), "discriminator": "0",
+                 "global_name": "User {}".format(user_id), "avatar": None},
+        "nick": None, "roles": [str(GUILD_ID + 1)], "joined_at": "2020-01-01T00:00:00+00:00", "deaf": False,
+        "mute": False, "flags": 0,
+    }
+
+
+def guild_payload(member_count: int, voice_count: int) -> dict:
+    # Like a large guild's GUILD_CREATE: only the members in voice are included up front
+    voice_ids = range(1_000_000, 1_000_000 + voice_count)
+    return {
+        "id": str(GUILD_ID), "name": "Large guild", "member_count": member_count, "large": True,
+        "owner_id": "1000000", "features": [], "emojis": [], "stickers": [],
+        "roles": [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False},
+                  {"id": str(GUILD_ID + 1), "name": "Member", "permissions": "0", "position": 1, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False}],
+        "channels": [{"id": "10", "type": 2, "name": "General", "position": 0, "permission_overwrites": [],
+                      "bitrate": 64000, "user_limit": 0}],
+        "members": [member_payload(user_id) for user_id in voice_ids],
+        "voice_states": [{"user_id": str(user_id), "channel_id": "10", "session_id": "x", "deaf": False,
+                          "mute": False, "self_deaf": False, "self_mute": False, "self_video": False,
+                          "suppress": False} for user_id in voice_ids],
+        "presences": [], "threads": [], "stage_instances": [], "guild_scheduled_events": [],
+    }
+
+
+def run_mode(lean: bool, member_count: int, voice_count: int, active: int) -> Dict[str, float]:
+    options = {}
+    if lean:
+        options = {"chunk_guilds_at_startup": False,
+                   "member_cache_flags": discord.MemberCacheFlags(voice=True, joined=False)}
+    intents = discord.Intents.default()
+    intents.members = True
+    client = discord.Client(intents=intents, **options)
+    state = client._connection
+    payload = guild_payload(member_count, voice_count)
+    chunks: List[List[dict]] = []
+    if not lean:
+        user_ids = range(1, member_count + 1)
+        chunks = [[member_payload(user_id) for user_id in user_ids[start:start + CHUNK_SIZE]]
+                  for start in range(0, member_count, CHUNK_SIZE)]
+    resolver = MemberResolver(max_size=max(active, 1))
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    guild = discord.Guild(data=payload, state=state)
+    state._add_guild(guild)
+    for chunk in chunks:
+        # What parse_guild_members_chunk does for a chunk request with cache=True
+        for data in chunk:
+            guild._add_member(discord.Member(guild=guild, data=data, state=state))
+    for user_id in range(1, active + 1):
+        resolver.remember(discord.Member(guild=guild, data=member_payload(user_id), state=state))
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"parse_s": elapsed, "retained_mb": current / 2 ** 20, "peak_mb": peak / 2 ** 20,
+            "cached_members": len(guild._members), "known_names": len(resolver)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Member cache cost in default and lean mode")
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--voice", type=int, default=25, help="members in voice when the bot connects")
+    parser.add_argument("--active", type=int, default=2000, help="distinct message authors seen after ready")
+    args = parser.parse_args()
+
+    print("{:<8} {:>10} {:>13} {:>10} {:>15} {:>12}".format("mode", "parse s", "retained MB", "peak MB",
+                                                            "cached members", "known names"))
+    for lean in (False, True):
+        result = run_mode(lean, args.members, args.voice, args.active)
+        print("{:<8} {:>10.3f} {:>13.1f} {:>10.1f} {:>15} {:>12}".format(
+            "lean" if lean else "default", result["parse_s"], result["retained_mb"], result["peak_mb"],
+            result["cached_members"], result["known_names"]))
+
+
+if __name__ == "__main__":
+    main()
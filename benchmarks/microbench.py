@@ -0,0 +1,178 @@
+"""Microbenchmarks for the pure functions on the message and command hot paths.
+
+Usage:
+    python -m benchmarks.microbench --output results.json
+    python -m benchmarks.microbench --compare results.json --threshold 10
+
+Scrapers are benchmarked against the recorded pages in benchmarks/fixtures. With --compare, the run exits non-zero
+when any benchmark's best time is more than --threshold percent slower than in the baseline file.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Tuple
+
+FIXTURES = Path(__file__).parent / "fixtures"
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+Benchmark = Tuple[str, Callable[[], object]]
+
+SAMPLE_MESSAGES = ["everybody", "EVERYBODYYYYY!!!", "good bot", "lol", "backstreet's back alright",
+                   "I think the new patch broke the spawn rates on the second map, anyone else seeing that?"]
+
+
+def text_benchmarks() -> Iterator[Benchmark]:
+    from utils.triggers import TriggerEngine, simplify_text
+
+    yield "simplify_text.short", lambda: simplify_text("Backstreet's Back Alright!!!")
+    yield "simplify_text.long", lambda: simplify_text(SAMPLE_MESSAGES[-1] * 4)
+
+    engine = TriggerEngine()
+    phrases = ["everybody", "rock your body", "am I original?", "am I the only one?", "am I sexual?",
+               "backstreet's back", "backstreet's back alright", "stop", "stop please", "please stop"]
+    patterns = [r"^good bot$", r"^bad bot$", r"^fuck.+brobot.*$"]
+    engine.add("bench", [("phrase", phrase, 0, None) for phrase in phrases] +
+               [("pattern", pattern, 2, None) for pattern in patterns])
+    yield "triggers.match", lambda: [engine.match(message) for message in SAMPLE_MESSAGES]
+
+
+def slots_benchmarks() -> Iterator[Benchmark]:
+    import os
+    os.chdir(ROOT)
+    from modules.spin import SlotsCog
+
+    # The scoring helpers never touch Redis, so skip the constructor
+    cog = SlotsCog.__new__(SlotsCog)
+    cfg = asyncio.run(cog._load_config())
+    random.seed(0)
+    grid = cog._spin_and_score(cfg, size=7)[0]
+
+    yield "slots.spin_and_score.5x5", lambda: cog._spin_and_score(cfg)
+    yield "slots.spin_and_score.7x7_mega", lambda: cog._spin_and_score(cfg, bonus_multiplier=3.69, size=7)
+    yield "slots.jackpot_trigger", lambda: cog._jackpot_trigger(grid, cfg)
+    yield "slots.render_grid", lambda: cog._render_grid(grid)
+
+
+def gdq_benchmarks() -> Iterator[Benchmark]:
+    from modules.gdq import Schedule, schedule_fields
+    from utils.parsers import gdq_schedule
+
+    page = (FIXTURES / "gdq_schedule.html").read_bytes()
+    now = datetime(2024, 1, 17, 12, 0, tzinfo=timezone.utc).timestamp()
+    rows = gdq_schedule(page)
+    schedule = Schedule.from_rows(rows, fetched_at=now)
+
+    yield "gdq.parse", lambda: gdq_schedule(page)
+    yield "gdq.index", lambda: Schedule.from_rows(rows, fetched_at=now)
+    yield "gdq.fields", lambda: schedule_fields(schedule, now)
+    yield "gdq.upcoming_10", lambda: schedule.upcoming(now, 10)
+    yield "gdq.search", lambda: schedule.search("mario")
+
+
+def egs_benchmarks() -> Iterator[Benchmark]:
+    from modules.egs import parse_game_list
+
+    payload = json.loads((FIXTURES / "egs_promotions.json").read_text(encoding="utf-8"))
+    yield "egs.parse_game_list", lambda: parse_game_list(payload)
+
+
+def poll_benchmarks() -> Iterator[Benchmark]:
+    from modules.poll import parse_poll_options
+
+    # Discord hands the description back with the leading newline stripped
+    numbered = "".join("\n {} Option number {}".format(emoji, index) for index, emoji in
+                       enumerate(['1⃣', '2⃣', '3⃣', '4⃣', '5⃣', '6⃣', '7⃣', '8⃣', '9⃣', '🔟'], start=1)).strip()
+    yes_no = "✅ yes\n ❌ no"
+    yield "poll.parse_options.numbered", lambda: parse_poll_options(numbered)
+    yield "poll.parse_options.yes_no", lambda: parse_poll_options(yes_no)
+
+
+SUITES = [text_benchmarks, slots_benchmarks, gdq_benchmarks, egs_benchmarks, poll_benchmarks]
+
+
+def measure(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    timer = timeit.Timer(func)
+    loops, _ = timer.autorange()
+    samples = [elapsed / loops for elapsed in timer.repeat(repeat=repeat, number=loops)]
+    return {"min_us": round(min(samples) * 1e6, 3), "median_us": round(statistics.median(samples) * 1e6, 3),
+            "loops": loops}
+
+
+def run(selected: str, repeat: int) -> dict:
+    results, skipped = {}, {}
+    for suite in SUITES:
+        try:
+            benchmarks = list(suite())
+        except Exception as error:
+            # e.g. a module that needs a newer Python than the one running the suite
+            skipped[suite.__name__] = "{}: {}".format(type(error).__name__, error)
+            continue
+        for name, func in benchmarks:
+            if selected and selected not in name:
+                continue
+            results[name] = measure(func, repeat)
+            print("{:<34} {:>12.3f} us  (median {:.3f} us)".format(name, results[name]["min_us"],
+                                                                   results[name]["median_us"]))
+    for suite, reason in skipped.items():
+        print("skipped {}: {}".format(suite, reason))
+    return {"meta": {"commit": _git_commit(), "python": platform.python_version(),
+                     "date": datetime.now(timezone.utc).isoformat()},
+            "results": results, "skipped": skipped}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> bool:
+    """Prints the change against the baseline and returns True when nothing regressed past the threshold"""
+    ok = True
+    print("\n{:<34} {:>12} {:>12} {:>9}".format("benchmark", "baseline us", "current us", "change"))
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if not previous:
+            continue
+        change = (result["min_us"] / previous["min_us"] - 1) * 100
+        flag = ""
+        if change > threshold:
+            flag, ok = "  REGRESSION", False
+        print("{:<34} {:>12.3f} {:>12.3f} {:>+8.1f}%{}".format(name, previous["min_us"], result["min_us"], change,
+                                                              flag))
+    return ok
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for Brobot's hot functions")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file from an earlier run")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    current = run(args.filter, args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(current, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
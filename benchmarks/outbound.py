@@ -0,0 +1,108 @@
+"""Compares awaiting bulk Discord calls one at a time against the outbound queue, on a simulated rate-limited route.
+
+Usage:
+    python -m benchmarks.outbound --calls 100 --bucket 10 --window 1 --rtt 0.25
+
+The fake route behaves like a Discord bucket behind discord.py's limiter: at most --bucket requests per --window
+seconds, each taking --rtt to answer. The report shows how long a bulk job of --calls takes sequentially and through
+the queue, and how long interactive calls made during the job wait, with and without priorities.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metrics import Metrics
+from utils.outbound import BULK, INTERACTIVE, OutboundQueue
+
+
+class FakeBucket:
+    """Lets through `size` requests per `window`, like the limiter in discord.py's HTTP client"""
+
+    def __init__(self, size: int, window: float, rtt: float):
+        self.size = size
+        self.window = window
+        self.rtt = rtt
+        self._sent: List[float] = []
+        self._lock = asyncio.Lock()
+
+    async def request(self):
+        async with self._lock:
+            now = time.perf_counter()
+            self._sent = [sent for sent in self._sent if now - sent < self.window]
+            if len(self._sent) >= self.size:
+                await asyncio.sleep(self._sent[0] + self.window - now)
+            self._sent.append(time.perf_counter())
+        await asyncio.sleep(self.rtt)
+
+
+async def sequential(args) -> float:
+    bucket = FakeBucket(args.bucket, args.window, args.rtt)
+    started = time.perf_counter()
+    for _ in range(args.calls):
+        await bucket.request()
+    return time.perf_counter() - started
+
+
+async def queued(args, interactive_priority: int) -> dict:
+    bucket = FakeBucket(args.bucket, args.window, args.rtt)
+    queue = OutboundQueue(Metrics())
+    route = ("member", 1)
+    started = time.perf_counter()
+    job = queue.batch("bulk", route, [bucket.request] * args.calls)
+
+    finished = asyncio.ensure_future(job.wait())
+    finished.add_done_callback(lambda _: elapsed.append(time.perf_counter() - started))
+    elapsed, waits = [], []
+    # Someone runs a command every so often while the job works through the route
+    while not finished.done():
+        await asyncio.sleep(args.interactive_every)
+        if finished.done():
+            break
+        submitted = time.perf_counter()
+        await queue.submit(route, bucket.request, priority=interactive_priority)
+        waits.append(time.perf_counter() - submitted)
+    await finished
+    waits.sort()
+    return {"elapsed": elapsed[0], "interactive_p50": waits[len(waits) // 2] if waits else 0.0,
+            "interactive_max": waits[-1] if waits else 0.0}
+
+
+async def run(args) -> dict:
+    sequential_s = await sequential(args)
+    prioritised = await queued(args, INTERACTIVE)
+    fifo = await queued(args, BULK)
+    return {
+        "calls": args.calls,
+        "route_limit": OutboundQueue.limit(("member", 1)),
+        "sequential_s": round(sequential_s, 3),
+        "queued_s": round(prioritised["elapsed"], 3),
+        "speedup": round(sequential_s / prioritised["elapsed"], 2),
+        "interactive_p50_ms": round(prioritised["interactive_p50"] * 1000, 1),
+        "interactive_max_ms": round(prioritised["interactive_max"] * 1000, 1),
+        "fifo_interactive_p50_ms": round(fifo["interactive_p50"] * 1000, 1),
+        "fifo_interactive_max_ms": round(fifo["interactive_max"] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outbound queue against a simulated rate-limited route")
+    parser.add_argument("--calls", type=int, default=100, help="calls in the bulk job")
+    parser.add_argument("--bucket", type=int, default=10, help="requests allowed per window")
+    parser.add_argument("--window", type=float, default=1.0, help="rate-limit window in seconds")
+    parser.add_argument("--rtt", type=float, default=0.25, help="seconds for Discord to answer one request")
+    parser.add_argument("--interactive-every", type=float, default=0.5,
+                        help="seconds between interactive calls while the job runs")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    for name, value in result.items():
+        print("{:<26} {}".format(name, value))
+
+
+if __name__ == "__main__":
+    main()
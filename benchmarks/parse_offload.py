@@ -0,0 +1,95 @@
+"""Compares parsing the recorded scraper pages on the event loop, in a thread pool and in the process pool.
+
+Usage:
+    python -m benchmarks.parse_offload --parses 20 --workers 2
+
+Each mode runs --parses parses of benchmarks/fixtures/gdq_schedule.html through utils.executor.ParseExecutor, a few
+at a time, while a ticker measures how late the event loop wakes up. The report shows parse latency (submit to
+result, including any pickling) and loop lag for each mode.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.loadtest import percentile
+from utils.executor import ParseExecutor
+from utils.metrics import Metrics
+
+FIXTURES = Path(__file__).parent / "fixtures"
+MODES = ("inline", "thread", "process")
+
+
+async def ticker(lag: List[float], interval: float = 0.005):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag.append(time.perf_counter() - start - interval)
+
+
+async def run_mode(mode: str, page: bytes, args) -> dict:
+    executor = ParseExecutor(Metrics(), mode=mode, workers=args.workers, timeout=60)
+    warm_started = time.perf_counter()
+    await executor.start()
+    warmup = time.perf_counter() - warm_started
+
+    latencies: List[float] = []
+    lag: List[float] = []
+
+    async def worker(count: int):
+        for _ in range(count):
+            started = time.perf_counter()
+            rows = await executor.run("gdq_schedule", page)
+            latencies.append(time.perf_counter() - started)
+            assert rows, "the fixture should have a schedule"
+            # An inline parse never yields by itself, give the ticker its turn between them
+            await asyncio.sleep(0)
+
+    watcher = asyncio.create_task(ticker(lag))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    # One worker per pool slot, each parsing its share back to back
+    shares = [args.parses // args.workers + (index < args.parses % args.workers) for index in range(args.workers)]
+    await asyncio.gather(*(worker(share) for share in shares))
+    elapsed = time.perf_counter() - started
+    watcher.cancel()
+    await executor.close()
+    return {
+        "mode": mode,
+        "warmup_ms": warmup * 1000,
+        "parses_per_s": args.parses / elapsed,
+        "parse_p50_ms": percentile(latencies, 0.5) * 1000,
+        "parse_p95_ms": percentile(latencies, 0.95) * 1000,
+        "lag_p50_ms": percentile(lag, 0.5) * 1000,
+        "lag_p99_ms": percentile(lag, 0.99) * 1000,
+        "lag_max_ms": max(lag, default=0.0) * 1000,
+    }
+
+
+async def run(args) -> List[dict]:
+    page = (FIXTURES / "gdq_schedule.html").read_bytes()
+    return [await run_mode(mode, page, args) for mode in args.modes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse offload comparison")
+    parser.add_argument("--parses", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print("{} CPUs, {} workers, {} parses per mode".format(os.cpu_count(), args.workers, args.parses))
+    columns = ["warmup_ms", "parses_per_s", "parse_p50_ms", "parse_p95_ms", "lag_p50_ms", "lag_p99_ms", "lag_max_ms"]
+    print("{:<8} ".format("mode") + " ".join("{:>13}".format(column) for column in columns))
+    for result in results:
+        print("{:<8} ".format(result["mode"]) + " ".join("{:>13.1f}".format(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Compares !rather fetching from reddit on every call with drawing from a question pool.
+
+Usage:
+    python -m benchmarks.question_pools --draws 300 --posts 100 --latency 0.3
+
+A local server stands in for reddit, listing --posts posts after --latency seconds. "per_call" is the old command:
+fetch the listing and pick a title at random. "pool" draws from a QuestionPool over an in-memory Redis stand-in,
+warmed once beforehand like the cog does at startup. The report shows latency, calls to reddit, and how often a
+question came up again before every question had been asked once.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import List
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import AsyncMemoryRedis, MemoryRedis
+from benchmarks.loadtest import percentile
+from utils.metrics import Metrics
+from utils.pools import QuestionPool
+
+
+async def start_server(latency: float, posts: int):
+    calls = Counter()
+    listing = {"data": {"children": [{"data": {"title": "Would you rather #{}?".format(index)}}
+                                     for index in range(posts)]}}
+
+    async def subreddit(request: web.Request) -> web.Response:
+        calls[request.match_info["name"]] += 1
+        await asyncio.sleep(latency)
+        return web.json_response(listing)
+
+    app = web.Application()
+    app.router.add_get("/r/{name}.json", subreddit)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, calls, "http://127.0.0.1:{}".format(site._server.sockets[0].getsockname()[1])
+
+
+def report(name: str, timings: List[float], questions: List[str], calls: Counter, posts: int) -> dict:
+    # Repeats within each stretch of draws as long as the pool
+    repeats = sum(len(chunk) - len(set(chunk)) for chunk in (questions[start:start + posts]
+                                                             for start in range(0, len(questions), posts)))
+    return {"mode": name, "p50_ms": percentile(timings, 0.5) * 1000, "p99_ms": percentile(timings, 0.99) * 1000,
+            "reddit_calls": sum(calls.values()), "early_repeats": repeats}
+
+
+async def run(args) -> List[dict]:
+    runner, calls, base_url = await start_server(args.latency, args.posts)
+    os.environ["REDDIT_URL"] = base_url
+    from modules.silly import fetch_titles
+
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            timings, questions = [], []
+            for _ in range(args.draws):
+                started = time.perf_counter()
+                questions.append(random.choice(await fetch_titles(session, "wouldyourather")))
+                timings.append(time.perf_counter() - started)
+            results.append(report("per_call", timings, questions, calls, args.posts))
+
+            client = AsyncMemoryRedis(MemoryRedis())
+            pool = QuestionPool(Metrics(), lambda: client, "wouldyourather",
+                                lambda: fetch_titles(session, "wouldyourather"))
+            await pool.refill()
+            calls.clear()
+            timings, questions = [], []
+            for _ in range(args.draws):
+                started = time.perf_counter()
+                questions.append(await pool.draw())
+                timings.append(time.perf_counter() - started)
+            results.append(report("pool", timings, questions, calls, args.posts))
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question commands with and without a pool")
+    parser.add_argument("--draws", type=int, default=300)
+    parser.add_argument("--posts", type=int, default=100, help="posts in the stand-in subreddit listing")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds the stand-in reddit takes to answer")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    columns = ["p50_ms", "p99_ms", "reddit_calls", "early_repeats"]
+    print("{:<10} ".format("mode") + " ".join("{:>14}".format(column) for column in columns))
+    for result in results:
+        print("{:<10} ".format(result["mode"]) + " ".join("{:>14.2f}".format(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Takes Redis away in the middle of a message stream and checks the activity stats still add up afterwards.
+
+Usage:
+    python -m benchmarks.redis_outage --messages 3000 --rate 500
+    python -m benchmarks.redis_outage --restart
+    python -m benchmarks.redis_outage --real-redis --restart
+
+Chat messages are replayed through the real cogs against an in-memory Redis that starts refusing connections a third
+of the way in and comes back at two thirds. While it's down the activity cog journals its writes; once it's back the
+journal replays them. At the end every user's line and mention count in Redis is compared with what was sent, and the
+run fails if any differ. With --restart the activity cog is also torn down and rebuilt during the outage, so only what
+made it to the journal file survives, like a bot restart.
+
+With --real-redis a throwaway redis-server from PATH is started on a free port instead, killed outright for the
+outage and started again on the same append-only file, so the counters are checked against what a real server kept.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def chatter(count: int, guild_ids: List[int], seed: int = 1) -> List[dict]:
+    from benchmarks.loadtest import CHATTER
+
+    rng = random.Random(seed)
+    events = []
+    for _ in range(count):
+        guild = rng.choice(guild_ids)
+        mentions = [guild * 10_000 + rng.randrange(50)] if rng.random() < 0.2 else []
+        events.append({"type": "message", "guild": guild, "channel": rng.choice(["main", "games"]),
+                       "author": guild * 10_000 + rng.randrange(50), "content": rng.choice(CHATTER),
+                       "mentions": mentions})
+    return events
+
+
+class LocalRedisServer:
+    """A redis-server of our own on a free port, which can be killed and started again on the same data"""
+
+    def __init__(self, binary: str, directory: str):
+        self.binary = binary
+        self.directory = directory
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        import redis
+
+        # appendfsync always, so nothing acknowledged before the kill is lost
+        self.process = subprocess.Popen(
+            [self.binary, "--port", str(self.port), "--bind", "127.0.0.1", "--dir", self.directory,
+             "--appendonly", "yes", "--appendfsync", "always", "--save", ""],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                redis.Redis(host="127.0.0.1", port=self.port).ping()
+                return
+            except redis.ConnectionError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("redis-server on port {} did not come up".format(self.port))
+                time.sleep(0.05)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+async def run(args, server: Optional[LocalRedisServer] = None) -> dict:
+    from benchmarks.fakes import FlakyRedis, MemoryRedis
+    from benchmarks.loadtest import Harness
+    from modules.activity import MENTION_STATS_KEY, USER_STATS_KEY, ActivityTracker
+
+    guild_ids = list(range(1, args.guilds + 1))
+    events = chatter(args.messages, guild_ids)
+    if server is None:
+        client = FlakyRedis(MemoryRedis())
+        harness = Harness(guild_ids, "memory", store=client)
+
+        async def go_down():
+            client.down = True
+
+        async def come_back():
+            client.down = False
+
+        score = client.store.zscore
+    else:
+        import redis
+        from utils.redis_service import DATABASES
+
+        harness = Harness(guild_ids, "real")
+
+        async def go_down():
+            await asyncio.to_thread(server.stop)
+
+        async def come_back():
+            await asyncio.to_thread(server.start)
+
+        score = redis.Redis(host="127.0.0.1", port=server.port, db=DATABASES["activity"]).zscore
+    await harness.start()
+
+    async def stream(batch: List[dict]):
+        started = time.perf_counter()
+        for index, event in enumerate(batch):
+            await asyncio.sleep(max(0.0, started + index / args.rate - time.perf_counter()) if args.rate else 0)
+            await harness.handle(event)
+        while harness.pending:
+            await asyncio.gather(*list(harness.pending), return_exceptions=True)
+
+    third = len(events) // 3
+    await stream(events[:third])
+    await go_down()
+    await stream(events[third:2 * third])
+    journaled = len(harness.bot.get_cog("Activity Module").journal)
+    if args.restart:
+        await harness.bot.remove_cog("Activity Module")
+        await harness.bot.add_cog(ActivityTracker(harness.bot))
+    await come_back()
+    outage_ended = time.perf_counter()
+    await stream(events[2 * third:])
+    journal = harness.bot.get_cog("Activity Module").journal
+    while len(journal):
+        await asyncio.sleep(0.05)
+    drained_after = time.perf_counter() - outage_ended
+    await harness.stop()
+
+    expected = {USER_STATS_KEY: Counter(), MENTION_STATS_KEY: Counter()}
+    for event in events:
+        expected[USER_STATS_KEY][(event["guild"], event["author"])] += 1
+        for user_id in event["mentions"]:
+            expected[MENTION_STATS_KEY][(event["guild"], user_id)] += 1
+    matched = mismatched = 0
+    for stat, counts in expected.items():
+        for (guild_id, user_id), count in counts.items():
+            actual = score(ActivityTracker.key(guild_id, stat), user_id)
+            if int(actual or 0) == count:
+                matched += 1
+            else:
+                mismatched += 1
+    return {
+        "redis": "memory" if server is None else "redis-server :{}".format(server.port),
+        "messages": len(events),
+        "journaled_during_outage": journaled,
+        "restarted": args.restart,
+        "replay_drained_s": round(drained_after, 3),
+        "counters_matched": matched,
+        "counters_mismatched": mismatched,
+        "errors": harness.event_errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Activity stats through a Redis outage")
+    parser.add_argument("--messages", type=int, default=3000)
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=1000, help="messages per second, 0 for flat out")
+    parser.add_argument("--restart", action="store_true", help="rebuild the activity cog while Redis is down")
+    parser.add_argument("--real-redis", action="store_true",
+                        help="kill and restart a local redis-server from PATH instead of the in-memory stand-in")
+    args = parser.parse_args()
+
+    binary = shutil.which("redis-server") if args.real_redis else None
+    if args.real_redis and binary is None:
+        sys.exit("--real-redis needs redis-server on PATH")
+    with tempfile.TemporaryDirectory() as directory:
+        # The bot reads these at import time
+        os.environ["ACTIVITY_JOURNAL_PATH"] = os.path.join(directory, "activity_journal.jsonl")
+        os.environ["ACTIVITY_JOURNAL_RETRY_SECONDS"] = "0.2"
+        os.environ.setdefault("METRICS_PORT", "0")
+        server = None
+        if binary:
+            server = LocalRedisServer(binary, directory)
+            server.start()
+            os.environ["REDIS_HOST"] = "127.0.0.1"
+            os.environ["REDIS_PORT"] = str(server.port)
+        try:
+            result = asyncio.run(run(args, server))
+        finally:
+            if server is not None:
+                server.stop()
+    for name, value in result.items():
+        print("{:<24} {}".format(name, value))
+    if result["counters_mismatched"]:
+        sys.exit("{} counters did not match after the journal replayed".format(result["counters_mismatched"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Runs several sharded bot processes against fake gateways and one shared in-memory Redis.
+
+Usage:
+    python -m benchmarks.shard_sim --processes 4 --shards 8 --guilds 400 --events 4000
+
+Every process gets SHARD_COUNT/SHARD_IDS like a real deployment and only sees the guilds Discord would route to its
+shards. They share a MemoryRedis served by a multiprocessing manager, so the singleton leases are contended for real.
+The report shows per-process throughput, events counted per shard, and which process ran each singleton duty.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+from multiprocessing.managers import BaseManager
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import MemoryRedis
+
+
+class StoreManager(BaseManager):
+    pass
+
+
+StoreManager.register("MemoryRedis", MemoryRedis)
+
+
+def shard_of(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+
+def run_process(index: int, shard_ids: List[int], shard_count: int, guild_ids: List[int], events: int,
+                rate: float, store) -> dict:
+    # The bot reads its sharding configuration at import time
+    os.environ["SHARD_COUNT"] = str(shard_count)
+    os.environ["SHARD_IDS"] = ",".join(str(shard_id) for shard_id in shard_ids)
+    os.environ.setdefault("SLOTS_REFRESH_SECONDS", "0.5")
+    # Pool workers are daemonic and can't start the parse pool's processes of their own
+    os.environ["PARSE_MODE"] = "inline"
+    from benchmarks.fakes import AsyncMemoryRedis
+    from benchmarks.loadtest import Harness, synthetic_events
+
+    async def main() -> dict:
+        harness = Harness(guild_ids, "memory", store=AsyncMemoryRedis(store))
+        await harness.start()
+        try:
+            report = await harness.run(synthetic_events(events, guild_ids, seed=index), rate)
+        finally:
+            singletons = {name: singleton.runs for name, singleton in harness.bot._singletons.items()}
+            await harness.stop()
+        per_shard: Dict[str, float] = {}
+        for (shard, _), count in harness.bot.metrics.gateway_events.values.items():
+            per_shard[shard] = per_shard.get(shard, 0) + count
+        return {"process": index, "shards": shard_ids, "guilds": len(guild_ids), "report": report,
+                "events_per_shard": per_shard, "singleton_runs": singletons}
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process shard simulation")
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--shards", type=int, default=4, help="total shard count across all processes")
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--events", type=int, default=2000, help="events per process")
+    parser.add_argument("--rate", type=float, default=500, help="events per second per process, 0 for flat out")
+    args = parser.parse_args()
+
+    # Real guild ids are snowflakes, spread them so each shard gets its share
+    guild_ids = [(index + 1) << 22 for index in range(args.guilds)]
+    assignments = [list(range(args.shards))[index::args.processes] for index in range(args.processes)]
+
+    with StoreManager() as manager:
+        store = manager.MemoryRedis()
+        jobs = []
+        for index, shard_ids in enumerate(assignments):
+            owned = [guild_id for guild_id in guild_ids if shard_of(guild_id, args.shards) in shard_ids]
+            jobs.append((index, shard_ids, args.shards, owned, args.events, args.rate, store))
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            results = pool.starmap(run_process, jobs)
+
+    print("\n{:<8} {:<14} {:>7} {:>10} {:>8} {:>14}  {}".format("process", "shards", "guilds", "events/s", "errors",
+                                                               "loop p99 ms", "events per shard"))
+    leaders: Dict[str, List[int]] = {}
+    for result in results:
+        report = result["report"]
+        print("{:<8} {:<14} {:>7} {:>10} {:>8} {:>14}  {}".format(
+            result["process"], ",".join(map(str, result["shards"])), result["guilds"], report["throughput_per_s"],
+            report["errors"], report["loop_lag_ms"]["p99"],
+            " ".join("{}:{:.0f}".format(shard, count) for shard, count in sorted(result["events_per_shard"].items()))))
+        for name, runs in result["singleton_runs"].items():
+            if runs:
+                leaders.setdefault(name, []).append(result["process"])
+    for name, processes in sorted(leaders.items()):
+        verdict = "OK" if len(processes) == 1 else "CONFLICT"
+        print("singleton {} ran in process(es) {}: {}".format(name, processes, verdict))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Times !stocks chart with and without the rendered chart cache.
+
+Usage:
+    python -m benchmarks.stock_charts --burst 20 --latency 0.1
+
+Candles come from the local stand-in in benchmarks/stocks_quotes.py. For each range, --burst requests for the same
+chart arrive at once and then again one at a time, all within one cache bucket:
+    uncached   fetches candles and renders for every request
+    cached     Stocks.chart_png, where the burst shares one fetch and render and the later requests are cache hits
+The report shows the slowest of the burst, the typical later request, how many candle fetches reached the API and
+the PNG size.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+from typing import List
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import AsyncMemoryRedis, MemoryRedis
+from benchmarks.loadtest import percentile
+from benchmarks.stocks_quotes import start_server, timed
+from utils.metrics import Metrics
+
+
+async def run(args) -> List[dict]:
+    runner, calls, base_url = await start_server(args.latency)
+    os.environ.update(FINNHUB_URL=base_url, FINNHUB_CALLS_PER_MINUTE="100000")
+    from modules import stocks
+
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            bot = SimpleNamespace(metrics=Metrics(), session=session, coordination=AsyncMemoryRedis(MemoryRedis()))
+            cog = stocks.Stocks(bot)
+
+            async def uncached(period: str):
+                chart_range = stocks.CHART_RANGES[period]
+                return await cog._render_chart("AAPL", chart_range, int(time.time() // chart_range.bucket))
+
+            for period in stocks.CHART_RANGES:
+                for mode, work in (("uncached", uncached), ("cached", lambda period: cog.chart_png("AAPL", period))):
+                    calls.clear()
+                    burst = await asyncio.gather(*(timed(work(period)) for _ in range(args.burst)))
+                    repeats = [await timed(work(period)) for _ in range(args.burst)]
+                    png = await work(period)
+                    results.append({"mode": mode, "range": period, "burst_p99_ms": percentile(burst, 0.99) * 1000,
+                                    "repeat_p50_ms": percentile(repeats, 0.5) * 1000, "fetches": calls["candle"],
+                                    "png_kb": len(png) / 1024})
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="!stocks chart with and without the chart cache")
+    parser.add_argument("--burst", type=int, default=20, help="identical chart requests issued at once")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds the stand-in candle API takes")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    columns = ["burst_p99_ms", "repeat_p50_ms", "fetches", "png_kb"]
+    print("{:<10} {:<6} ".format("mode", "range") + " ".join("{:>14}".format(column) for column in columns))
+    for result in results:
+        print("{:<10} {:<6} ".format(result["mode"], result["range"])
+              + " ".join("{:>14.2f}".format(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
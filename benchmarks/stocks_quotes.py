@@ -0,0 +1,137 @@
+"""Compares the old one-symbol-at-a-time !stocks with batched quotes behind the symbol and quote caches.
+
+Usage:
+    python -m benchmarks.stocks_quotes --symbols 8 --burst 20 --latency 0.1
+
+A local server stands in for Yahoo's search and Finnhub's quote and candle endpoints, answering after --latency
+seconds. benchmarks/stock_charts.py uses it too. Each mode looks up --symbols symbols, --burst times at once, the way a
+channel piling onto the same command would:
+    sequential   the old path, a search then a quote per symbol, one after the other, for every command
+    batched      !stocks with every symbol in one command, cold caches
+    warm         the same again once the quote TTL has lapsed, so symbols come from the cache and only quotes are fetched
+The report shows command latency and how many calls reached each upstream.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import List
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import AsyncMemoryRedis, MemoryRedis
+from benchmarks.loadtest import percentile
+from utils.metrics import Metrics
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "AMD", "NFLX", "INTC"]
+
+
+async def start_server(latency: float):
+    calls = Counter()
+
+    async def search(request: web.Request) -> web.Response:
+        calls["search"] += 1
+        await asyncio.sleep(latency)
+        symbol = request.query["q"]
+        return web.json_response({"quotes": [{"symbol": symbol, "shortname": "{} Inc.".format(symbol.title())}]})
+
+    async def quote(request: web.Request) -> web.Response:
+        calls["quote"] += 1
+        await asyncio.sleep(latency)
+        price = 100.0 + len(request.query["symbol"])
+        return web.json_response({"o": price, "c": price * 1.01})
+
+    async def candle(request: web.Request) -> web.Response:
+        calls["candle"] += 1
+        await asyncio.sleep(latency)
+        step = int(request.query["resolution"]) * 60
+        times = list(range(int(request.query["from"]), int(request.query["to"]), step))
+        rng = random.Random(request.query["symbol"])
+        closes = [100.0]
+        for _ in times[1:]:
+            closes.append(round(closes[-1] + rng.gauss(0, 0.3), 2))
+        return web.json_response({"s": "ok", "t": times, "c": closes})
+
+    app = web.Application()
+    app.router.add_get("/search", search)
+    app.router.add_get("/quote", quote)
+    app.router.add_get("/stock/candle", candle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, calls, "http://127.0.0.1:{}".format(site._server.sockets[0].getsockname()[1])
+
+
+def report(name: str, timings: List[float], calls: Counter) -> dict:
+    return {"mode": name, "p50_ms": percentile(timings, 0.5) * 1000, "p99_ms": percentile(timings, 0.99) * 1000,
+            "searches": calls["search"], "quotes": calls["quote"]}
+
+
+async def timed(work) -> float:
+    started = time.perf_counter()
+    await work
+    return time.perf_counter() - started
+
+
+async def run(args) -> List[dict]:
+    runner, calls, base_url = await start_server(args.latency)
+    # The module reads its endpoints and budgets when it's imported
+    os.environ.update(FINNHUB_URL=base_url, YAHOO_SEARCH_URL=base_url + "/search", FINNHUB_CALLS_PER_MINUTE="6000",
+                      YAHOO_CALLS_PER_MINUTE="6000")
+    from modules import stocks
+
+    symbols = SYMBOLS[:args.symbols]
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            async def old_command():
+                for symbol in symbols:
+                    await stocks.symbol_lookup(session, symbol)
+                    async with session.get(stocks.QUOTE_URL, params={"symbol": symbol}) as response:
+                        await response.json()
+
+            timings = await asyncio.gather(*(timed(old_command()) for _ in range(args.burst)))
+            results.append(report("sequential", timings, calls))
+
+            bot = SimpleNamespace(metrics=Metrics(), session=session, coordination=AsyncMemoryRedis(MemoryRedis()))
+            cog = stocks.Stocks(bot)
+
+            async def new_command():
+                return await asyncio.gather(*(cog.quote(symbol) for symbol in symbols))
+
+            for mode in ("batched", "warm"):
+                calls.clear()
+                if mode == "warm":
+                    # Past the quote TTL, the symbols are still cached
+                    cog.quotes = stocks.TTLCache(bot.metrics, "stocks_quotes", stocks.QUOTE_TTL_SECONDS)
+                timings = await asyncio.gather(*(timed(new_command()) for _ in range(args.burst)))
+                results.append(report(mode, timings, calls))
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="!stocks with and without batching and caches")
+    parser.add_argument("--symbols", type=int, default=8, help="symbols per command, up to {}".format(len(SYMBOLS)))
+    parser.add_argument("--burst", type=int, default=20, help="identical commands issued at once")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds the stand-in APIs take to answer")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    columns = ["p50_ms", "p99_ms", "searches", "quotes"]
+    print("{:<12} ".format("mode") + " ".join("{:>10}".format(column) for column in columns))
+    for result in results:
+        print("{:<12} ".format(result["mode"]) + " ".join("{:>10.1f}".format(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Compares the persistent timer service with one sleeping task per reminder.
+
+Usage:
+    python -m benchmarks.timers --timers 5000 --spread 5 --restart
+
+Both fire --timers reminders spread over --spread seconds, starting a second from now. The service keeps them in an
+in-memory Redis stand-in. The report shows how late reminders fired, how many tasks were alive while they waited and
+the memory they took, which for the service includes the stand-in's copy of the timers. With --restart the service is
+stopped halfway through and a fresh one takes over from the same store, the way a bot restart would, and the report
+checks every reminder fired exactly once.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import AsyncMemoryRedis, MemoryRedis
+from benchmarks.loadtest import percentile
+from utils.metrics import Metrics
+from utils.timers import Timers
+
+
+def due_times(args) -> List[float]:
+    start = time.time() + 1.0
+    return [start + args.spread * index / args.timers for index in range(args.timers)]
+
+
+def summary(name: str, lateness: List[float], tasks: int, memory: int, fired: Counter, expected: int) -> dict:
+    return {
+        "mode": name,
+        "fired": sum(fired.values()),
+        "duplicates": sum(count - 1 for count in fired.values() if count > 1),
+        "missed": expected - len(fired),
+        "late_p50_ms": percentile(lateness, 0.5) * 1000,
+        "late_p99_ms": percentile(lateness, 0.99) * 1000,
+        "late_max_ms": max(lateness, default=0.0) * 1000,
+        "tasks_waiting": tasks,
+        "memory_kb": memory / 1024,
+    }
+
+
+async def per_task(args) -> dict:
+    lateness, fired = [], Counter()
+
+    async def remind(timer_id: int, due: float):
+        await asyncio.sleep(due - time.time())
+        lateness.append(time.time() - due)
+        fired[timer_id] += 1
+
+    baseline = len(asyncio.all_tasks())
+    tracemalloc.start()
+    tasks = [asyncio.create_task(remind(index, due)) for index, due in enumerate(due_times(args))]
+    await asyncio.sleep(0)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    waiting = len(asyncio.all_tasks()) - baseline
+    await asyncio.gather(*tasks)
+    return summary("task_per_timer", lateness, waiting, memory, fired, args.timers)
+
+
+async def service(args) -> dict:
+    store = MemoryRedis()
+    lateness, fired = [], Counter()
+
+    async def fire(timers: List[dict]):
+        now = time.time()
+        for timer in timers:
+            lateness.append(now - timer["due"])
+            fired[timer["id"]] += 1
+
+    def start() -> Timers:
+        timers = Timers(Metrics(), lambda: client)
+        timers.register("bench", fire)
+        timers.start()
+        return timers
+
+    client = AsyncMemoryRedis(store)
+    timers = start()
+    tracemalloc.start()
+    dues = due_times(args)
+    for index, due in enumerate(dues):
+        await timers.add("bench", str(index), due, {"user": index})
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    waiting = sum(1 for task in asyncio.all_tasks() if task.get_name().startswith("timers"))
+    if args.restart:
+        await asyncio.sleep(1.0 + args.spread / 2)
+        await timers.stop()
+        # A new process: nothing in memory, only what's in Redis
+        timers = start()
+    while sum(fired.values()) < args.timers and time.time() < dues[-1] + 5:
+        await asyncio.sleep(0.05)
+    await timers.stop()
+    return summary("service" + ("_restarted" if args.restart else ""), lateness, waiting, memory, fired, args.timers)
+
+
+async def run(args) -> List[dict]:
+    return [await per_task(args), await service(args)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Timer service against a task per timer")
+    parser.add_argument("--timers", type=int, default=5000)
+    parser.add_argument("--spread", type=float, default=5.0, help="seconds the due times are spread over")
+    parser.add_argument("--restart", action="store_true", help="restart the service halfway through")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    columns = ["fired", "duplicates", "missed", "late_p50_ms", "late_p99_ms", "late_max_ms", "tasks_waiting",
+               "memory_kb"]
+    print("{:<18} ".format("mode") + " ".join("{:>12}".format(column) for column in columns))
+    for result in results:
+        print("{:<18} ".format(result["mode"]) + " ".join("{:>12.1f}".format(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measures per-message dispatch cost of the trigger engine as the number of triggers grows.
+
+Usage: python -m benchmarks.trigger_dispatch [--messages N]
+"""
+import argparse
+import random
+import string
+import timeit
+
+from utils.triggers import TriggerEngine
+
+SAMPLE_MESSAGES = [
+    "everybody",
+    "EVERYBODYYYYY!!!",
+    "good bot",
+    "anyone up for some games tonight?",
+    "lol",
+    "backstreet's back alright",
+    "I think the new patch broke the spawn rates on the second map, anyone else seeing that?",
+    "stop",
+]
+
+
+def _noop(message):
+    pass
+
+
+def _random_phrase(rng: random.Random) -> str:
+    return " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8)))
+                    for _ in range(rng.randint(1, 4)))
+
+
+def build_engine(trigger_count: int, rng: random.Random) -> TriggerEngine:
+    engine = TriggerEngine()
+    entries = [("phrase", phrase, 0, _noop) for phrase in ("everybody", "backstreet's back alright", "stop")]
+    entries += [("pattern", r"^good bot$", 2, _noop)]
+    while len(entries) < trigger_count:
+        if len(entries) % 4:
+            entries.append(("phrase", _random_phrase(rng), 0, _noop))
+        else:
+            entries.append(("pattern", r"^{}$".format(_random_phrase(rng)), 2, _noop))
+    engine.add("benchmark", entries)
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20_000, help="messages dispatched per trigger count")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    messages = [rng.choice(SAMPLE_MESSAGES) for _ in range(args.messages)]
+    print("{:>9} {:>14}".format("triggers", "ns/message"))
+    for trigger_count in (10, 100, 1_000, 5_000):
+        engine = build_engine(trigger_count, rng)
+        engine.match("warm up")  # compile outside of the timed section
+        elapsed = min(timeit.repeat(lambda: [engine.match(m) for m in messages], number=1, repeat=5))
+        print("{:>9} {:>14.0f}".format(trigger_count, elapsed / len(messages) * 1e9))
+
+
+if __name__ == "__main__":
+    main()
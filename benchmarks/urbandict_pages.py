@@ -0,0 +1,121 @@
+"""Compares paging through Urban Dictionary definitions by re-running !ud with paging through the cached pages.
+
+Usage:
+    python -m benchmarks.urbandict_pages --definitions 10 --readers 20 --latency 0.2
+
+A local server stands in for the Urban Dictionary API, listing --definitions definitions (every third one long enough
+to span pages) after --latency seconds. --readers people look the same term up at once and then read every page:
+    refetch   the old way, where seeing the next definition meant a new fetch, filter and clean up
+    cached    !ud's cache and DefinitionsView, where lookups share one fetch and Next only swaps in a built page
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import List
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.loadtest import percentile
+from utils.metrics import Metrics
+
+TERM = "yeet"
+
+
+async def start_server(latency: float, definitions: int):
+    calls = Counter()
+    # Every third definition runs to about 3000 characters
+    listing = {"list": [{"word": TERM, "definition": "[to throw] " + "really far " * (10 if index % 3 else 300),
+                         "example": "[yeet] the ball", "thumbs_up": index, "thumbs_down": 0}
+                        for index in range(definitions)]}
+
+    async def define(request: web.Request) -> web.Response:
+        calls["define"] += 1
+        await asyncio.sleep(latency)
+        return web.json_response(listing)
+
+    app = web.Application()
+    app.router.add_get("/define", define)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, calls, "http://127.0.0.1:{}/define".format(site._server.sockets[0].getsockname()[1])
+
+
+class FakeInteraction:
+    def __init__(self):
+        self.response = SimpleNamespace(edit_message=self.edit_message)
+
+    async def edit_message(self, **kwargs):
+        pass
+
+
+async def run(args) -> List[dict]:
+    runner, calls, url = await start_server(args.latency, args.definitions)
+    os.environ["URBANDICT_URL"] = url
+    from modules import urbandict
+
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            async def refetch_reader() -> List[float]:
+                timings = []
+                for page in range(args.definitions):
+                    started = time.perf_counter()
+                    pages = await urbandict.fetch_pages(session, TERM)
+                    pages[min(page, len(pages) - 1)].embed()
+                    timings.append(time.perf_counter() - started)
+                return timings
+
+            cog = urbandict.UrbanDict(SimpleNamespace(metrics=Metrics(), session=session))
+
+            async def cached_reader() -> List[float]:
+                started = time.perf_counter()
+                pages = await cog.definitions.get_or_load(urbandict.normalize(TERM),
+                                                          lambda: urbandict.fetch_pages(session, TERM))
+                view = urbandict.DefinitionsView(pages)
+                pages[0].embed()
+                timings = [time.perf_counter() - started]
+                for _ in range(len(pages) - 1):
+                    started = time.perf_counter()
+                    await view.next.callback(FakeInteraction())
+                    timings.append(time.perf_counter() - started)
+                view.stop()
+                return timings
+
+            for mode, reader in (("refetch", refetch_reader), ("cached", cached_reader)):
+                calls.clear()
+                per_reader = await asyncio.gather(*(reader() for _ in range(args.readers)))
+                first = [timings[0] for timings in per_reader]
+                turns = [timing for timings in per_reader for timing in timings[1:]]
+                results.append({"mode": mode, "first_p50_ms": percentile(first, 0.5) * 1000,
+                                "turn_p50_ms": percentile(turns, 0.5) * 1000,
+                                "turn_p99_ms": percentile(turns, 0.99) * 1000, "fetches": calls["define"]})
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Urban Dictionary paging with and without the definition cache")
+    parser.add_argument("--definitions", type=int, default=10)
+    parser.add_argument("--readers", type=int, default=20, help="people looking the term up at once")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds the stand-in API takes to answer")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    columns = ["first_p50_ms", "turn_p50_ms", "turn_p99_ms", "fetches"]
+    print("{:<10} ".format("mode") + " ".join("{:>14}".format(column) for column in columns))
+    for result in results:
+        print("{:<10} ".format(result["mode"]) + " ".join("{:>14.2f}".format(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
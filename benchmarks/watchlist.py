@@ -0,0 +1,108 @@
+"""Times a stock watch tick as the number of watches grows, against polling once per watch.
+
+Usage:
+    python -m benchmarks.watchlist --watches 10 100 1000 --symbols 25 --latency 0.05
+
+The watches are spread over --symbols symbols with random thresholds, and quotes come from the local stand-in in
+benchmarks/stocks_quotes.py. "per_watch" fetches a quote and checks it for every watch, the way one polling loop per
+user per symbol would. "indexed" is Stocks.watch_tick: one fetch per symbol and a bisect per quote. Each tick is timed
+after the first, so the numbers are for steady state, and the quote cache is cleared between ticks so every tick
+really polls.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+from typing import List
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import AsyncMemoryRedis, MemoryRedis
+from benchmarks.loadtest import percentile
+from benchmarks.stocks_quotes import start_server
+from utils.metrics import Metrics
+from utils.outbound import OutboundQueue
+from utils.watchlist import Watch
+
+TICKS = 5
+
+
+def make_watches(count: int, symbols: int) -> List[Watch]:
+    rng = random.Random(count)
+    return [Watch(1, 2, user, "SYM{}".format(user % symbols), round(rng.uniform(0.2, 3.0), 1))
+            for user in range(count)]
+
+
+async def run(args) -> List[dict]:
+    runner, calls, base_url = await start_server(args.latency)
+    os.environ.update(FINNHUB_URL=base_url, YAHOO_SEARCH_URL=base_url + "/search",
+                      FINNHUB_CALLS_PER_MINUTE="1000000")
+    from modules import stocks
+
+    async def discard(content: str):
+        pass
+
+    # Alerts go nowhere, the tick is what's measured
+    sink = SimpleNamespace(send=discard)
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            for count in args.watches:
+                watches = make_watches(count, args.symbols)
+                metrics = Metrics()
+                bot = SimpleNamespace(metrics=metrics, session=session, coordination=AsyncMemoryRedis(MemoryRedis()),
+                                      outbound=OutboundQueue(metrics), get_channel=lambda channel_id: None,
+                                      get_partial_messageable=lambda channel_id: sink)
+                cog = stocks.Stocks(bot)
+
+                async def per_watch():
+                    async def check(watch: Watch):
+                        prices = await cog._fetch_quote(watch.symbol)
+                        return abs(prices[1] - prices[0]) / prices[0] * 100 >= watch.threshold
+
+                    await asyncio.gather(*(check(watch) for watch in watches))
+
+                await bot.coordination.hset(stocks.WATCHES_KEY, mapping={watch.id: watch.to_json()
+                                                                         for watch in watches})
+                await bot.coordination.incr(stocks.WATCH_VERSION_KEY)
+
+                async def indexed():
+                    cog.quotes = stocks.TTLCache(bot.metrics, "stocks_quotes", stocks.QUOTE_TTL_SECONDS)
+                    await cog.watch_tick()
+
+                for mode, tick in (("per_watch", per_watch), ("indexed", indexed)):
+                    await tick()
+                    calls.clear()
+                    timings = []
+                    for _ in range(TICKS):
+                        started = time.perf_counter()
+                        await tick()
+                        timings.append(time.perf_counter() - started)
+                    results.append({"mode": mode, "watches": count, "p50_ms": percentile(timings, 0.5) * 1000,
+                                    "max_ms": max(timings) * 1000, "calls_per_tick": calls["quote"] / TICKS})
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch tick latency against watch count")
+    parser.add_argument("--watches", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--symbols", type=int, default=25, help="distinct symbols the watches are spread over")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the stand-in quote API takes")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    columns = ["watches", "p50_ms", "max_ms", "calls_per_tick"]
+    print("{:<10} ".format("mode") + " ".join("{:>14}".format(column) for column in columns))
+    for result in results:
+        print("{:<10} ".format(result["mode"]) + " ".join("{:>14.1f}".format(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
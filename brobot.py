@@ -1,14 +1,80 @@
+import time
+
+# Taken before the heavy imports so the startup profile covers them
+process_started = time.perf_counter()
+
 import asyncio
+import functools
+import math
 import os
+from typing import Awaitable, Callable, Dict, List, Optional
 
 import aiohttp
 import discord
 from discord.ext import commands
 
+from utils.executor import ParseExecutor
+from utils.leases import Lease, Singleton
+from utils.logs import event, setup_logging
+from utils.members import MemberResolver
+from utils.metrics import Metrics
+from utils.outbound import OutboundQueue
+from utils.redis_service import RedisService
+from utils.scheduler import Scheduler
+from utils.startup import StartupProfile
+from utils.timers import Timers
+from utils.triggers import TriggerEngine
+
 import logging
-discord.utils.setup_logging(level=logging.INFO, root=True)
+
+logger = logging.getLogger("brobot")
 
 discord_key: str = os.getenv("DISCORD_KEY")
+metrics_host: str = os.getenv("METRICS_HOST", "127.0.0.1")
+# Set METRICS_PORT=0 to turn the /metrics endpoint off
+metrics_port: int = int(os.getenv("METRICS_PORT", "9108"))
+# Lean mode skips member chunking at startup and only caches members that are in voice
+lean_member_cache: bool = os.getenv("LEAN_MEMBER_CACHE", "").lower() in ("1", "true", "yes")
+member_name_cache_size: int = int(os.getenv("MEMBER_NAME_CACHE_SIZE", "5000"))
+
+
+def parse_shard_ids(value: str) -> Optional[List[int]]:
+    """Turns "0-3" or "0,2,5" into a list of shard ids"""
+    if not value:
+        return None
+    shard_ids = []
+    for part in value.split(","):
+        first, _, last = part.partition("-")
+        shard_ids.extend(range(int(first), int(last or first) + 1))
+    return shard_ids
+
+
+def shard_config_error() -> Optional[str]:
+    """What's wrong with the sharding settings, if anything"""
+    if sharded and shard_count is None and shard_setting != "auto":
+        return "SHARD_COUNT must be a number or \"auto\", not {!r}.".format(shard_setting)
+    if shard_ids is not None and shard_count is None:
+        # Discord only picks the count once connected, so there's nothing to check the ids against
+        return "SHARD_IDS needs SHARD_COUNT set to the total number of shards, it can't be used with \"auto\"."
+    if shard_ids is not None and not all(0 <= shard_id < shard_count for shard_id in shard_ids):
+        return "SHARD_IDS {} don't fit in SHARD_COUNT={}.".format(os.getenv("SHARD_IDS"), shard_count)
+    return None
+
+
+# Setting SHARD_COUNT runs an AutoShardedBot. It's the total across all processes ("auto" lets Discord pick), and
+# SHARD_IDS are the shards this process connects, e.g. SHARD_COUNT=8 SHARD_IDS=0-3 and SHARD_COUNT=8 SHARD_IDS=4-7
+shard_setting: str = os.getenv("SHARD_COUNT", "")
+sharded: bool = bool(shard_setting)
+shard_count: Optional[int] = int(shard_setting) if shard_setting.isdigit() else None
+shard_ids: Optional[List[int]] = parse_shard_ids(os.getenv("SHARD_IDS", ""))
+# BROBOT_ROLE=primary or standby runs the process as one of a failover pair: both stay connected with warm caches,
+# but only the holder of the leader lease handles events. A lease lasts LEADER_LEASE_SECONDS without renewal.
+bot_role: Optional[str] = os.getenv("BROBOT_ROLE") or None
+leader_lease_seconds: float = float(os.getenv("LEADER_LEASE_SECONDS", "5"))
+
+# Reach a standby too, so it keeps its connection and startup bookkeeping up to date
+LIFECYCLE_EVENTS = frozenset({"connect", "disconnect", "ready", "resumed", "shard_connect", "shard_disconnect",
+                              "shard_ready", "shard_resumed"})
 
 brobot_modules = ["modules.8ball", "modules.activity", "modules.backstreet_boys", "modules.base", "modules.choose",
                   "modules.egs", "modules.f1", "modules.game_tag", "modules.gdq", "modules.hltb", "modules.imdb",
@@ -24,37 +90,270 @@ intents.guild_messages = True
 intents.message_content = True
 
 
-class Brobot(commands.Bot):
-    def __init__(self):
-        super().__init__(command_prefix="!", intents=intents, description="Brobot")
+class Brobot(commands.AutoShardedBot if sharded else commands.Bot):
+    def __init__(self, role: Optional[str] = bot_role):
+        if lean_member_cache:
+            member_options = {"chunk_guilds_at_startup": False,
+                              "member_cache_flags": discord.MemberCacheFlags(voice=True, joined=False)}
+        else:
+            member_options = {}
+        if sharded:
+            member_options.update(shard_count=shard_count, shard_ids=shard_ids)
+        super().__init__(command_prefix="!", intents=intents, description="Brobot", **member_options)
+        self.metrics = Metrics()
+        self.triggers = TriggerEngine()
+        self.startup = StartupProfile(process_started)
+        self._cog_added_at = {}
+        self.members = MemberResolver(member_name_cache_size)
+        # Bulk Discord calls go through here, see utils/outbound.py
+        self.outbound = OutboundQueue(self.metrics)
+        # Scrapers parse pages through here, see utils/executor.py
+        self.parsers = ParseExecutor(self.metrics)
+        self._listener_wrappers = {}
+        # Created in setup_hook unless something (like the load test) provided one already
+        self.redis: Optional[RedisService] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Created in setup_hook, so cogs can add their jobs while they load
+        self.scheduler: Optional[Scheduler] = None
+        # Persistent reminders and other one-shot timers, also created in setup_hook
+        self.timers: Optional[Timers] = None
+        self._singletons: Dict[str, Singleton] = {}
+        self.role = role
+        # Without a role there's no failover partner, and this process is always the one handling events
+        self.active = role is None
+        self.before_invoke(self._before_command)
+        self.after_invoke(self._after_command)
+        self.metrics.add_collector(self._collect_gateway_metrics)
 
     async def setup_hook(self) -> None:
-        self.session = aiohttp.ClientSession()
-        await self.init_bot()
+        self.startup.setup_hook_started = self.startup.now()
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        if self.redis is None:
+            self.redis = RedisService(self.metrics)
+        self.scheduler = Scheduler(self.metrics, lambda: self.coordination, wait=self.wait_until_ready)
+        self.timers = Timers(self.metrics, lambda: self.coordination, wait=self.wait_until_ready,
+                             active=lambda: self.active)
+        if metrics_port:
+            await self.metrics.start_server(metrics_host, metrics_port)
+        # The workers spin up alongside the extensions rather than on the first scrape
+        await asyncio.gather(self.parsers.start(), self.init_bot())
+        self.scheduler.start()
+        self.timers.start()
+        if self.role is not None:
+            self.start_singleton(self._leader_lease_name(), self._lead, leader_lease_seconds / 5,
+                                 ttl=leader_lease_seconds, wait=self._wait_to_lead, hold_through_outage=True)
+
+    async def on_connect(self):
+        if self.startup.connected is None:
+            self.startup.connected = self.startup.now()
 
     async def on_ready(self):
-        print(f'\n\nLogged in as: {self.user.name} - {self.user.id}\nVersion: {discord.__version__}\n')
-        print(f'Successfully logged in and booted...!')
+        logger.info("Logged in as: %s - %s, discord.py %s", self.user.name, self.user.id, discord.__version__)
+        if sharded:
+            logger.info("Running shards %s of %s", sorted(self.shards), self.shard_count)
+        # on_ready fires again after reconnects, only the first one is startup
+        if self.startup.ready is None:
+            self.startup.ready = self.startup.now()
+            logger.info("Successfully logged in and booted\n%s", self.startup.render())
+
+    async def on_message(self, message: discord.Message):
+        if message.author.bot:
+            return
+        if isinstance(message.author, discord.Member):
+            self.members.remember(message.author)
+        for handler in self.triggers.match(message.content, len(message.raw_mentions)):
+            self._schedule_event(handler, "on_trigger", message)
+        await self.process_commands(message)
+
+    async def add_cog(self, cog: commands.Cog, /, **kwargs):
+        # Marks the end of the extension's import for the startup profile
+        self._cog_added_at.setdefault(type(cog).__module__, self.startup.now())
+        await super().add_cog(cog, **kwargs)
+        self.triggers.add_cog(cog, wrap=functools.partial(self._timed_listener, event="on_trigger"))
+
+    async def remove_cog(self, name: str, /, **kwargs):
+        cog = await super().remove_cog(name, **kwargs)
+        if cog is not None:
+            self.triggers.remove_cog(cog)
+        return cog
+
+    async def on_disconnect(self):
+        if not sharded:
+            self.metrics.shard_disconnects.inc("0")
+
+    async def on_shard_disconnect(self, shard_id: int):
+        self.metrics.shard_disconnects.inc(str(shard_id))
 
     async def close(self):
+        # Hand the singleton duties over before the connection goes away
+        await self.stop_singletons()
+        if self.scheduler is not None:
+            await self.scheduler.stop()
+        if self.timers is not None:
+            await self.timers.stop()
+        await self.outbound.close()
+        await self.parsers.close()
         await super().close()
         await self.session.close()
+        await self.metrics.stop_server()
+        if self.redis is not None:
+            await self.redis.close()
 
-    async def init_bot(self):
-        for module in brobot_modules:
+    @property
+    def coordination(self):
+        """The Redis every process shares, where the leases live"""
+        return self.redis.db("default")
+
+    def dispatch(self, event_name: str, /, *args, **kwargs):
+        self.metrics.gateway_events.inc(self._shard_of(args), event_name)
+        # The state has already updated the caches by now, a standby just doesn't act on the event
+        if not self.active and event_name not in LIFECYCLE_EVENTS:
+            return
+        super().dispatch(event_name, *args, **kwargs)
+
+    def _shard_of(self, args) -> str:
+        """The shard an event arrived on, worked out from its guild the same way Discord assigns guilds to shards"""
+        if not args or not self.shard_count:
+            return "0"
+        origin = args[0]
+        if isinstance(origin, discord.Guild):
+            guild_id = origin.id
+        else:
+            guild = getattr(origin, "guild", None)
+            guild_id = guild.id if guild is not None else getattr(origin, "guild_id", None)
+        # DMs always arrive on shard 0
+        return str((guild_id >> 22) % self.shard_count) if guild_id else "0"
+
+    def start_singleton(self, name: str, work: Callable[[], Awaitable[None]], interval: float, *,
+                        ttl: Optional[float] = None, wait: Optional[Callable[[], Awaitable[None]]] = None,
+                        hold_through_outage: bool = False) -> Singleton:
+        """Runs work every interval seconds in exactly one of the bot's processes, coordinated through Redis"""
+        lease = Lease(self.coordination, name, ttl=ttl or max(15.0, interval * 3))
+        singleton = Singleton(lease, work, interval, wait=wait or self.wait_until_ready,
+                              on_change=self._singleton_changed, hold_through_outage=hold_through_outage)
+        self._singletons[name] = singleton
+        singleton.start()
+        return singleton
+
+    async def stop_singleton(self, name: str):
+        singleton = self._singletons.pop(name, None)
+        if singleton is not None:
+            await singleton.stop()
+
+    async def stop_singletons(self):
+        await asyncio.gather(*(self.stop_singleton(name) for name in list(self._singletons)))
+
+    def _singleton_changed(self, name: str, leader: bool):
+        self.metrics.singleton_leader.set(name, value=int(leader))
+        logger.info("%s the %s lease", "Took" if leader else "Lost", name)
+        if name == self._leader_lease_name():
+            self.active = leader
+            logger.info("Now %s", "active" if leader else "standing by")
+
+    def _leader_lease_name(self) -> str:
+        # Each shard range has its own failover pair
+        return "leader:{}".format(os.getenv("SHARD_IDS", "all"))
+
+    async def _wait_to_lead(self):
+        await self.wait_until_ready()
+        if self.role == "standby":
+            # Give a primary that started at the same time the first go at the lease
+            await asyncio.sleep(leader_lease_seconds)
+
+    async def _lead(self):
+        # Holding the lease is the whole job, the singleton renews it every interval
+        pass
+
+    def add_listener(self, func, name=None):
+        name = func.__name__ if name is None else name
+        wrapper = self._timed_listener(func, name)
+        self._listener_wrappers[(func, name)] = wrapper
+        super().add_listener(wrapper, name)
+
+    def remove_listener(self, func, name=None):
+        name = func.__name__ if name is None else name
+        super().remove_listener(self._listener_wrappers.pop((func, name), func), name)
+
+    def _timed_listener(self, func, event: str):
+        """Wraps a listener so every call records its latency and errors"""
+        label = func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
             try:
-                await self.load_extension(module)
-                print("Loaded: {}".format(module))
-            except commands.ExtensionError as error:
-                print("Error loading {}: {}".format(module, error))
+                return await func(*args, **kwargs)
+            except Exception:
+                self.metrics.listener_errors.inc(event, label)
+                raise
+            finally:
+                self.metrics.listener_duration.observe(event, label, value=time.perf_counter() - start)
+
+        return wrapper
+
+    async def _before_command(self, ctx: commands.Context):
+        ctx.started_at = time.perf_counter()
+        self.metrics.command_in_flight.inc(ctx.command.qualified_name)
+
+    async def _after_command(self, ctx: commands.Context):
+        name = ctx.command.qualified_name
+        duration = time.perf_counter() - ctx.started_at
+        self.metrics.command_in_flight.dec(name)
+        self.metrics.command_duration.observe(name, value=duration)
+        if ctx.command_failed:
+            self.metrics.command_errors.inc(name)
+        event("command", logging.WARNING if ctx.command_failed else logging.INFO, command=name,
+              guild=ctx.guild.id if ctx.guild else None, user=ctx.author.id, ms=round(duration * 1000, 1),
+              failed=ctx.command_failed)
+
+    async def _collect_gateway_metrics(self):
+        if sharded:
+            shards = {shard_id: (shard.latency, not shard.is_closed()) for shard_id, shard in self.shards.items()}
+        else:
+            shards = {0: (self.latency, self.is_ready() and not self.is_closed())}
+        for shard_id, (latency, up) in shards.items():
+            if math.isfinite(latency):
+                self.metrics.gateway_latency.set(str(shard_id), value=latency)
+            self.metrics.shard_up.set(str(shard_id), value=int(up))
+        self.metrics.cache_entries.set("guilds", value=len(self.guilds))
+        self.metrics.cache_entries.set("users", value=len(self.users))
+        self.metrics.cache_entries.set("members", value=sum(len(guild.members) for guild in self.guilds))
+        self.metrics.cache_entries.set("messages", value=len(self.cached_messages))
+        self.metrics.cache_entries.set("voice_clients", value=len(self.voice_clients))
+        self.metrics.cache_entries.set("member_names", value=len(self.members))
+
+    async def init_bot(self):
+        # Imports still run one at a time, but any extension that awaits during setup no longer holds up the rest
+        await asyncio.gather(*(self._load_module(module) for module in brobot_modules))
+        self.startup.extensions_loaded = self.startup.now()
+
+    async def _load_module(self, module: str):
+        start = self.startup.now()
+        try:
+            await self.load_extension(module)
+        except commands.ExtensionError as error:
+            self.startup.failed.append(module)
+            logger.error("Error loading %s: %s", module, error)
+            return
+        end = self.startup.now()
+        cog_added = self._cog_added_at.get(module, end)
+        self.startup.modules[module] = (cog_added - start, end - cog_added)
+        logger.info("Loaded: %s", module)
 
 
 if __name__ == '__main__':
+    logs = setup_logging()
     if not discord_key:
-        print("You must set the DISCORD_KEY env variable.")
+        logger.error("You must set the DISCORD_KEY env variable.")
+        logs.stop()
         exit()
+    config_error = shard_config_error()
+    if config_error:
+        logger.error(config_error)
+        logs.stop()
+        exit(1)
     bot = Brobot()
-    bot.run(discord_key)
-else:
-    print("This class is not meant to be imported.")
-    exit()
+    # The queue handler from setup_logging is already on the root logger, discord.py shouldn't add its own
+    bot.run(discord_key, log_handler=None)
+    logs.stop()
@@ -1,63 +1,142 @@
 import discord
-import redis
 import calendar
+import logging
+import os
+import time
+from collections import OrderedDict
 from datetime import datetime
 from discord.ext import commands
-import os
 
-# TODO Make These configurable
-r_host = os.getenv('REDIS_HOST')
-REDIS_CONFIG = {"host": r_host, "port": 6379, "db": 6}
-HOURLY_STATS_KEY = "HOURLY"
-USER_STATS_KEY = "USER"
-MENTION_STATS_KEY = "MENTION"
-SEEN_KEY = "SEEN"
+from utils.journal import Journal
+from utils.keys import guild_key, home_guild_id, migrate_keys
+from utils.redis_service import UNAVAILABLE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Per-guild keys, see utils.keys
+HOURLY_STATS_KEY = "hourly"
+USER_STATS_KEY = "lines"
+MENTION_STATS_KEY = "mentions"
+SEEN_KEY = "seen"
+# Where the stats lived when the bot only served one guild
+LEGACY_KEYS = {HOURLY_STATS_KEY: "HOURLY", USER_STATS_KEY: "USER", MENTION_STATS_KEY: "MENTION", SEEN_KEY: "SEEN"}
 
 PLACING_EMOJIS = [":first_place:", ":second_place:", ":third_place:"]
 
+# Where stat updates wait while Redis is down, see utils.journal
+JOURNAL_PATH = os.getenv("ACTIVITY_JOURNAL_PATH", "activity_journal.jsonl")
+JOURNAL_MAX_ENTRIES = int(os.getenv("ACTIVITY_JOURNAL_MAX", "100000"))
+JOURNAL_RETRY_SECONDS = float(os.getenv("ACTIVITY_JOURNAL_RETRY_SECONDS", "5"))
+# How many answers are kept around to show while Redis is down
+SNAPSHOT_SIZE = 1000
+UNAVAILABLE_MESSAGE = "Stats are unavailable right now, try again in a bit."
+
 
 class ActivityTracker(commands.Cog, name="Activity Module"):
     """Tracks most active users, most mentions, and most active times of day"""
 
     def __init__(self, bot: commands.Bot):
-        self.redis = redis.Redis(**REDIS_CONFIG, decode_responses=True)
+        self.redis = bot.redis.db("activity")
         self.bot = bot
+        self._migrated = False
+        self.journal = Journal("activity", JOURNAL_PATH, JOURNAL_MAX_ENTRIES, bot.metrics,
+                               retry_seconds=JOURNAL_RETRY_SECONDS)
+        # (command, guild, target) -> (when, last answer from Redis)
+        self._snapshots: OrderedDict = OrderedDict()
+
+    async def cog_load(self):
+        self.journal.load()
+        self.journal.start(self.redis)
+
+    async def cog_unload(self):
+        await self.journal.stop()
+
+    @staticmethod
+    def key(guild_id: int, name: str) -> str:
+        return guild_key("activity", guild_id, name)
+
+    async def _read(self, snapshot_key: tuple, read):
+        """Runs read() against Redis, falling back to the last answer it gave while Redis is unavailable.
+
+        Returns (value, as_of), where as_of is None for a fresh answer and the unix time of the snapshot otherwise.
+        Raises the connection error if there is no snapshot to fall back to.
+        """
+        try:
+            value = await read()
+        except UNAVAILABLE_ERRORS:
+            if snapshot_key not in self._snapshots:
+                raise
+            return self._snapshots[snapshot_key][1], self._snapshots[snapshot_key][0]
+        self._snapshots[snapshot_key] = (int(time.time()), value)
+        self._snapshots.move_to_end(snapshot_key)
+        if len(self._snapshots) > SNAPSHOT_SIZE:
+            self._snapshots.popitem(last=False)
+        return value, None
+
+    @staticmethod
+    def _stale_note(as_of) -> str:
+        return "" if as_of is None else "Stats are catching up, this is from <t:{}:R>".format(as_of)
+
+    async def _top(self, ctx: commands.Context, title: str, stat: str):
+        """Sends the top three of one of the per-user sorted sets"""
+        key = self.key(ctx.guild.id, stat)
+        records, as_of = await self._read((stat, ctx.guild.id),
+                                          lambda: self.redis.zrevrange(key, 0, 2, withscores=True))
+        embed: discord.Embed = discord.Embed(title=title, description=self._stale_note(as_of) or None)
+        names = await self.bot.members.display_names(ctx.guild, [int(user_id) for user_id, _ in records])
+        for index, record in enumerate(records):
+            user_id, count = record
+            row_text = "{}".format(int(count))
+            embed.add_field(
+                name="{} - {}".format(PLACING_EMOJIS[index], names[int(user_id)]),
+                value=row_text, inline=False)
+        return await ctx.send(embed=embed)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Moves the stats from before they were kept per guild into the home guild"""
+        guild_id = home_guild_id(self.bot)
+        if self._migrated or guild_id is None:
+            return
+        self._migrated = True
+        moved, conflicts = await migrate_keys(
+            self.redis, [(old, self.key(guild_id, new)) for new, old in LEGACY_KEYS.items()])
+        if moved or conflicts:
+            logger.info("Migrated %d activity keys into guild %d (%d conflicts)", moved, guild_id, conflicts)
 
     @commands.command()
     @commands.guild_only()
     async def mentions(self, ctx: commands.Context, *, target: str = None):
         """Displays the top list of mentions or the number of mentions for the user"""
-        if target and target == "me":
-            result = int(self.redis.zscore(MENTION_STATS_KEY, ctx.author.id) or 0)
-            final_string = "You've been mentioned {} time{}".format(result, "s" if result != 1 else "")
-            return await ctx.send(final_string)
-        else:
-            embed: discord.Embed = discord.Embed(title="Most Mentioned Users")
-            for index, record in enumerate(self.redis.zrevrange(MENTION_STATS_KEY, 0, 2, withscores=True)):
-                user_id, count = record
-                row_text = "{}".format(int(count))
-                embed.add_field(
-                    name="{} - {}".format(PLACING_EMOJIS[index], ctx.guild.get_member(int(user_id)).display_name),
-                    value=row_text, inline=False)
-            return await ctx.send(embed=embed)
+        try:
+            if target and target == "me":
+                key = self.key(ctx.guild.id, MENTION_STATS_KEY)
+                result, as_of = await self._read((MENTION_STATS_KEY, ctx.guild.id, ctx.author.id),
+                                                 lambda: self.redis.zscore(key, ctx.author.id))
+                result = int(result or 0)
+                final_string = "You've been mentioned {} time{}".format(result, "s" if result != 1 else "")
+                return await ctx.send("\n".join(filter(None, [final_string, self._stale_note(as_of)])))
+            else:
+                return await self._top(ctx, "Most Mentioned Users", MENTION_STATS_KEY)
+        except UNAVAILABLE_ERRORS:
+            return await ctx.send(UNAVAILABLE_MESSAGE)
 
     @commands.command()
     @commands.guild_only()
     async def lines(self, ctx: commands.Context, *, target: str = None):
         """Displays the most talkative members or the number of lines for the user"""
-        if target and target == "me":
-            result = int(self.redis.zscore(USER_STATS_KEY, ctx.author.id) or 0)
-            final_string = "You've said {} line{}".format(result, "s" if result != 1 else "")
-            return await ctx.send(final_string)
-        else:
-            embed: discord.Embed = discord.Embed(title="Most Talkative Users")
-            for index, record in enumerate(self.redis.zrevrange(USER_STATS_KEY, 0, 2, withscores=True)):
-                user_id, count = record
-                row_text = "{}".format(int(count))
-                embed.add_field(
-                    name="{} - {}".format(PLACING_EMOJIS[index], ctx.guild.get_member(int(user_id)).display_name),
-                    value=row_text, inline=False)
-            return await ctx.send(embed=embed)
+        try:
+            if target and target == "me":
+                key = self.key(ctx.guild.id, USER_STATS_KEY)
+                result, as_of = await self._read((USER_STATS_KEY, ctx.guild.id, ctx.author.id),
+                                                 lambda: self.redis.zscore(key, ctx.author.id))
+                result = int(result or 0)
+                final_string = "You've said {} line{}".format(result, "s" if result != 1 else "")
+                return await ctx.send("\n".join(filter(None, [final_string, self._stale_note(as_of)])))
+            else:
+                return await self._top(ctx, "Most Talkative Users", USER_STATS_KEY)
+        except UNAVAILABLE_ERRORS:
+            return await ctx.send(UNAVAILABLE_MESSAGE)
 
     @commands.command()
     @commands.guild_only()
@@ -70,13 +149,19 @@ class ActivityTracker(commands.Cog, name="Activity Module"):
             return
 
         target_user: discord.Member = mentions[0]
-        last_seen = self.redis.hget(SEEN_KEY, target_user.id)
+        key = self.key(ctx.guild.id, SEEN_KEY)
+        try:
+            last_seen, as_of = await self._read((SEEN_KEY, ctx.guild.id, target_user.id),
+                                                lambda: self.redis.hget(key, target_user.id))
+        except UNAVAILABLE_ERRORS:
+            return await ctx.send(UNAVAILABLE_MESSAGE)
         if last_seen:
             utc, message = last_seen.split("::")
             dt_object = datetime.fromtimestamp(int(utc))
             time_str = dt_object.strftime("%Y-%m-%d %H:%M:%S")
-            return await ctx.send(
-                "Last time I saw {} was on {} saying {}".format(target_user.display_name, time_str, message))
+            return await ctx.send("\n".join(filter(None, [
+                "Last time I saw {} was on {} saying {}".format(target_user.display_name, time_str, message),
+                self._stale_note(as_of)])))
         else:
             return await ctx.send("I don't have anything for that user.")
 
@@ -89,15 +174,19 @@ class ActivityTracker(commands.Cog, name="Activity Module"):
         if author.bot or message.content.startswith("!") or not isinstance(message.channel, discord.TextChannel):
             return
 
+        guild_id = message.guild.id
         now: datetime = datetime.now()
-        self.redis.hincrby(HOURLY_STATS_KEY, now.hour, 1)
-        self.redis.zincrby(USER_STATS_KEY, 1, author.id)
+        # All of a message's updates are applied together, or journaled together while Redis is down
+        ops = [
+            ("HINCRBY", self.key(guild_id, HOURLY_STATS_KEY), now.hour, 1),
+            ("ZINCRBY", self.key(guild_id, USER_STATS_KEY), 1, author.id),
+        ]
 
         if message.mentions:
             for mention in message.mentions:
                 # Excludes mentions of the bot since we who care
                 if not mention.bot:
-                    self.redis.zincrby(MENTION_STATS_KEY, 1, mention.id)
+                    ops.append(("ZINCRBY", self.key(guild_id, MENTION_STATS_KEY), 1, mention.id))
 
         # Seen data
         channel: discord.TextChannel = message.channel
@@ -105,7 +194,8 @@ class ActivityTracker(commands.Cog, name="Activity Module"):
             dt: datetime = datetime.now()
             gmt = calendar.timegm(dt.utctimetuple())
             result = "{}::{}".format(gmt, message.content)
-            self.redis.hset(SEEN_KEY, author.id, result)
+            ops.append(("HSET", self.key(guild_id, SEEN_KEY), author.id, result))
+        await self.journal.write(self.redis, self.key(guild_id, "journal"), ops)
 
 
 async def setup(bot: commands.Bot):
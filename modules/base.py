@@ -1,3 +1,4 @@
+import discord
 from discord.ext import commands
 
 
@@ -10,6 +11,30 @@ class BaseModule(commands.Cog, name="Base Module"):
     async def ping(self, ctx: commands.Context):
         await ctx.send("pong")
 
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def jobs(self, ctx: commands.Context):
+        """Lists the scheduled background jobs in this process"""
+        jobs = self.bot.scheduler.status() if self.bot.scheduler else []
+        if not jobs:
+            return await ctx.send("No jobs scheduled.")
+        embed = discord.Embed(title="Scheduled jobs")
+        for job in jobs[:25]:
+            lines = ["{} · next {}".format(job.schedule, "<t:{}:R>".format(int(job.next_run)) if job.next_run else "-")]
+            summary = "{} runs, {} failed".format(job.runs, job.failures)
+            if job.skipped:
+                summary += ", {} skipped".format(job.skipped)
+            if job.last_duration is not None:
+                summary += " · last took {:.0f} ms".format(job.last_duration * 1000)
+            if job.running:
+                summary += " · running now"
+            lines.append(summary)
+            if job.last_error:
+                lines.append("Last error: {}".format(job.last_error[:200]))
+            embed.add_field(name=job.name, value="\n".join(lines), inline=False)
+        await ctx.send(embed=embed)
+
     #@commands.Cog.listener()
     #async def on_message(self, message: discord.Message):
     #    """Demo for listening to all messages in a module"""
@@ -1,34 +1,163 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import time
 from datetime import datetime
-from typing import List
+from typing import Callable, List, Optional
 
-import requests
+import aiohttp
 import discord
 from discord.ext import commands
 
+from utils.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
 EGS_URL = url = "https://store-site-backend-static.ak.epicgames.com/freeGamesPromotions"
 EGS_PARAMS = {"allowCountries": "US", "country": "US", "locale": "en-US"}
+# Promotions change about once a week, polling this often catches them within the hour
+POLL_SECONDS = float(os.getenv("EGS_POLL_SECONDS", "1800"))
+# Where new free games are announced, 0 to not announce
+ANNOUNCE_CHANNEL_ID = int(os.getenv("EGS_ANNOUNCE_CHANNEL_ID", "0"))
+# Redis key claimed per announced fingerprint, so each change is announced once across processes and restarts
+ANNOUNCED_KEY = "egs:announced:{}"
+ANNOUNCED_TTL_SECONDS = 30 * 24 * 60 * 60
+
+
+def fingerprint(game_list: dict, image: Optional[str]) -> str:
+    """Identifies what the embed would show, ignoring payload changes that don't affect it"""
+    return hashlib.sha1(json.dumps([game_list, image], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def build_embed(game_list: dict, image: Optional[str]) -> discord.Embed:
+    embed: discord.Embed = discord.Embed(title="Free Epic games")
+    embed.set_image(url=image)
+    for day, games in game_list["current"].items():
+        embed.add_field(name="Free Until {}".format(day), value="\n".join(games), inline=False)
+    for day, games in game_list["upcomming"].items():
+        embed.add_field(name="Free Starting {}".format(day), value="\n".join(games), inline=False)
+    return embed
+
+
+class PromotionsPoller:
+    """Fetches the promotions endpoint and works out whether anything changed since the last poll.
+
+    The cheap cases are checked first. The request is conditional, so an unchanged payload can come back as a bodiless
+    304. A 200 whose body hashes the same as last time isn't parsed. Only a new body is parsed and fingerprinted, and
+    only a new fingerprint counts as a change.
+    """
+
+    def __init__(self, metrics: Metrics, session: Callable[[], aiohttp.ClientSession], url: str = EGS_URL):
+        self.session = session
+        self.url = url
+        self.fingerprint: Optional[str] = None
+        self.embed: Optional[discord.Embed] = None
+        self.updated_at: Optional[float] = None
+        self._validators: dict = {}
+        self._digest: Optional[str] = None
+        self._polls = metrics.counter("brobot_egs_polls_total", "Epic promotions polls by outcome", ["result"])
+        self._duration = metrics.histogram("brobot_egs_poll_seconds", "Time an Epic promotions poll took",
+                                           ["result"])
+        self._bytes = metrics.counter("brobot_egs_poll_bytes_total", "Bytes downloaded by Epic promotions polls")
+
+    async def poll(self) -> str:
+        """One of "not_modified", "unchanged" or "changed". Raises if the fetch or parse fails."""
+        started = time.perf_counter()
+        result = "failed"
+        try:
+            result = await self._poll()
+            return result
+        finally:
+            self._polls.inc(result)
+            self._duration.observe(result, value=time.perf_counter() - started)
+
+    async def _poll(self) -> str:
+        async with self.session().get(self.url, params=EGS_PARAMS, headers=self._validators) as response:
+            if response.status == 304:
+                return "not_modified"
+            response.raise_for_status()
+            body = await response.read()
+            validators = {"If-None-Match": response.headers.get("ETag"),
+                          "If-Modified-Since": response.headers.get("Last-Modified")}
+        self._bytes.inc(amount=len(body))
+        digest = hashlib.sha1(body).hexdigest()
+        if digest == self._digest:
+            self._validators = self._next_validators(validators)
+            return "unchanged"
+        game_list, image = parse_game_list(json.loads(body))
+        # Only once the body has parsed, a payload that failed shouldn't come back as a 304 next time
+        self._digest = digest
+        self._validators = self._next_validators(validators)
+        new_fingerprint = fingerprint(game_list, image)
+        if new_fingerprint == self.fingerprint:
+            return "unchanged"
+        self.fingerprint = new_fingerprint
+        self.embed = build_embed(game_list, image)
+        self.updated_at = time.time()
+        return "changed"
+
+    @staticmethod
+    def _next_validators(validators: dict) -> dict:
+        return {name: value for name, value in validators.items() if value}
+
 
 class EGS(commands.Cog, name="Epic Game Store Games"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.poller = PromotionsPoller(bot.metrics, lambda: bot.session)
+        self._startup: Optional[asyncio.Task] = None
+
+    async def cog_load(self):
+        self.bot.scheduler.every("egs:poll", POLL_SECONDS, self.poll, jitter=POLL_SECONDS / 10)
+        # The first poll can't wait for the schedule, !egs has nothing to show until it's done
+        self._startup = asyncio.create_task(self._poll_when_ready())
+
+    async def cog_unload(self):
+        await self.bot.scheduler.cancel("egs:poll")
+        if self._startup is not None:
+            self._startup.cancel()
+
+    async def _poll_when_ready(self):
+        await self.bot.wait_until_ready()
+        await self.poll()
+
+    async def poll(self):
+        try:
+            result = await self.poller.poll()
+        except Exception as error:
+            # Keep showing the last promotions we saw
+            logger.warning("Could not poll Epic promotions: %s", error)
+            return
+        if result == "changed":
+            await self._announce(self.poller.fingerprint, self.poller.embed)
+
+    async def _announce(self, new_fingerprint: str, embed: discord.Embed):
+        channel = self.bot.get_channel(ANNOUNCE_CHANNEL_ID) if ANNOUNCE_CHANNEL_ID else None
+        if channel is None:
+            return
+        try:
+            claimed = await self.bot.coordination.set(ANNOUNCED_KEY.format(new_fingerprint), int(time.time()),
+                                                      nx=True, ex=ANNOUNCED_TTL_SECONDS)
+        except Exception as error:
+            # Better to miss an announcement than to repeat one in every process
+            logger.warning("Could not claim the Epic announcement, skipping it: %s", error)
+            return
+        if claimed:
+            await self.bot.outbound.submit(("message", channel.id), functools.partial(channel.send, embed=embed))
 
     @commands.command()
     @commands.guild_only()
     async def egs(self, ctx: commands.Context):
         """Returns free game info from epic g ames"""
-        embed: discord.Embed = discord.Embed(title="Free Epic games")
-        game_list, image_to_display = get_game_list()
-        embed.set_image(url=image_to_display)
-        for day, games in game_list["current"].items():
-            embed.add_field(name="Free Until {}".format(day), value="\n".join(games), inline=False)
-        for day, games in game_list["upcomming"].items():
-            embed.add_field(name="Free Starting {}".format(day), value="\n".join(games), inline=False)
-
-        return await ctx.send(embed=embed)
+        if self.poller.embed is None:
+            return await ctx.send("I haven't got the Epic free games yet, try again in a bit.")
+        return await ctx.send(embed=self.poller.embed)
 
 
-def get_game_list():
-    res = requests.get(EGS_URL, params=EGS_PARAMS).json()
+def parse_game_list(res: dict):
     games = {
         "current": {},
         "upcomming": {}
@@ -1,55 +1,310 @@
+import asyncio
+import bisect
+import copy
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import aiohttp
 import discord
-import requests
 from discord.ext import commands
 
-NEXT_RACE_URL = "http://ergast.com/api/f1/current/next.json"
+from utils.reminders import send_reminders
+
+logger = logging.getLogger(__name__)
+
+# Any Ergast-compatible API, such as the Jolpica mirror at https://api.jolpi.ca/ergast/f1
+F1_API_URL = os.getenv("F1_API_URL", "http://ergast.com/api/f1").rstrip("/")
+# The season calendar and standings, kept on disk so a restart can answer before the first refresh
+F1_CACHE_PATH = os.getenv("F1_CACHE_PATH", "f1_cache.json")
+F1_REFRESH_SECONDS = float(os.getenv("F1_REFRESH_SECONDS", str(24 * 60 * 60)))
+# A race counts as the next one until this long after its start
+RACE_LENGTH_SECONDS = 2 * 60 * 60
+STANDINGS_SHOWN = 10
+# Timer kind for !f1 remind, see utils/timers.py
+REMINDER_KIND = "f1"
+# What !f1 remind takes, mapped to the race's key for that session in the API
+SESSIONS = {"race": "Race", "qualifying": "Qualifying", "sprint": "Sprint", "sprint-qualifying": "SprintQualifying",
+            "fp1": "FirstPractice", "fp2": "SecondPractice", "fp3": "ThirdPractice"}
+SESSION_NAMES = {"FirstPractice": "Practice 1", "SecondPractice": "Practice 2", "ThirdPractice": "Practice 3",
+                 "SprintQualifying": "Sprint Qualifying", "Sprint": "Sprint", "Qualifying": "Qualifying",
+                 "Race": "Race"}
+
+
+class Race(NamedTuple):
+    round: int
+    name: str
+    circuit: str
+    locality: str
+    country: str
+    # (API session key, unix start time), in order, ending with the race itself
+    sessions: Tuple[Tuple[str, float], ...]
+
+    @property
+    def start(self) -> float:
+        return self.sessions[-1][1]
+
+    def session_start(self, session: str) -> Optional[float]:
+        return next((start for key, start in self.sessions if key == session), None)
+
+
+class Calendar:
+    """A season's races and standings, as fetched from the API"""
+
+    def __init__(self, season: str, races: List[Race], drivers: List[Tuple[int, str, str, float]],
+                 constructors: List[Tuple[int, str, float]], fetched_at: float):
+        self.season = season
+        self.races: Tuple[Race, ...] = tuple(sorted(races))
+        # When each race stops being the next one, for bisect
+        self.ends: List[float] = [race.start + RACE_LENGTH_SECONDS for race in self.races]
+        # (position, driver, team, points) and (position, team, points)
+        self.drivers = tuple(drivers)
+        self.constructors = tuple(constructors)
+        self.fetched_at = fetched_at
+
+    def next_race(self, now: float) -> Optional[Race]:
+        index = bisect.bisect_right(self.ends, now)
+        return self.races[index] if index < len(self.races) else None
+
+    def to_json(self) -> dict:
+        return {"season": self.season, "fetched_at": self.fetched_at, "races": self.races, "drivers": self.drivers,
+                "constructors": self.constructors}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Calendar":
+        races = [Race(number, name, circuit, locality, country, tuple(tuple(session) for session in sessions))
+                 for number, name, circuit, locality, country, sessions in data["races"]]
+        return cls(data["season"], races, [tuple(row) for row in data["drivers"]],
+                   [tuple(row) for row in data["constructors"]], data["fetched_at"])
+
+    @classmethod
+    def from_api(cls, schedule: dict, drivers: dict, constructors: dict) -> "Calendar":
+        table = schedule["MRData"]["RaceTable"]
+        races = []
+        for race in table["Races"]:
+            sessions = []
+            for key in SESSION_NAMES:
+                entry = race if key == "Race" else race.get(key)
+                if entry and "time" in entry:
+                    sessions.append((key, _timestamp(entry["date"], entry["time"])))
+            if not sessions or sessions[-1][0] != "Race":
+                # No confirmed race time yet, leave the round out until there is one
+                continue
+            sessions.sort(key=lambda session: session[1])
+            location = race["Circuit"]["Location"]
+            races.append(Race(int(race["round"]), race["raceName"], race["Circuit"]["circuitName"],
+                              location["locality"], location["country"], tuple(sessions)))
+        return cls(table["season"], races, _standings(drivers, "DriverStandings", lambda row: (
+            "{} {}".format(row["Driver"]["givenName"], row["Driver"]["familyName"]),
+            row["Constructors"][-1]["name"] if row["Constructors"] else "")),
+                   _standings(constructors, "ConstructorStandings", lambda row: (row["Constructor"]["name"],)),
+                   time.time())
+
+
+def _timestamp(date: str, clock: str) -> float:
+    return datetime.strptime("{}T{}".format(date, clock.rstrip("Z")), "%Y-%m-%dT%H:%M:%S").replace(
+        tzinfo=timezone.utc).timestamp()
+
+
+def _standings(data: dict, key: str, describe) -> list:
+    lists = data["MRData"]["StandingsTable"]["StandingsLists"]
+    if not lists:
+        return []
+    return [(int(row["position"]), *describe(row), float(row["points"])) for row in lists[0][key]]
+
+
+async def fetch_calendar(session: aiohttp.ClientSession, base_url: str = F1_API_URL) -> Calendar:
+    async def fetch(path: str) -> dict:
+        async with session.get("{}/{}".format(base_url, path)) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    schedule, drivers, constructors = await asyncio.gather(
+        fetch("current.json"), fetch("current/driverStandings.json"), fetch("current/constructorStandings.json"))
+    return Calendar.from_api(schedule, drivers, constructors)
+
+
+def load_calendar(path: str = F1_CACHE_PATH) -> Optional[Calendar]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return Calendar.from_json(json.load(f))
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as error:
+        logger.warning("Ignoring the F1 cache at %s: %s", path, error)
+        return None
+
+
+def save_calendar(calendar: Calendar, path: str = F1_CACHE_PATH):
+    # Written next to the cache and swapped in, so a crash never leaves half a file
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(calendar.to_json(), f, separators=(",", ":"), ensure_ascii=False)
+    os.replace(temporary, path)
+
+
+def countdown(seconds: float) -> str:
+    if seconds <= 0:
+        return "now"
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    parts = ["{}d".format(days)] if days else []
+    if days or hours:
+        parts.append("{}h".format(hours))
+    parts.append("{}m".format(minutes))
+    return "in " + " ".join(parts)
+
+
+def race_embed(season: str, race: Race) -> discord.Embed:
+    """Everything about a race that doesn't change between calendar refreshes"""
+    embed = discord.Embed(title="[#{}] {} **{}**".format(race.round, season, race.name))
+    embed.add_field(name="Circuit", value=race.circuit, inline=False)
+    embed.add_field(name="Location", value="{}, {}".format(race.locality, race.country), inline=False)
+    embed.add_field(name="Sessions", value="\n".join(
+        "{}: {}".format(SESSION_NAMES[key], discord.utils.format_dt(datetime.fromtimestamp(start, timezone.utc), "f"))
+        for key, start in race.sessions), inline=False)
+    return embed
+
+
+def next_race_embed(calendar: Calendar, embeds: Dict[int, discord.Embed], now: float) -> Optional[discord.Embed]:
+    """The next race's embed from embeds (built on first use), plus a countdown to its next session"""
+    race = calendar.next_race(now)
+    if race is None:
+        return None
+    embed = embeds.get(race.round)
+    if embed is None:
+        embed = embeds[race.round] = race_embed(calendar.season, race)
+    # Embed.copy() shares the field list with the cached embed, so copy the fields too
+    embed = discord.Embed.from_dict(copy.deepcopy(embed.to_dict()))
+    upcoming = next(((key, start) for key, start in race.sessions if start > now), None)
+    if upcoming is not None:
+        embed.add_field(name="Next up", value="{} {}".format(SESSION_NAMES[upcoming[0]], countdown(upcoming[1] - now)),
+                        inline=False)
+    return embed
 
 
 class F1(commands.Cog, name="Formula1 Module"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.calendar: Optional[Calendar] = None
+        # race round -> embed without the countdown, rebuilt when the calendar is
+        self._embeds: Dict[int, discord.Embed] = {}
+        self._startup: Optional[asyncio.Task] = None
 
-    @commands.command()
-    @commands.guild_only()
-    async def f1(self, ctx: commands.Context):
-        """Returns the next F1 race information."""
-        next_race = get_next_race()
-        if not next_race:
-            return await ctx.send("No upcomming race.")
-        return await ctx.send(embed=next_race)
+    async def cog_load(self):
+        self._set_calendar(await asyncio.to_thread(load_calendar))
+        self.bot.timers.register(REMINDER_KIND, self._remind)
+        self.bot.scheduler.every("f1:refresh", F1_REFRESH_SECONDS, self.refresh, jitter=60)
+        if self.calendar is None or time.time() - self.calendar.fetched_at > F1_REFRESH_SECONDS:
+            # The daily job could be most of a day away
+            self._startup = asyncio.create_task(self._refresh_when_ready())
 
+    async def cog_unload(self):
+        self.bot.timers.unregister(REMINDER_KIND)
+        await self.bot.scheduler.cancel("f1:refresh")
+        if self._startup is not None:
+            self._startup.cancel()
 
-async def setup(bot: commands.Bot):
-    await bot.add_cog(F1(bot))
+    async def _refresh_when_ready(self):
+        await self.bot.wait_until_ready()
+        await self.refresh()
 
+    async def refresh(self):
+        try:
+            calendar = await fetch_calendar(self.bot.session)
+        except Exception as error:
+            # Keep answering from the calendar we have
+            logger.warning("Could not refresh the F1 calendar: %s", error)
+            return
+        self._set_calendar(calendar)
+        await asyncio.to_thread(save_calendar, calendar)
+        try:
+            await self._move_reminders(calendar)
+        except Exception as error:
+            logger.warning("Could not move F1 reminders: %s", error)
 
-def get_next_race():
-    api_result = requests.get(NEXT_RACE_URL)
+    def _set_calendar(self, calendar: Optional[Calendar]):
+        self.calendar = calendar
+        self._embeds = {}
 
-    if api_result.ok:
-        root: dict = api_result.json()["MRData"]
-        if int(root["total"]) > 0:
-            race_table = root["RaceTable"]
-            race = race_table["Races"][0]
-            location_info = race["Circuit"]["Location"]
+    async def _move_reminders(self, calendar: Calendar):
+        """Follows sessions that moved since the reminders for them were set"""
+        rounds = {race.round: race for race in calendar.races}
+        moves = {}
+        for timer in await self.bot.timers.pending(REMINDER_KIND):
+            season, number, session = timer["key"].split("-", 2)
+            race = rounds.get(int(number)) if season == calendar.season else None
+            start = race.session_start(SESSIONS[session]) if race else None
+            if start is not None and start != timer["due"]:
+                moves[timer["id"]] = start
+        await self.bot.timers.reschedule(REMINDER_KIND, moves)
 
-            ret_val: discord.Embed = discord.Embed(title="[#{race_num}] {season} **{race_name}**".format(
-                race_num=race_table["round"],
-                season=race_table["season"],
-                race_name=race["raceName"],
-            ))
+    async def cog_check(self, ctx: commands.Context) -> bool:
+        if self.calendar is None:
+            await ctx.send("The F1 calendar hasn't loaded yet, try again in a bit.")
+            return False
+        return True
 
-            ret_val.add_field(name="Circuit", value=race["Circuit"]["circuitName"], inline=False)
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
+    async def f1(self, ctx: commands.Context):
+        """Returns the next F1 race information."""
+        embed = next_race_embed(self.calendar, self._embeds, time.time())
+        if embed is None:
+            return await ctx.send("No upcomming race.")
+        return await ctx.send(embed=embed)
+
+    @f1.command()
+    async def schedule(self, ctx: commands.Context):
+        """Lists every race this season"""
+        now = time.time()
+        lines = []
+        for race, end in zip(self.calendar.races, self.calendar.ends):
+            line = "{}. {} {}".format(race.round, race.name, discord.utils.format_dt(
+                datetime.fromtimestamp(race.start, timezone.utc), "d"))
+            lines.append("~~{}~~".format(line) if end <= now else line)
+        embed = discord.Embed(title="{} F1 calendar".format(self.calendar.season), description="\n".join(lines))
+        return await ctx.send(embed=embed)
+
+    @f1.command()
+    async def standings(self, ctx: commands.Context):
+        """Shows the drivers' and constructors' championships"""
+        embed = discord.Embed(title="{} F1 standings".format(self.calendar.season))
+        embed.add_field(name="Drivers", value="\n".join(
+            "{}. {} ({}) {:g}".format(position, driver, team, points)
+            for position, driver, team, points in self.calendar.drivers[:STANDINGS_SHOWN]) or "-")
+        embed.add_field(name="Constructors", value="\n".join(
+            "{}. {} {:g}".format(position, team, points)
+            for position, team, points in self.calendar.constructors[:STANDINGS_SHOWN]) or "-")
+        return await ctx.send(embed=embed)
 
-            ret_val.add_field(name="Location", value="{locality}, {country}".format(
-                locality=location_info["locality"],
-                country=location_info["country"]), inline=False)
+    @f1.command()
+    async def remind(self, ctx: commands.Context, session: str = "race"):
+        """Pings you here when the next race (or qualifying, sprint, fp1...) starts"""
+        session = session.lower()
+        if session not in SESSIONS:
+            return await ctx.send("Pick one of: {}".format(", ".join(SESSIONS)))
+        now = time.time()
+        race = self.calendar.next_race(now)
+        start = race.session_start(SESSIONS[session]) if race else None
+        if start is None or start <= now:
+            return await ctx.send("The next race has no upcoming {}.".format(session))
+        key = "{}-{}-{}".format(self.calendar.season, race.round, session)
+        timer_id = "{}:{}:{}".format(ctx.guild.id, ctx.author.id, key)
+        await self.bot.timers.add(REMINDER_KIND, timer_id, start, {
+            "guild": ctx.guild.id, "channel": ctx.channel.id, "user": ctx.author.id, "key": key,
+            "race": race.name, "session": session})
+        return await ctx.send("I'll ping you here when the {} {} starts, {}.".format(
+            race.name, session, discord.utils.format_dt(datetime.fromtimestamp(start, timezone.utc), "R")))
 
-            ret_val.add_field(name="Time", value="{date} {time}".format(
-                date=race["date"],
-                time=race["time"]
-            ), inline=False)
+    async def _remind(self, timers: List[dict]):
+        await send_reminders(self.bot, "f1 reminders", timers, lambda timer: "The **{}** {} is starting now!".format(
+            timer["race"], timer["session"]))
 
-            return ret_val
 
-    return None
+async def setup(bot: commands.Bot):
+    await bot.add_cog(F1(bot))
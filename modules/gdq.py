@@ -1,153 +1,321 @@
+import asyncio
+import bisect
+import logging
+import os
 import random
 import re
-from datetime import datetime, timedelta, timezone
-from typing import List, Tuple
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
 
+import aiohttp
 import discord
-import requests
-from bs4 import BeautifulSoup
 from discord.ext import commands
 
+from utils.executor import ParseExecutor
+from utils.parsers import ScheduleRow
+from utils.reminders import send_reminders
 
-class GDQ(commands.Cog, name="GDQ Information"):
-    def __init__(self, bot: commands.Bot):
-        self.bot = bot
+logger = logging.getLogger(__name__)
 
-    @commands.command()
-    @commands.guild_only()
-    async def gdq(self, ctx: commands.Context, *, question=None):
-        """Gets information about the current or next GDQ"""
-        embed: discord.Embed = discord.Embed(title="Games Done Quick")
+HOME_URL = "https://gamesdonequick.com"
+SCHEDULE_URL = "https://gamesdonequick.com/schedule"
+TWITCH_URL = "http://www.twitch.tv/gamesdonequick"
+# The schedule is fetched and indexed this often in the background, commands only read the index
+REFRESH_SECONDS = float(os.getenv("GDQ_REFRESH_SECONDS", "300"))
+UPCOMING_DEFAULT = 5
+UPCOMING_MAX = 15
+SEARCH_LIMIT = 5
+# Timer kind for !gdq remind, see utils/timers.py
+REMINDER_KIND = "gdq"
 
-        gdq_info: List[Tuple[str, str]] = get_gdq_info()
 
-        image_url = "https://static-cdn.jtvnw.net/previews-ttv/live_user_gamesdonequick-1280x720.jpg?x={}".format(
-            random.randint(1, 1000))
+class Run(NamedTuple):
+    # Unix times
+    start: float
+    end: float
+    game: str
+    runners: str
+    estimate: str
+    category: str
 
-        embed.set_image(url=image_url)
 
-        for field_name, data in gdq_info:
-            embed.add_field(name=field_name, value=data, inline=False)
+def run_key(run: Run) -> str:
+    """Names a run across refreshes, which can move its start time"""
+    return "{}|{}".format(run.game.casefold(), run.category.casefold())
 
-        return await ctx.send(embed=embed)
 
+def _estimate_seconds(estimate: str) -> int:
+    hours, minutes, seconds = (int(part) for part in estimate.split(":"))
+    return hours * 3600 + minutes * 60 + seconds
 
-async def setup(bot: commands.Bot):
-    await bot.add_cog(GDQ(bot))
 
+class Schedule:
+    """One event's runs, sorted by start time so the current and next run are a bisect away"""
+
+    def __init__(self, runs: Sequence[Run], event_text: str, event_start: Optional[datetime], fetched_at: float):
+        self.runs: Tuple[Run, ...] = tuple(sorted(runs))
+        self.starts: List[float] = [run.start for run in self.runs]
+        # Case-folded once here rather than on every search
+        self._games: List[str] = [run.game.casefold() for run in self.runs]
+        self.by_key: Dict[str, Run] = {}
+        for run in self.runs:
+            self.by_key.setdefault(run_key(run), run)
+        self.event_text = event_text
+        self.event_start = event_start
+        self.fetched_at = fetched_at
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[ScheduleRow], event_text: str = "??", event_start: Optional[datetime] = None,
+                  fetched_at: Optional[float] = None) -> "Schedule":
+        runs = []
+        for start_text, game, runners, estimate, category in rows:
+            try:
+                start = datetime.strptime(start_text, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+            except ValueError:
+                continue
+            try:
+                end = start + _estimate_seconds(estimate)
+            except ValueError:
+                # No usable estimate, the run can be listed but is never the current one
+                end = start
+            runs.append(Run(start, end, game, runners, estimate, category))
+        return cls(runs, event_text, event_start, time.time() if fetched_at is None else fetched_at)
+
+    def current(self, now: float) -> Optional[Run]:
+        """The run going on at now, None between runs (setup) or outside the event"""
+        index = bisect.bisect_right(self.starts, now) - 1
+        if index >= 0 and self.runs[index].end > now:
+            return self.runs[index]
+        return None
 
-def GDQdatetime():
+    def upcoming(self, now: float, count: int) -> Tuple[Run, ...]:
+        index = bisect.bisect_right(self.starts, now)
+        return self.runs[index:index + count]
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> List[Run]:
+        query = query.casefold()
+        return [self.runs[index] for index, game in enumerate(self._games) if query in game][:limit]
+
+    def days_until(self, now: float) -> Optional[int]:
+        if self.event_start is not None:
+            return (self.event_start - datetime.fromtimestamp(now, timezone.utc)).days
+        if self.runs and self.runs[0].start > now:
+            return int((self.runs[0].start - now) // 86400)
+        return None
+
+
+def next_event(dtext: Optional[str], now: datetime) -> Tuple[str, Optional[datetime]]:
+    """A readable date for the next event and when it starts, from the date line on the GDQ home page"""
     # From https://github.com/dasu/syrup-sopel-modules/blob/master/gdq.py
-    now = datetime.utcnow()
-    now = now.replace(tzinfo=timezone.utc)
-    try:
-        url = "https://gamesdonequick.com"
-        req = requests.get(url).content
-        bs = BeautifulSoup(req, "html.parser")
-        dtext = bs.h5.findNext("p").text
-    except:
-        if datetime.now().month >= 5:
-            nextgdqstartest = "Early January"
-        else:
-            nextgdqstartest = "Early June"
-        delta = None
-        return now, delta, nextgdqstartest
+    if dtext is None:
+        return ("Early January" if now.month >= 5 else "Early June"), None
     begdtext = re.sub(r' ?- ?.*?,', ',', dtext)
     fdtext = re.sub(r'(?<=\d)(st|nd|rd|th)', '', begdtext)
     try:
-        gdqs = (datetime.strptime(fdtext, "%B %d, %Y")).replace(tzinfo=timezone.utc)
-        delta = gdqs - now
-        nextgdqstartest = fdtext.split(',')[0]
-    except:
-        nextgdqstartest = fdtext
-        delta = None
-    return now, delta, nextgdqstartest
+        start = datetime.strptime(fdtext, "%B %d, %Y").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return fdtext, None
+    return fdtext.split(',')[0], start
 
 
-def getinfo(run, now):
-    # From https://github.com/dasu/syrup-sopel-modules/blob/master/gdq.py
-    schedule = run.find_all('tr', attrs={'class': None})
-    game, runner, console, comment, eta, nextgame, nextrunner, nextconsole, nexteta, nextcomment = '', '', '', '', '', '', '', '', '', ''
-    for item in schedule:
-        group = item.find_all('td')
+async def fetch_schedule(session: aiohttp.ClientSession, parsers: ParseExecutor) -> Schedule:
+    """Fetches both pages and builds the index. Raises if the schedule can't be fetched or parsed."""
+
+    async def fetch(url: str) -> bytes:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    home, page = await asyncio.gather(fetch(HOME_URL), fetch(SCHEDULE_URL), return_exceptions=True)
+    if isinstance(page, BaseException):
+        raise page
+    try:
+        dtext = None if isinstance(home, BaseException) else await parsers.run("gdq_next_event", home)
+    except Exception as error:
+        logger.warning("Could not read the next GDQ date: %s", error)
+        dtext = None
+    # The full schedule table is a big page, parse it off the event loop
+    rows = await parsers.run("gdq_schedule", page)
+    event_text, event_start = next_event(dtext, datetime.now(timezone.utc))
+    return Schedule.from_rows(rows, event_text, event_start)
+
+
+def format_run(run: Run, style: str = "t") -> str:
+    """One line per run, with the start time in each reader's own timezone"""
+    start = datetime.fromtimestamp(run.start, timezone.utc)
+    category = " ({})".format(run.category) if run.category else ""
+    return "{} {}{} by {}, est. {}".format(discord.utils.format_dt(start, style), run.game, category, run.runners,
+                                            run.estimate)
+
+
+def schedule_fields(schedule: Schedule, now: float) -> List[Tuple[str, str]]:
+    """The embed fields for !gdq"""
+    days = schedule.days_until(now)
+    event_items = [("Next GDQ", schedule.event_text), ("Days Until", str(days) if days is not None else "??")]
+    schedule_item = ("Schedule", SCHEDULE_URL)
+    if not schedule.runs or now >= schedule.runs[-1].end:
+        return event_items
+    if now < schedule.starts[0]:
+        return event_items + [schedule_item]
+
+    current = schedule.current(now)
+    upcoming = schedule.upcoming(now, 1)
+    items = []
+    if current is None:
+        items.append(("Current Game", "setup??"))
+    else:
+        items.append(("Current Game", current.game + (" ({})".format(current.category) if current.category else "")))
+        if current.runners:
+            items.append(("Runner", current.runners))
+        if current.estimate:
+            items.append(("ETA", current.estimate))
+    if upcoming:
+        items.append(("Next Game", upcoming[0].game))
+        if upcoming[0].runners:
+            items.append(("Next Runner", upcoming[0].runners))
+    return items + [("TTV", TWITCH_URL), schedule_item]
+
+
+class GDQ(commands.Cog, name="GDQ Information"):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.schedule: Optional[Schedule] = None
+        self._refreshing: Optional[asyncio.Task] = None
+
+    async def cog_load(self):
+        self.bot.scheduler.every("gdq:refresh", REFRESH_SECONDS, self.refresh, jitter=REFRESH_SECONDS / 10)
+        self.bot.timers.register(REMINDER_KIND, self._remind)
+
+    async def cog_unload(self):
+        self.bot.timers.unregister(REMINDER_KIND)
+        await self.bot.scheduler.cancel("gdq:refresh")
+
+    async def refresh(self):
+        """Fetches a new schedule, joining one that's already being fetched"""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._refresh())
+        await asyncio.shield(self._refreshing)
+
+    async def _refresh(self):
         try:
-            group2 = item.find_next_sibling().find_all('td')
-        except:
-            nextgame = False
-            return (game, runner, console, comment, eta, nextgame, nextrunner, nexteta, nextconsole, nextcomment)
-        st = group[0].getText()
-        # estfix = timedelta(hours=-5)
-        starttime = datetime.strptime(st, '%Y-%m-%dT%H:%M:%SZ')
-        starttime = starttime.replace(tzinfo=timezone.utc)
-        # starttime = starttime + estfix
+            self.schedule = await fetch_schedule(self.bot.session, self.bot.parsers)
+        except Exception as error:
+            # Keep answering from the last schedule we had
+            logger.warning("Could not refresh the GDQ schedule: %s", error)
+            return
         try:
-            offset = datetime.strptime(group2[0].getText().strip(), "%H:%M:%S")
-            endtime = starttime + timedelta(hours=offset.hour, minutes=offset.minute, seconds=offset.second)
-        except:
-            endtime = datetime(2011, 1, 1, 12, 00)
-        if starttime < now and endtime > now:
-            game = group[1].getText()
-            runner = group[2].getText()
-            # console = group[3].getText()
-            comment = group2[1].getText()
-            eta = group2[0].getText().strip()
-        if starttime > now:
-            nextgame = group[1].getText()
-            nextrunner = group[2].getText()
-            # nextconsole = group[3].getText()
-            nexteta = group2[0].getText().strip()
-            nextcomment = group2[1].getText()
-            break
-        else:
-            nextgame = 'done'
-            nextrunner = 'done'
-    return (game, runner, console, comment, eta, nextgame, nextrunner, nexteta, nextconsole, nextcomment)
-
-
-def get_gdq_info():
-    # Adapted from https://github.com/dasu/syrup-sopel-modules/blob/master/gdq.py
-    now, delta, textdate = GDQdatetime()
-    url = 'https://gamesdonequick.com/schedule'
-
-    next_gdq_item = ("Next GDQ", textdate)
-    days_delta_item = ("Days Until", delta.days if delta else "??")
-    schedule_url_item = ("Schedule", "https://gamesdonequick.com/schedule")
-    twitch_url_item = ("TTV", "http://www.twitch.tv/gamesdonequick")
+            await self._move_reminders(self.schedule)
+        except Exception as error:
+            logger.warning("Could not move GDQ reminders: %s", error)
 
-    try:
-        x = requests.get(url).content
-        bs = BeautifulSoup(x, features="html.parser")
-        run = bs.find("table", {"id": "runTable"}).tbody
-        gdqstart = datetime.strptime(run.td.getText(), '%Y-%m-%dT%H:%M:%SZ')
-        gdqstart = gdqstart.replace(tzinfo=timezone.utc)
-        (game, runner, console, comment, eta, nextgame, nextrunner, nexteta, nextconsole, nextcomment) = getinfo(run,
-                                                                                                                 now)
-    except:
-        return [next_gdq_item + days_delta_item]
+    async def _move_reminders(self, schedule: Schedule):
+        """Follows runs that moved since the reminders for them were set"""
+        moves = {}
+        for timer in await self.bot.timers.pending(REMINDER_KIND):
+            run = schedule.by_key.get(timer["key"])
+            if run is not None and run.start != timer["due"]:
+                moves[timer["id"]] = run.start
+        await self.bot.timers.reschedule(REMINDER_KIND, moves)
 
-    if not nextgame:
-        return [next_gdq_item + days_delta_item]
-    if now < gdqstart:
-        return [next_gdq_item + days_delta_item, schedule_url_item]
+    async def _remind(self, timers: List[dict]):
+        await send_reminders(self.bot, "gdq reminders", timers,
+                             lambda timer: "**{}** is starting now! {}".format(timer["game"], TWITCH_URL))
 
-    if nextgame == 'done':
-        return [next_gdq_item + days_delta_item]
+    async def _get_schedule(self) -> Optional[Schedule]:
+        if self.schedule is None:
+            await self.refresh()
+        return self.schedule
 
-    items = [
-        ("Current Game", "setup??" if not game else game + ("" if not comment else " ({})".format(comment))),
-    ]
+    @staticmethod
+    def _embed(schedule: Schedule) -> discord.Embed:
+        embed = discord.Embed(title="Games Done Quick")
+        embed.set_footer(text="Schedule updated {} min ago".format(int(time.time() - schedule.fetched_at) // 60))
+        return embed
 
-    if runner:
-        items.append(("Runner", runner))
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
+    async def gdq(self, ctx: commands.Context):
+        """Gets information about the current or next GDQ"""
+        schedule = await self._get_schedule()
+        if schedule is None:
+            return await ctx.send("I couldn't get the GDQ schedule, try again in a bit.")
+        embed = self._embed(schedule)
+        embed.set_image(url="https://static-cdn.jtvnw.net/previews-ttv/live_user_gamesdonequick-1280x720.jpg?x={}"
+                        .format(random.randint(1, 1000)))
+        for field_name, data in schedule_fields(schedule, time.time()):
+            embed.add_field(name=field_name, value=data, inline=False)
+        return await ctx.send(embed=embed)
 
-    if eta:
-        items.append(("ETA", eta))
+    @gdq.command()
+    async def upcoming(self, ctx: commands.Context, count: int = UPCOMING_DEFAULT):
+        """Lists the next few runs"""
+        schedule = await self._get_schedule()
+        if schedule is None:
+            return await ctx.send("I couldn't get the GDQ schedule, try again in a bit.")
+        runs = schedule.upcoming(time.time(), max(1, min(count, UPCOMING_MAX)))
+        if not runs:
+            return await ctx.send("There are no more runs on the schedule.")
+        embed = self._embed(schedule)
+        embed.description = "\n".join(format_run(run) for run in runs)
+        return await ctx.send(embed=embed)
 
-    if nextgame:
-        items.append(("Next Game", nextgame))
+    @gdq.command()
+    async def search(self, ctx: commands.Context, *, game: str):
+        """Finds when a game is on"""
+        schedule = await self._get_schedule()
+        if schedule is None:
+            return await ctx.send("I couldn't get the GDQ schedule, try again in a bit.")
+        runs = schedule.search(game)
+        if not runs:
+            return await ctx.send("Nothing on the schedule matches {}.".format(discord.utils.escape_markdown(game)))
+        now = time.time()
+        embed = self._embed(schedule)
+        embed.description = "\n".join(
+            format_run(run, "f") + (" (done)" if run.end <= now else "") for run in runs)
+        return await ctx.send(embed=embed)
 
-    if nextrunner:
-        items.append(("Next Runner", nextrunner))
+    @gdq.command()
+    async def remind(self, ctx: commands.Context, *, game: str = None):
+        """Pings you here when a run starts, or lists your reminders"""
+        if game is None:
+            return await self._list_reminders(ctx)
+        schedule = await self._get_schedule()
+        if schedule is None:
+            return await ctx.send("I couldn't get the GDQ schedule, try again in a bit.")
+        now = time.time()
+        run = next((run for run in schedule.search(game, len(schedule.runs)) if run.start > now), None)
+        if run is None:
+            return await ctx.send("No upcoming run matches {}.".format(discord.utils.escape_markdown(game)))
+        key = run_key(run)
+        await self.bot.timers.add(REMINDER_KIND, "{}:{}:{}".format(ctx.guild.id, ctx.author.id, key), run.start, {
+            "guild": ctx.guild.id, "channel": ctx.channel.id, "user": ctx.author.id, "game": run.game, "key": key})
+        start = datetime.fromtimestamp(run.start, timezone.utc)
+        return await ctx.send("I'll ping you here when **{}** starts, {}.".format(
+            run.game, discord.utils.format_dt(start, "R")))
 
+    @gdq.command()
+    async def unremind(self, ctx: commands.Context, *, game: str):
+        """Cancels your reminders for runs matching game"""
+        query = game.casefold()
+        cancelled = 0
+        for timer in await self._own_reminders(ctx):
+            if query in timer["game"].casefold():
+                cancelled += await self.bot.timers.cancel(REMINDER_KIND, timer["id"])
+        return await ctx.send("Cancelled {} reminder{}.".format(cancelled, "" if cancelled == 1 else "s"))
 
-    return items + [twitch_url_item, schedule_url_item]
+    async def _own_reminders(self, ctx: commands.Context) -> List[dict]:
+        return [timer for timer in await self.bot.timers.pending(REMINDER_KIND)
+                if timer["guild"] == ctx.guild.id and timer["user"] == ctx.author.id]
+
+    async def _list_reminders(self, ctx: commands.Context):
+        timers = await self._own_reminders(ctx)
+        if not timers:
+            return await ctx.send("You have no GDQ reminders. Set one with !gdq remind <game>.")
+        return await ctx.send("\n".join("{} {}".format(
+            discord.utils.format_dt(datetime.fromtimestamp(timer["due"], timezone.utc), "f"), timer["game"])
+            for timer in timers[:20]))
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(GDQ(bot))
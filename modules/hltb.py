@@ -1,11 +1,12 @@
 from typing import List
 import random
-from bs4 import BeautifulSoup
-import requests
 
 from discord.ext import commands
+import aiohttp
 import discord
 
+from utils.executor import ParseExecutor
+
 
 class HLTB(commands.Cog, name="How Long To Beat"):
     def __init__(self, bot: commands.Bot):
@@ -18,7 +19,7 @@ class HLTB(commands.Cog, name="How Long To Beat"):
         if not game:
             return await ctx.send("Syntax: !hltb [Game Name]")
 
-        results = hltb(game, 1)
+        results = await hltb(self.bot.session, self.bot.parsers, game, 1)
         if not results:
             return await ctx.send("I coulnd't find any info on that game.")
 
@@ -32,28 +33,17 @@ class HLTB(commands.Cog, name="How Long To Beat"):
         await ctx.send(embed=embed)
 
 
-def hltb(game: str, result_count: int):
+async def hltb(session: aiohttp.ClientSession, parsers: ParseExecutor, game: str, result_count: int):
     url = "https://howlongtobeat.com/search_results.php?page=1"
     payload = {"queryString": game, "t": "games", "sorthead": "popular", "sortd": "Normal Order", "length_type": "main",
                "detail": "0"}
     test = {'Content-type': 'application/x-www-form-urlencoded',
             'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/48.0.2564.97 Safari/537.36',
             'origin': 'https://howlongtobeat.com', 'referer': 'https://howlongtobeat.com'}
-    session = requests.Session()
-    r = session.post(url, headers=test, data=payload)
-
-    bs = BeautifulSoup(r.content, "html.parser")
-    search_results = bs.findAll("div", {"class": "search_list_details"})
-    num_games = min(len(search_results), result_count)
-    all_results = []
-    print(num_games)
-    for x in range(num_games):
-        game_listing = search_results[x]
-        name = game_listing.a.text
-        times = game_listing.findAll("div", {"class": lambda f: f and f.startswith("time_")})
-        result = (name, *(item.text for item in times))
-        all_results.append(result)
-    return all_results
+    async with session.post(url, headers=test, data=payload) as r:
+        content = await r.read()
+
+    return list(await parsers.run("hltb_results", content, result_count))
 
 
 async def setup(bot: commands.Bot):
@@ -1,9 +1,12 @@
 import os
 
 import discord
-import requests
 from discord.ext import commands
 
+from utils.lazy import lazy_import
+
+requests = lazy_import("requests")
+
 url = "https://imdb8.p.rapidapi.com/title/auto-complete"
 
 
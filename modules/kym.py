@@ -1,13 +1,32 @@
+import logging
+import os
+from typing import Optional, Tuple
+
+import aiohttp
 import discord
-import requests
-from bs4 import BeautifulSoup
 from discord.ext import commands
 
+from utils.cache import TTLCache
+from utils.parsers import KYM_PROPERTIES, FirstResultLink, HeadMeta, StreamingExtractor, kym_entry_from_meta
+
+logger = logging.getLogger(__name__)
+
 MAX_KYM_LEN = 400
+KYM_URL = os.getenv("KYM_URL", "https://knowyourmeme.com").rstrip("/")
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/40.0.2214.85 Safari/537.36'}
+# What a search finds rarely changes, so answers are kept this long
+CACHE_SECONDS = float(os.getenv("KYM_CACHE_SECONDS", str(24 * 60 * 60)))
+CACHE_SIZE = 500
+# Small enough that a page is abandoned soon after the part that matters
+CHUNK_BYTES = 8 * 1024
+
 
 class KYM(commands.Cog, name="Know Your Meme"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.results: TTLCache[Optional[Tuple[str, str, str]]] = TTLCache(bot.metrics, "kym", CACHE_SECONDS,
+                                                                          CACHE_SIZE)
 
     @commands.command()
     @commands.guild_only()
@@ -17,7 +36,12 @@ class KYM(commands.Cog, name="Know Your Meme"):
         if not query:
             return await ctx.send("Please provide something to look up")
 
-        result = kym(query)
+        try:
+            result = await self.results.get_or_load(" ".join(query.split()).casefold(),
+                                                    lambda: kym(self.bot.session, query))
+        except Exception as error:
+            logger.warning("Could not look up %s on KYM: %s", query, error)
+            return await ctx.send("I couldn't reach Know Your Meme, try again in a bit.")
 
         if not result:
             return await ctx.send("No result found")
@@ -34,23 +58,27 @@ class KYM(commands.Cog, name="Know Your Meme"):
         return await ctx.send(embed=embed)
 
 
-def kym(query):
-    x = requests.get("http://knowyourmeme.com/search?q={}".format(query), headers={
-        'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/40.0.2214.85 Safari/537.36'})
-    bs = BeautifulSoup(x.content, 'html.parser')
-    try:
-        url2 = bs.findAll("tbody")[0].tr.td.a['href']
-    except:
-        return None
+async def stream(session: aiohttp.ClientSession, url: str, extractor: StreamingExtractor, **kwargs):
+    """Feeds the page at url to extractor as it downloads, until it has what it needs"""
+    async with session.get(url, headers=HEADERS, **kwargs) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(CHUNK_BYTES):
+            if extractor.feed_bytes(chunk):
+                # Drops the connection instead of downloading the rest
+                response.close()
+                break
+    extractor.finish()
+
 
-    x2 = requests.get("https://knowyourmeme.com{}".format(url2), headers={
-        'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/40.0.2214.85 Safari/537.36'})
-    bs2 = BeautifulSoup(x2.content, 'html.parser')
-    about = bs2.find('meta', attrs={"property": "og:description"})['content']
-    uri = bs2.find('meta', attrs={"property": "og:url"})['content']
-    title = bs2.find('meta', attrs={"property": "og:title"})['content']
+async def kym(session: aiohttp.ClientSession, query) -> Optional[Tuple[str, str, str]]:
+    link = FirstResultLink()
+    await stream(session, KYM_URL + "/search", link, params={"q": query})
+    if not link.href:
+        return None
 
-    return title, about, uri
+    meta = HeadMeta(KYM_PROPERTIES)
+    await stream(session, KYM_URL + link.href, meta)
+    return kym_entry_from_meta(meta.found)
 
 
 async def setup(bot: commands.Bot):
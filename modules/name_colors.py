@@ -1,9 +1,14 @@
 from random import choice
 from typing import List
+import logging
 
 import discord
 from discord.ext import commands
 
+from utils.outbound import Job
+
+logger = logging.getLogger(__name__)
+
 VALID_COLORS: List[str] = ["green", "purple", "red", "blue", "yellow", "orange", "white", "pink", "cyan"]
 COLOR_ROLES: List[str] = ["Team Green", "Team Purple", "Team Red", "Team Blue", "Team Yellow", "Team Orange",
                           "Team White", "Team Pink", "color-cyan"]
@@ -38,11 +43,15 @@ class NameColors(commands.Cog, name="Name Colors"):
         # If a member is setting their own color, remove the auto granted team so that future resets won't affect them.
         auto_role = discord.utils.find(lambda role: role.name == "Auto Granted Team", ctx.guild.roles)
 
-        # Only add the role if they don't have it.
-        if role_to_add not in member.roles:
+        async def swap_roles():
             await member.remove_roles(*roles_to_remove, auto_role, atomic=True)
             await member.add_roles(role_to_add, atomic=True)
 
+        # Only add the role if they don't have it. Goes ahead of any !allcolor run that's still working through the
+        # guild's member bucket.
+        if role_to_add not in member.roles:
+            await self.bot.outbound.submit(("member", ctx.guild.id), swap_roles)
+
     @commands.command(name="allcolor")
     @commands.guild_only()
     @commands.has_any_role("Operator")
@@ -51,18 +60,31 @@ class NameColors(commands.Cog, name="Name Colors"):
         # auto_granted_members: List[discord.Member] = [member for member in ctx.guild.members if
         #                                               "Auto Granted Team" in [r.name for r in member.roles]]
 
+        # In lean member-cache mode the guild isn't chunked, so page through the member list instead
+        all_members = ctx.guild.members if ctx.guild.chunked else [
+            member async for member in ctx.guild.fetch_members(limit=None)]
         no_team_members = list(filter(lambda member: "Member" in [r.name for r in member.roles] and not any(
-            role.name in COLOR_ROLES for role in member.roles), ctx.guild.members))
+            role.name in COLOR_ROLES for role in member.roles), all_members))
 
         all_team_roles: List[discord.Role] = [role for role in ctx.guild.roles if role.name in COLOR_ROLES]
         auto_role = discord.utils.find(lambda role: role.name == "Auto Granted Team", ctx.guild.roles)
 
-        if True:
-            for member in no_team_members:
-                print("Updating: " + member.display_name)
+        def assign_team(member: discord.Member):
+            async def call():
+                logger.info("Assigning a color to %s", member.display_name)
                 await member.add_roles(auto_role, choice(all_team_roles))
                 # await member.remove_roles(*all_team_roles, auto_role)
                 # await member.remove_roles(*all_team_roles)
+            return call
+
+        async def report(job: Job):
+            await status.edit(content="Assigning colors: {}".format(job.describe()))
+
+        if no_team_members:
+            status = await ctx.send("Assigning colors to {} members...".format(len(no_team_members)))
+            job = self.bot.outbound.batch("allcolor", ("member", ctx.guild.id),
+                                          [assign_team(member) for member in no_team_members], on_progress=report)
+            await job.wait(return_exceptions=True)
 
         # Used to determine all members who were automatically granted a team, used if we would like to undo.
         # else:
@@ -1,6 +1,9 @@
 from discord.ext import commands
 import discord
-import requests
+
+from utils.lazy import lazy_import
+
+requests = lazy_import("requests")
 
 NUBEER_STATS_URL = 'https://nubeer.io/api/3812-52134-452148-0482134'
 
@@ -1,9 +1,16 @@
 # Script by Trielice @ Github adapted from the original by Vexs @ Github
 # https://gist.github.com/Vexs/f2c1bfd6bda68a661a71accd300d2adc#gistcomment-3482813
 
+import functools
+import logging
+
 import discord
 from discord.ext import commands
 
+from utils.outbound import INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
 
 class QuickPoll(commands.Cog):
     def __init__(self, bot):
@@ -28,20 +35,21 @@ class QuickPoll(commands.Cog):
             description += '\n {} {}'.format(reactions[x], option)
         embed = discord.Embed(title=question, description=''.join(description))
         react_message = await ctx.send(embed=embed)
-        for reaction in reactions[:len(options)]:
-            await react_message.add_reaction(reaction)
+        # Reactions on a channel go one at a time and in order, but the footer edit doesn't have to wait behind them
+        job = self.bot.outbound.batch(
+            "poll", ("reaction", react_message.channel.id),
+            [functools.partial(react_message.add_reaction, reaction) for reaction in reactions[:len(options)]],
+            priority=INTERACTIVE)
         embed.set_footer(text='Poll ID: {}'.format(react_message.id))
         await react_message.edit(embed=embed)
+        await job.wait()
 
     @commands.command(pass_context=True)
     async def tally(self, ctx, id=None):
         poll_message = await ctx.channel.fetch_message(id)
         embed = poll_message.embeds[0]
-        unformatted_options = [x.strip() for x in embed.description.split('\n')]
-        print(f'unformatted{unformatted_options}')
-        opt_dict = {x[:2]: x[3:] for x in unformatted_options} if unformatted_options[0][0] == '1' \
-            else {x[:1]: x[2:] for x in unformatted_options}
-        # check if we're using numbers for the poll, or x/checkmark, parse accordingly
+        opt_dict = parse_poll_options(embed.description)
+        logger.debug("Tallying poll %s with options %s", poll_message.id, opt_dict)
         voters = [self.bot.user.id]  # add the bot's ID to the list of voters to exclude it's votes
 
         tally = {x: 0 for x in opt_dict.keys()}
@@ -57,5 +65,13 @@ class QuickPoll(commands.Cog):
         await ctx.send(output)
 
 
+def parse_poll_options(description: str) -> dict:
+    """Maps each reaction emoji of a poll embed to its option text"""
+    unformatted_options = [x.strip() for x in description.split('\n')]
+    # check if we're using numbers for the poll, or x/checkmark, parse accordingly
+    return {x[:2]: x[3:] for x in unformatted_options} if unformatted_options[0][0] == '1' \
+        else {x[:1]: x[2:] for x in unformatted_options}
+
+
 async def setup(bot):
     await bot.add_cog(QuickPoll(bot))
@@ -1,11 +1,27 @@
+import asyncio
+import logging
+import os
 from datetime import datetime, timedelta
 import re
 from random import choice
+from typing import List, Optional
 
+import aiohttp
 import discord
-import requests
 from discord.ext import commands
 
+from utils.pools import QuestionPool
+from utils.triggers import trigger
+
+logger = logging.getLogger(__name__)
+
+REDDIT_URL = os.getenv("REDDIT_URL", "https://www.reddit.com").rstrip("/")
+REDDIT_HEADERS = {"User-Agent": "BroBot/1.0 by github.com/brofx"}
+# Pools also take in new posts this often, on top of refilling when they run low
+QUESTIONS_REFRESH_SECONDS = float(os.getenv("QUESTIONS_REFRESH_SECONDS", str(6 * 60 * 60)))
+QUESTIONS_LOW_WATER = int(os.getenv("QUESTIONS_LOW_WATER", "20"))
+QUESTION_SUBREDDITS = {"rather": "wouldyourather", "ask": "askreddit"}
+
 GOOD_BOT_RE = re.compile(r'^good bot$', re.IGNORECASE)
 BAD_BOT_RE = re.compile(r'^bad bot$', re.IGNORECASE)
 FUCK_YOU = re.compile(r'^fuck.+brobot.*$', re.IGNORECASE)
@@ -39,6 +55,40 @@ class Silly(commands.Cog, name="Silly Module"):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.pools = {name: QuestionPool(bot.metrics, lambda: bot.coordination, subreddit,
+                                         lambda subreddit=subreddit: fetch_titles(bot.session, subreddit),
+                                         low_water=QUESTIONS_LOW_WATER)
+                      for name, subreddit in QUESTION_SUBREDDITS.items()}
+        self._warming: Optional[asyncio.Task] = None
+
+    async def cog_load(self):
+        self.bot.scheduler.every("silly:questions", QUESTIONS_REFRESH_SECONDS, self.refresh_questions,
+                                 jitter=60, lease=True)
+        self._warming = asyncio.create_task(self._warm_pools())
+
+    async def cog_unload(self):
+        await self.bot.scheduler.cancel("silly:questions")
+        if self._warming is not None:
+            self._warming.cancel()
+
+    async def _warm_pools(self):
+        """Tops up pools that ran low while the bot was down, so the first !rather doesn't wait on reddit"""
+        await self.bot.wait_until_ready()
+        for pool in self.pools.values():
+            try:
+                if await pool.size() < pool.low_water:
+                    pool.refill_soon()
+            except Exception as error:
+                logger.warning("Could not check the %s question pool: %s", pool.name, error)
+
+    async def refresh_questions(self):
+        await asyncio.gather(*(pool.refill() for pool in self.pools.values()))
+
+    async def _ask(self, ctx: commands.Context, name: str):
+        question = await self.pools[name].draw()
+        if question is None:
+            return await ctx.send("I couldn't find a question, try again in a bit.")
+        return await ctx.send(question)
 
     @commands.command()
     @commands.guild_only()
@@ -87,37 +137,34 @@ class Silly(commands.Cog, name="Silly Module"):
     @commands.guild_only()
     async def rather(self, ctx: commands.Context):
         """Gets a random 'Would You Rather' question from reddit."""
-        header: dict = {"User-Agent": "BroBot/1.0 by github.com/brofx"}
-        question_request = requests.get("http://www.reddit.com/r/wouldyourather.json?limit=100", headers=header).json()
-        question: str = choice(question_request["data"]["children"])["data"]["title"]
-        return await ctx.send(question)
+        return await self._ask(ctx, "rather")
 
     @commands.command()
     @commands.guild_only()
     async def ask(self, ctx: commands.Context):
         """Gets a random 'Ask Reddit' question from reddit."""
-        header: dict = {"User-Agent": "BroBot/1.0 by github.com/brofx"}
-        question_request = requests.get("http://www.reddit.com/r/askreddit.json?limit=100", headers=header).json()
-        question: str = choice(question_request["data"]["children"])["data"]["title"]
-        return await ctx.send(question)
-
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        """Responds when someone calls the bot bad, implied sarcastically"""
+        return await self._ask(ctx, "ask")
 
-        author: discord.Member = message.author
+    # Responds when someone calls the bot good or bad, implied sarcastically
+    @trigger(pattern=GOOD_BOT_RE.pattern, flags=GOOD_BOT_RE.flags)
+    async def good_bot(self, message: discord.Message):
+        return await message.channel.send(choice(GOOD_BOT_RESPONSES))
 
-        if author.bot:
-            return
+    @trigger(pattern=BAD_BOT_RE.pattern, flags=BAD_BOT_RE.flags)
+    async def bad_bot(self, message: discord.Message):
+        return await message.channel.send(choice(BAD_BOT_RESPONSES))
 
-        if GOOD_BOT_RE.match(message.content):
-            return await message.channel.send(choice(GOOD_BOT_RESPONSES))
+    @trigger(pattern=FUCK_YOU.pattern, flags=FUCK_YOU.flags)
+    async def fuck_you(self, message: discord.Message):
+        return await message.channel.send(choice(FUCK_YOU_RESPONSES))
 
-        if BAD_BOT_RE.match(message.content):
-            return await message.channel.send(choice(BAD_BOT_RESPONSES))
 
-        if FUCK_YOU.match(message.content):
-            return await message.channel.send(choice(FUCK_YOU_RESPONSES))
+async def fetch_titles(session: aiohttp.ClientSession, subreddit: str) -> List[str]:
+    async with session.get("{}/r/{}.json".format(REDDIT_URL, subreddit), params={"limit": 100},
+                           headers=REDDIT_HEADERS) as response:
+        response.raise_for_status()
+        listing = await response.json()
+    return [child["data"]["title"] for child in listing["data"]["children"] if not child["data"].get("stickied")]
 
 
 async def setup(bot: commands.Bot):
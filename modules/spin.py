@@ -32,7 +32,10 @@ import logging
 
 import discord
 from discord.ext import commands
-import redis.asyncio as redis
+
+from utils.keys import guild_key, home_guild_id, migrate_keys
+from utils.logs import event
+from utils.redis_service import UNAVAILABLE_ERRORS
 
 try:
     from zoneinfo import ZoneInfo
@@ -43,11 +46,10 @@ logger = logging.getLogger(__name__)
 
 NY_TZ = ZoneInfo("America/New_York")
 
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
-REDIS_DB = int(os.getenv("REDIS_DB", "0"))
 SHARE_THREAD_ID = int(os.getenv("SLOTS_SHARE_THREAD_ID", "1407752230425067653"))  # Target thread id for sharing spin results
 CONFIG_PATH = os.getenv("SLOTS_CONFIG_PATH", "slots_config.json")
+# Spins mark their guild dirty and one process refreshes each dirty guild's message this often
+REFRESH_SECONDS = float(os.getenv("SLOTS_REFRESH_SECONDS", "5"))
 
 BIGWINS_FEED_LEN = 20
 LEADERBOARD_LEN = 10
@@ -60,36 +62,44 @@ JACKPOT_MIN_MATCHES = 20
 COOLDOWN_SECONDS = 300  # 5 minutes
 NORMAL_TOKENS_CAP = 5   # up to 5 stored normal spins
 
-# Redis keys
-K_MESSAGE_ID = "slots:message_id"
-K_CHANNEL_ID = "slots:channel_id"
-K_LEADERBOARD = "slots:leaderboard"        # zset: score = total winnings
-K_BIGWINS = "slots:bigwins"                # list of JSON entries (newest left)
-K_CONFIG_DATE = "slots:last_config_date"   # date we last loaded config for (NY day)
-K_STATS_SPINS = "slots:stats:spins"        # hash user_id -> total spins (all-time)
-K_STATS_WINNINGS = "slots:stats:winnings"  # hash user_id -> total winnings (all-time)
-K_JACKPOT_POOL = "slots:jackpot:pool"
-K_NORMAL_TOKENS = "slots:ntokens:{user_id}"  # int 0..3
-K_NORMAL_LAST   = "slots:nlast:{user_id}"    # epoch seconds of last refill calc
+# Redis keys, scoped per guild with slots_key() (e.g. "slots:{1234}:leaderboard")
+K_MESSAGE_ID = "message_id"
+K_CHANNEL_ID = "channel_id"
+K_LEADERBOARD = "leaderboard"        # zset: score = total winnings
+K_BIGWINS = "bigwins"                # list of JSON entries (newest left)
+K_STATS_SPINS = "stats:spins"        # hash user_id -> total spins (all-time)
+K_STATS_WINNINGS = "stats:winnings"  # hash user_id -> total winnings (all-time)
+K_JACKPOT_POOL = "jackpot:pool"
+K_NORMAL_TOKENS = "ntokens:{user_id}"  # int 0..3
+K_NORMAL_LAST   = "nlast:{user_id}"    # epoch seconds of last refill calc
 
 # Optional: track mega spins separately
-K_STATS_SPINS_MEGA = "slots:stats:spins_mega"      # hash user_id -> total mega spins
+K_STATS_SPINS_MEGA = "stats:spins_mega"      # hash user_id -> total mega spins
+
+K_NORMAL_CD = "cd:{user_id}"                 # string key with TTL=COOLDOWN_SECONDS
+
+# Global: every guild shares the config file
+K_CONFIG_DATE = "slots:last_config_date"   # date we last loaded config for (NY day)
+K_DIRTY_GUILDS = "slots:dirty_guilds"      # set of guild ids whose persistent message needs a refresh
+GLOBAL_KEYS = {K_CONFIG_DATE, K_DIRTY_GUILDS}  # left where they are by the per-guild migration
+
+def slots_key(guild_id: int, name: str) -> str:
+    return guild_key("slots", guild_id, name)
 
-K_NORMAL_CD = "slots:cd:{user_id}"                 # string key with TTL=COOLDOWN_SECONDS
 # Keep old per-day plays keys for backward compatibility (not used for normal now)
 # We'll introduce mega-per-day counter:
-def mega_plays_key(user_id: int, date_str: str) -> str:
-    return f"slots:megaplays:{date_str}:{user_id}"
+def mega_plays_key(guild_id: int, user_id: int, date_str: str) -> str:
+    return slots_key(guild_id, f"megaplays:{date_str}:{user_id}")
 
 def ny_date_str(dt: Optional[datetime] = None) -> str:
     if dt is None:
         dt = datetime.now(tz=NY_TZ)
     return dt.astimezone(NY_TZ).date().isoformat()
 
-def plays_key(user_id: int, date_str: Optional[str] = None) -> str:
+def plays_key(guild_id: int, user_id: int, date_str: Optional[str] = None) -> str:
     if date_str is None:
         date_str = ny_date_str()
-    return f"slots:plays:{date_str}:{user_id}"
+    return slots_key(guild_id, f"plays:{date_str}:{user_id}")
 
 @dataclass
 class Item:
@@ -125,6 +135,10 @@ class SlotsSpinView(discord.ui.View):
     def __init__(self, *, timeout: Optional[float] = None):
         super().__init__(timeout=timeout)
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Persistent views skip Brobot.dispatch, so a standby has to turn the press down here
+        return interaction.client.active
+
     @discord.ui.button(label="🎰 Spin", style=discord.ButtonStyle.primary, custom_id="slots:spin:normal")
     async def spin_normal(self, interaction: discord.Interaction, button: discord.ui.Button):
         cog: "SlotsCog" = interaction.client.get_cog("SlotsCog")  # type: ignore
@@ -197,19 +211,51 @@ class SlotsCog(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+        self.r = bot.redis.db("slots")
         self._config: Optional[SlotsConfig] = None
         self._config_loaded_for_date: Optional[str] = None
+        self._migrated = False
 
     async def cog_load(self):
+        self._config = await self._load_config()
+        self._config_loaded_for_date = ny_date_str()
         self.bot.add_view(SlotsSpinView())
+        self.bot.start_singleton("slots:refresh", self._refresh_dirty_messages, REFRESH_SECONDS)
+        # Every process keeps its own copy of the config, so each one reloads it (no lease)
+        self.bot.scheduler.cron("slots:daily", "0 0 * * *", self._daily_reset, tz=NY_TZ, jitter=5)
+
+    async def cog_unload(self):
+        await self.bot.stop_singleton("slots:refresh")
+        await self.bot.scheduler.cancel("slots:daily")
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Moves the keys from before slots were kept per guild into the home guild's namespace"""
+        guild_id = home_guild_id(self.bot)
+        if self._migrated or guild_id is None:
+            return
+        self._migrated = True
+        renames = []
+        async for old in self.r.scan_iter(match="slots:*", count=1000):
+            # Scoped keys carry a hash tag, and the global ones stay global
+            if "{" in old or old in GLOBAL_KEYS:
+                continue
+            renames.append((old, slots_key(guild_id, old[len("slots:"):])))
+        moved, conflicts = await migrate_keys(self.r, renames)
+        if moved or conflicts:
+            logger.info("Migrated %d slots keys into guild %d (%d conflicts)", moved, guild_id, conflicts)
+
+    async def _reload_config(self):
+        self._config = await self._load_config()
+        self._config_loaded_for_date = ny_date_str()
+        await self.r.set(K_CONFIG_DATE, self._config_loaded_for_date)
 
-    async def _ensure_config_for_today(self):
-        today = ny_date_str()
-        if self._config is None or self._config_loaded_for_date != today:
-            self._config = await self._load_config()
-            self._config_loaded_for_date = today
-            await self.r.set(K_CONFIG_DATE, today)
+    async def _daily_reset(self):
+        """Midnight ET: picks up the day's config and gets every guild's message showing the new day"""
+        await self._reload_config()
+        guild_ids = [guild.id for guild in self.bot.guilds]
+        if guild_ids:
+            await self.r.sadd(K_DIRTY_GUILDS, *guild_ids)
 
     async def _load_config(self) -> SlotsConfig:
         with open(CONFIG_PATH, "r", encoding="utf-8") as f:
@@ -245,16 +291,15 @@ class SlotsCog(commands.Cog):
     @commands.has_guild_permissions(manage_guild=True)
     @commands.guild_only()
     async def slots_setup(self, ctx: commands.Context):
-        await self._ensure_config_for_today()
-
         if not isinstance(ctx.channel, (discord.TextChannel, discord.Thread)):
             return await ctx.reply("Please run this in a text channel.", mention_author=False)
 
+        guild_id = ctx.guild.id
         view = SlotsSpinView()
-        embed = await self._compose_main_embed()
+        embed = await self._compose_main_embed(guild_id)
 
-        msg_id = await self.r.get(K_MESSAGE_ID)
-        chan_id = await self.r.get(K_CHANNEL_ID)
+        msg_id = await self.r.get(slots_key(guild_id, K_MESSAGE_ID))
+        chan_id = await self.r.get(slots_key(guild_id, K_CHANNEL_ID))
         posted: Optional[discord.Message] = None
 
         if msg_id and chan_id and int(chan_id) == ctx.channel.id:
@@ -267,8 +312,8 @@ class SlotsCog(commands.Cog):
         if posted is None:
             posted = await ctx.channel.send(embed=embed, view=view)
 
-        await self.r.set(K_MESSAGE_ID, posted.id)
-        await self.r.set(K_CHANNEL_ID, posted.channel.id)
+        await self.r.set(slots_key(guild_id, K_MESSAGE_ID), posted.id)
+        await self.r.set(slots_key(guild_id, K_CHANNEL_ID), posted.channel.id)
 
         await ctx.reply("Slots message is set up (or refreshed) here. 🎰", mention_author=False)
 
@@ -276,26 +321,24 @@ class SlotsCog(commands.Cog):
     @commands.has_guild_permissions(manage_guild=True)
     @commands.guild_only()
     async def slots_reload(self, ctx: commands.Context):
-        await self._ensure_config_for_today()
-        self._config = await self._load_config()
-        self._config_loaded_for_date = ny_date_str()
-        await self.r.set(K_CONFIG_DATE, self._config_loaded_for_date)
-        await self._refresh_channel_message()
+        await self._reload_config()
+        await self._refresh_channel_message(ctx.guild.id)
         await ctx.reply("Slots config reloaded and message refreshed. ✅", mention_author=False)
 
     @commands.command(name="refill_spins", help="Refill NORMAL spins to max (3) for all tracked users and reset today's MEGA spin usage. (manage_guild)")
     @commands.has_guild_permissions(manage_guild=True)
     @commands.guild_only()
     async def refill_spins(self, ctx: commands.Context):
+        guild_id = ctx.guild.id
         now = int(time.time())
         today = ny_date_str()
 
         # 1) NORMAL spins: set all existing token keys to cap and bump their last timestamps
         set_count = 0
         pipe = self.r.pipeline()
-        async for tkey in self.r.scan_iter(match="slots:ntokens:*"):
+        async for tkey in self.r.scan_iter(match=slots_key(guild_id, K_NORMAL_TOKENS.format(user_id="*"))):
             uid_part = tkey.rsplit(":", 1)[-1]
-            lkey = f"slots:nlast:{uid_part}"
+            lkey = slots_key(guild_id, K_NORMAL_LAST.format(user_id=uid_part))
             pipe.set(tkey, NORMAL_TOKENS_CAP)
             pipe.set(lkey, now)
             set_count += 1
@@ -307,7 +350,7 @@ class SlotsCog(commands.Cog):
 
         # 2) MEGA spins: clear today's per-user counters
         cleared_mega = 0
-        async for mkey in self.r.scan_iter(match=f"slots:megaplays:{today}:*"):
+        async for mkey in self.r.scan_iter(match=mega_plays_key(guild_id, "*", today)):
             cleared_mega += await self.r.delete(mkey)
 
         await ctx.reply(
@@ -320,35 +363,50 @@ class SlotsCog(commands.Cog):
     @commands.has_guild_permissions(manage_guild=True)
     @commands.guild_only()
     async def slots_hard_reset(self, ctx: commands.Context):
+        guild_id = ctx.guild.id
         deleted_plays = 0
-        async for key in self.r.scan_iter(match="slots:plays:*"):
+        async for key in self.r.scan_iter(match=slots_key(guild_id, "plays:*")):
             deleted_plays += await self.r.delete(key)
-        async for key in self.r.scan_iter(match="slots:megaplays:*"):
+        async for key in self.r.scan_iter(match=slots_key(guild_id, "megaplays:*")):
             deleted_plays += await self.r.delete(key)
 
-        del_other = await self.r.delete(
+        del_other = await self.r.delete(*(slots_key(guild_id, name) for name in (
             K_LEADERBOARD,
             K_STATS_SPINS,
             K_STATS_SPINS_MEGA,
             K_STATS_WINNINGS,
             K_BIGWINS,
             K_JACKPOT_POOL
-        )
+        )))
 
         try:
-            await self._refresh_channel_message()
+            await self._refresh_channel_message(guild_id)
         except Exception:
             pass
 
         await ctx.reply(
-            f"**Hard reset complete.** Cleared `{deleted_plays}` per-day keys and `{del_other}` global keys (incl. jackpot).",
+            f"**Hard reset complete.** Cleared `{deleted_plays}` per-day keys and `{del_other}` server-wide keys (incl. jackpot).",
             mention_author=False
         )
 
     # ---------------- Spin handling (button interaction) ----------------
 
     async def handle_spin(self, interaction: discord.Interaction, *, mega: bool):
-        await self._ensure_config_for_today()
+        try:
+            await self._spin(interaction, mega=mega)
+        except UNAVAILABLE_ERRORS as e:
+            # Points and tokens only live in Redis, so there's nothing sensible to fall back to
+            logger.warning("Spin failed, Redis is unavailable: %s", e)
+            message = "Slots are paused while the database is unavailable, try again in a few minutes."
+            if interaction.response.is_done():
+                await interaction.followup.send(message, ephemeral=True)
+            else:
+                await interaction.response.send_message(message, ephemeral=True)
+
+    async def _spin(self, interaction: discord.Interaction, *, mega: bool):
+        if interaction.guild_id is None:
+            return await interaction.response.send_message("Slots only work in a server.", ephemeral=True)
+        guild_id = interaction.guild_id
         assert self._config is not None
         cfg = self._config
 
@@ -359,7 +417,7 @@ class SlotsCog(commands.Cog):
         # NORMAL spin: enforce cooldown
         if not mega:
             # token-bucket check
-            tokens, next_in = await self._refill_normal_tokens(user.id)
+            tokens, next_in = await self._refill_normal_tokens(guild_id, user.id)
             if tokens <= 0:
                 mins, secs = divmod(next_in, 60)
                 return await interaction.response.send_message(
@@ -368,10 +426,10 @@ class SlotsCog(commands.Cog):
                     ephemeral=True
                 )
             # consume one token
-            await self.r.decr(K_NORMAL_TOKENS.format(user_id=user.id))
+            await self.r.decr(slots_key(guild_id, K_NORMAL_TOKENS.format(user_id=user.id)))
         else:
             # MEGA spin: enforce per-day count and cost
-            mkey = mega_plays_key(user.id, date_str)
+            mkey = mega_plays_key(guild_id, user.id, date_str)
             used = int(await self.r.get(mkey) or 0)
             if used >= MEGA_SPINS_PER_DAY:
                 return await interaction.response.send_message(
@@ -379,7 +437,7 @@ class SlotsCog(commands.Cog):
                     ephemeral=True
                 )
 
-            total_points = int(await self.r.hget(K_STATS_WINNINGS, user_id) or 0)
+            total_points = int(await self.r.hget(slots_key(guild_id, K_STATS_WINNINGS), user_id) or 0)
             if total_points <= MEGA_MIN_POINTS:
                 return await interaction.response.send_message(
                     f"MEGA spins require **> {MEGA_MIN_POINTS:,}** points. You currently have **{total_points:,}**.",
@@ -389,13 +447,13 @@ class SlotsCog(commands.Cog):
 
             # Deduct cost up-front and add to the progressive jackpot
             pipe = self.r.pipeline()
-            pipe.hincrby(K_STATS_WINNINGS, user_id, -cost)
-            pipe.zincrby(K_LEADERBOARD, -cost, user_id)
-            pipe.incrby(K_JACKPOT_POOL, cost)
+            pipe.hincrby(slots_key(guild_id, K_STATS_WINNINGS), user_id, -cost)
+            pipe.zincrby(slots_key(guild_id, K_LEADERBOARD), -cost, user_id)
+            pipe.incrby(slots_key(guild_id, K_JACKPOT_POOL), cost)
             await pipe.execute()
 
             # Record today's MEGA usage
-            mkey = mega_plays_key(int(user_id), date_str)
+            mkey = mega_plays_key(guild_id, int(user_id), date_str)
             await self.r.incr(mkey)
             await self.r.expire(mkey, 60 * 60 * 48)
 
@@ -414,8 +472,8 @@ class SlotsCog(commands.Cog):
         jp = self._jackpot_trigger(grid, cfg)
         if jp:
             async with self.r.pipeline(transaction=True) as p:
-                p.get(K_JACKPOT_POOL)
-                p.set(K_JACKPOT_POOL, 0)
+                p.get(slots_key(guild_id, K_JACKPOT_POOL))
+                p.set(slots_key(guild_id, K_JACKPOT_POOL), 0)
                 res = await p.execute()
             try:
                 jackpot_award = int(res[0] or 0)
@@ -429,12 +487,12 @@ class SlotsCog(commands.Cog):
 
         net_delta = gross_total - (cost if mega else 0)
 
-        await self.r.hincrby(K_STATS_SPINS, user_id, 1)
+        await self.r.hincrby(slots_key(guild_id, K_STATS_SPINS), user_id, 1)
         if mega:
-            await self.r.hincrby(K_STATS_SPINS_MEGA, user_id, 1)
+            await self.r.hincrby(slots_key(guild_id, K_STATS_SPINS_MEGA), user_id, 1)
         if gross_total:
-            await self.r.hincrby(K_STATS_WINNINGS, user_id, gross_total)
-            await self.r.zincrby(K_LEADERBOARD, gross_total, user_id)
+            await self.r.hincrby(slots_key(guild_id, K_STATS_WINNINGS), user_id, gross_total)
+            await self.r.zincrby(slots_key(guild_id, K_LEADERBOARD), gross_total, user_id)
 
         user_name = getattr(interaction.user, "global_name", None) or interaction.user.name
 
@@ -448,20 +506,17 @@ class SlotsCog(commands.Cog):
                 "mega": mega,
                 "jackpot": jackpot_award
             }
-            await self.r.lpush(K_BIGWINS, json.dumps(entry))
-            await self.r.ltrim(K_BIGWINS, 0, BIGWINS_FEED_LEN - 1)
+            await self.r.lpush(slots_key(guild_id, K_BIGWINS), json.dumps(entry))
+            await self.r.ltrim(slots_key(guild_id, K_BIGWINS), 0, BIGWINS_FEED_LEN - 1)
 
-        # Refresh persistent message (best-effort)
-        try:
-            await self._refresh_channel_message()
-        except Exception:
-            pass
+        # The persistent message is refreshed in the background, at most once per REFRESH_SECONDS
+        await self.r.sadd(K_DIRTY_GUILDS, guild_id)
 
         # Build ephemeral result
         grid_str = self._render_grid(grid)
 
-        total_spins = int(await self.r.hget(K_STATS_SPINS, user_id) or 0)
-        total_wins_accum = int(await self.r.hget(K_STATS_WINNINGS, user_id) or 0)
+        total_spins = int(await self.r.hget(slots_key(guild_id, K_STATS_SPINS), user_id) or 0)
+        total_wins_accum = int(await self.r.hget(slots_key(guild_id, K_STATS_WINNINGS), user_id) or 0)
         avg = (total_wins_accum / total_spins) if total_spins > 0 else 0.0
 
         desc_lines = []
@@ -474,7 +529,7 @@ class SlotsCog(commands.Cog):
                 desc_lines.append("No win this time!")
 
             # show remaining tokens and next refill
-            tok_left, next_in = await self._refill_normal_tokens(user.id)
+            tok_left, next_in = await self._refill_normal_tokens(guild_id, user.id)
             if tok_left < NORMAL_TOKENS_CAP and next_in > 0:
                 mins, secs = divmod(next_in, 60)
                 desc_lines.append(f"**Remaining spins:** {tok_left}/{NORMAL_TOKENS_CAP} (+1 in {mins}m {secs}s)")
@@ -482,7 +537,7 @@ class SlotsCog(commands.Cog):
                 desc_lines.append(f"**Remaining spins:** {tok_left}/{NORMAL_TOKENS_CAP}")
         else:
             # MEGA info block
-            used_after = int(await self.r.get(mega_plays_key(user.id, date_str)) or 0)
+            used_after = int(await self.r.get(mega_plays_key(guild_id, user.id, date_str)) or 0)
             remaining = max(0, MEGA_SPINS_PER_DAY - used_after)
             # Present gross, cost, net
             gross_line = f"Gross win (incl. MEGA x{MEGA_PAYOUT_MULT:.1f}): **{gross_total:,}**"
@@ -507,7 +562,8 @@ class SlotsCog(commands.Cog):
         embed.add_field(name="Summary", value="\n".join(desc_lines), inline=False)
         embed.set_footer(text=spin_time)
 
-        logger.info(f"[{spin_time}] {"\n\t".join([user_name] + desc_lines)}")
+        event("spin", guild=guild_id, user=user.id, name=user_name, mega=mega, net=net_delta,
+              multiplier=total_mult, jackpot=jackpot_award, spins=total_spins, points=total_wins_accum)
 
         view = ResultShareView(
             bot=self.bot,
@@ -527,14 +583,14 @@ class SlotsCog(commands.Cog):
 
     # ---------------- Core logic ----------------
 
-    async def _refill_normal_tokens(self, user_id: int) -> tuple[int, int]:
+    async def _refill_normal_tokens(self, guild_id: int, user_id: int) -> tuple[int, int]:
         """
         Refill the user's normal-spin tokens (capacity NORMAL_TOKENS_CAP,
         1 token every COOLDOWN_SECONDS). Returns (tokens_after_refill, seconds_until_next_token).
         """
         now = int(time.time())
-        tkey = K_NORMAL_TOKENS.format(user_id=user_id)
-        lkey = K_NORMAL_LAST.format(user_id=user_id)
+        tkey = slots_key(guild_id, K_NORMAL_TOKENS.format(user_id=user_id))
+        lkey = slots_key(guild_id, K_NORMAL_LAST.format(user_id=user_id))
 
         pipe = self.r.pipeline()
         pipe.get(tkey)
@@ -710,19 +766,18 @@ class SlotsCog(commands.Cog):
 
     # ---------------- Persistent channel message ----------------
 
-    async def _compose_main_embed(self) -> discord.Embed:
-        await self._ensure_config_for_today()
+    async def _compose_main_embed(self, guild_id: int) -> discord.Embed:
         assert self._config is not None
         cfg = self._config
 
         # Top by total winnings
-        top = await self.r.zrevrange(K_LEADERBOARD, 0, LEADERBOARD_LEN - 1, withscores=True)
+        top = await self.r.zrevrange(slots_key(guild_id, K_LEADERBOARD), 0, LEADERBOARD_LEN - 1, withscores=True)
 
         lb_lines: List[str] = []
         if top:
             # Fetch spins & winnings hashes in one go
-            spins_map = await self.r.hgetall(K_STATS_SPINS)
-            win_map = await self.r.hgetall(K_STATS_WINNINGS)
+            spins_map = await self.r.hgetall(slots_key(guild_id, K_STATS_SPINS))
+            win_map = await self.r.hgetall(slots_key(guild_id, K_STATS_WINNINGS))
             for i, (uid_str, score) in enumerate(top, start=1):
                 uid = int(uid_str)
                 spins = int(spins_map.get(uid_str, "0"))
@@ -733,7 +788,7 @@ class SlotsCog(commands.Cog):
             lb_lines.append("_No entries yet._")
 
         # Big wins feed (most recent first)
-        feed_raw = await self.r.lrange(K_BIGWINS, 0, 9)
+        feed_raw = await self.r.lrange(slots_key(guild_id, K_BIGWINS), 0, 9)
         feed_lines: List[str] = []
         if feed_raw:
             for s in feed_raw:
@@ -745,8 +800,8 @@ class SlotsCog(commands.Cog):
         else:
             feed_lines.append("_No big wins yet._")
 
-        last_cfg_date = await self.r.get(K_CONFIG_DATE)
-        pool_val = int(await self.r.get(K_JACKPOT_POOL) or 0)
+        last_cfg_date = self._config_loaded_for_date
+        pool_val = int(await self.r.get(slots_key(guild_id, K_JACKPOT_POOL)) or 0)
         embed = discord.Embed(
             title=f"{cfg.title} — Daily limit: {MEGA_SPINS_PER_DAY} MEGA spins/user",
             description=cfg.instructions,
@@ -759,23 +814,32 @@ class SlotsCog(commands.Cog):
             embed.set_footer(text=f"Config last loaded for: {last_cfg_date} (ET)")
         return embed
 
-    async def _refresh_channel_message(self):
-        msg_id = await self.r.get(K_MESSAGE_ID)
-        chan_id = await self.r.get(K_CHANNEL_ID)
+    async def _refresh_dirty_messages(self):
+        """Runs in the process holding the slots:refresh lease, whichever shard the spins came from"""
+        while (guild_id := await self.r.spop(K_DIRTY_GUILDS)) is not None:
+            try:
+                await self._refresh_channel_message(int(guild_id))
+            except Exception as error:
+                logger.warning("Could not refresh the slots message for guild %s: %s", guild_id, error)
+
+    async def _refresh_channel_message(self, guild_id: int):
+        msg_id = await self.r.get(slots_key(guild_id, K_MESSAGE_ID))
+        chan_id = await self.r.get(slots_key(guild_id, K_CHANNEL_ID))
         if not (msg_id and chan_id):
             return
 
         channel = self.bot.get_channel(int(chan_id))
-        if not isinstance(channel, (discord.TextChannel, discord.Thread)):
+        if channel is None:
+            # The guild is on another process's shard, the message can still be edited over REST
+            channel = self.bot.get_partial_messageable(int(chan_id))
+        elif not isinstance(channel, (discord.TextChannel, discord.Thread)):
             return
 
+        embed = await self._compose_main_embed(guild_id)
         try:
-            msg = await channel.fetch_message(int(msg_id))
-        except Exception:
+            await channel.get_partial_message(int(msg_id)).edit(embed=embed, view=SlotsSpinView(), content=None)
+        except (discord.NotFound, discord.Forbidden):
             return
 
-        embed = await self._compose_main_embed()
-        await msg.edit(embed=embed, view=SlotsSpinView(), content=None)
-
 async def setup(bot: commands.Bot):
     await bot.add_cog(SlotsCog(bot))
@@ -1,8 +1,11 @@
 from typing import List
+import functools
 import random
 import discord
 from discord.ext import commands
 
+from utils.outbound import INTERACTIVE
+
 
 class SplitModule(commands.Cog, name="Split Module"):
     def __init__(self, bot: commands.Bot):
@@ -47,8 +50,12 @@ class SplitModule(commands.Cog, name="Split Module"):
         split_index = len(current_members) // 2
         second_channel_users = current_members[split_index:]
 
-        for member in second_channel_users:
-            await member.move_to(second_voice_chanel)
+        # Moves share the guild's member bucket, so they go out together instead of one after another
+        job = self.bot.outbound.batch(
+            "split", ("member", ctx.guild.id),
+            [functools.partial(member.move_to, second_voice_chanel) for member in second_channel_users],
+            priority=INTERACTIVE)
+        await job.wait()
 
 
 async def setup(bot: commands.Bot):
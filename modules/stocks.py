@@ -1,64 +1,373 @@
+import asyncio
+import io
+import json
+import logging
 import os
-from typing import Optional, Tuple
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
+import aiohttp
 import discord
-import requests
 from discord.ext import commands
 
+from utils.cache import RateBudget, TTLCache
+from utils.charts import render_line_chart
+from utils.reminders import send_reminders
+from utils.watchlist import Watch, WatchIndex, watch_id
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    from backports.zoneinfo import ZoneInfo  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+FINNHUB_URL = os.getenv("FINNHUB_URL", "https://finnhub.io/api/v1").rstrip("/")
+QUOTE_URL = FINNHUB_URL + "/quote"
+CANDLE_URL = FINNHUB_URL + "/stock/candle"
+SEARCH_URL = os.getenv("YAHOO_SEARCH_URL", "https://query2.finance.yahoo.com/v1/finance/search")
+# Quotes are shared by every command asking for the same symbol within this long
+QUOTE_TTL_SECONDS = float(os.getenv("STOCKS_QUOTE_TTL_SECONDS", "15"))
+# Names rarely change, resolved symbols are kept in Redis this long
+SYMBOL_TTL_SECONDS = float(os.getenv("STOCKS_SYMBOL_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+# A name that found nothing is only remembered briefly, the lookup may just have had a bad moment
+SYMBOL_MISS_TTL_SECONDS = float(os.getenv("STOCKS_SYMBOL_MISS_TTL_SECONDS", "600"))
+# Finnhub's free tier allows 60 calls a minute per API key
+FINNHUB_CALLS_PER_MINUTE = int(os.getenv("FINNHUB_CALLS_PER_MINUTE", "60"))
+YAHOO_CALLS_PER_MINUTE = int(os.getenv("YAHOO_CALLS_PER_MINUTE", "30"))
+# A symbol that can't get a call within this long is shown as unavailable rather than holding up the table
+BUDGET_WAIT_SECONDS = 5.0
+MAX_SYMBOLS = 10
+DEFAULT_SYMBOL = "SPY"
+SYMBOLS_KEY = "stocks:symbols"
+NAME_WIDTH = 18
+# Watched symbols are polled this often, by one process
+WATCH_TICK_SECONDS = float(os.getenv("STOCKS_WATCH_TICK_SECONDS", "60"))
+# The share of the Finnhub budget watches can use, the rest is left for commands
+WATCH_BUDGET_SHARE = 0.5
+WATCH_MAX_PER_USER = 20
+WATCHES_KEY = "stocks:watches"
+# symbol -> [day, biggest move alerted on], read every tick so no process or restart alerts on the same move again
+WATCH_MARKS_KEY = "stocks:watch_marks"
+# Bumped on every change to the watches, so the polling process knows to reload them
+WATCH_VERSION_KEY = "stocks:watches:version"
+MARKET_TZ = ZoneInfo("America/New_York")
+CHART_WIDTH = 600
+CHART_HEIGHT = 240
+# Rendered charts kept, each is a few KB
+CHART_CACHE_SIZE = 200
+
+
+class ChartRange(NamedTuple):
+    # Finnhub candle resolution
+    resolution: str
+    seconds: int
+    # Charts are reused within a bucket of this many seconds, about one candle
+    bucket: int
+
+
+CHART_RANGES = {
+    "1d": ChartRange("5", 24 * 60 * 60, 5 * 60),
+    "5d": ChartRange("30", 5 * 24 * 60 * 60, 30 * 60),
+    "1m": ChartRange("60", 30 * 24 * 60 * 60, 60 * 60),
+}
+THRESHOLD_PATTERN = re.compile(r"^\+?(\d+(?:\.\d+)?)%?$")
+
+
+class Quote(NamedTuple):
+    symbol: str
+    name: str
+    open: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        return self.current - self.open
+
+    @property
+    def change_pct(self) -> float:
+        return self.change / self.open * 100 if self.open else 0.0
+
+
+def quote_color(change: float, change_pct: float) -> int:
+    return 0x000000 if abs(change_pct) < .5 else 0x007d15 if change > 0 else 0x7d0000
+
+
+def quote_embed(quote: Quote) -> discord.Embed:
+    embed: discord.Embed = discord.Embed(title="{name} ({symbol})".format(
+        name=quote.name,
+        symbol=quote.symbol
+    ), color=quote_color(quote.change, quote.change_pct))
+    embed.add_field(name="Open", value='$ {0:.2f}'.format(quote.open), inline=False)
+    embed.add_field(name="Now", value='$ {0:.2f}'.format(quote.current), inline=False)
+    embed.add_field(name="Change ", value='$ {0:.2f} / {1:.2f} %'.format(quote.change, quote.change_pct), inline=False)
+    return embed
+
+
+def table_embed(quotes: List[Quote], missing: List[str]) -> discord.Embed:
+    """One row per quote in a code block, so the columns line up"""
+    rows = ["{:<6} {:<{width}} {:>10} {:>9} {:>7}".format("", "", "Now", "Change", "%", width=NAME_WIDTH)]
+    for quote in quotes:
+        name = quote.name if len(quote.name) <= NAME_WIDTH else quote.name[:NAME_WIDTH - 1] + "…"
+        rows.append("{:<6} {:<{width}} {:>10.2f} {:>+9.2f} {:>+7.2f}".format(
+            quote.symbol, name, quote.current, quote.change, quote.change_pct, width=NAME_WIDTH))
+    change = sum(quote.change for quote in quotes)
+    change_pct = sum(quote.change_pct for quote in quotes) / len(quotes) if quotes else 0.0
+    embed = discord.Embed(title="Stocks", description="```\n{}\n```".format("\n".join(rows)),
+                          color=quote_color(change, change_pct))
+    if missing:
+        embed.set_footer(text="Not found: {}".format(", ".join(missing)))
+    return embed
+
 
 class Stocks(commands.Cog, name="Stocks Module"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.key = os.getenv("FINNHUB_KEY")
+        self.quotes: TTLCache[Optional[Tuple[float, float]]] = TTLCache(bot.metrics, "stocks_quotes",
+                                                                        QUOTE_TTL_SECONDS)
+        # Sits in front of the Redis copy, which is what survives restarts
+        self.symbols: TTLCache[Optional[Tuple[str, str]]] = TTLCache(
+            bot.metrics, "stocks_symbols", 3600, 5000, empty_ttl=SYMBOL_MISS_TTL_SECONDS)
+        self.finnhub = RateBudget(bot.metrics, "finnhub", FINNHUB_CALLS_PER_MINUTE)
+        self.yahoo = RateBudget(bot.metrics, "yahoo", YAHOO_CALLS_PER_MINUTE)
+        self.watches = WatchIndex()
+        self._watch_version: Optional[str] = None
+        # Where the next tick starts in the symbol list, when there are more symbols than budget for one tick
+        self._watch_cursor = 0
+        # (symbol, range, bucket) -> PNG, rendered once per bucket however many times it's asked for
+        self.charts: TTLCache[Optional[bytes]] = TTLCache(bot.metrics, "stocks_charts", max(
+            chart_range.bucket for chart_range in CHART_RANGES.values()), CHART_CACHE_SIZE)
 
-    @commands.command()
+    async def cog_load(self):
+        self.bot.scheduler.every("stocks:watch", WATCH_TICK_SECONDS, self.watch_tick, lease=True)
+
+    async def cog_unload(self):
+        await self.bot.scheduler.cancel("stocks:watch")
+
+    @commands.group(invoke_without_command=True)
     @commands.guild_only()
-    async def stocks(self, ctx: commands.Context, entered_symbol: str = None):
-        """Returns the curent stock information for a given stock or defaults to DJI if no stock is provided."""
+    async def stocks(self, ctx: commands.Context, *entered_symbols: str):
+        """Returns the curent stock information for the given stocks or defaults to SPY if no stock is provided."""
+        entered = list(dict.fromkeys(symbol.upper() for symbol in entered_symbols)) or [DEFAULT_SYMBOL]
+        if len(entered) > MAX_SYMBOLS:
+            return await ctx.send("Up to {} symbols at a time please.".format(MAX_SYMBOLS))
 
-        entered_symbol = "SPY" if not entered_symbol else entered_symbol.upper()
-        name, symbol = symbol_lookup(entered_symbol)
+        results = await asyncio.gather(*(self.quote(symbol) for symbol in entered), return_exceptions=True)
+        quotes, missing = [], []
+        for symbol, result in zip(entered, results):
+            if isinstance(result, Exception):
+                logger.warning("Could not get a quote for %s: %s", symbol, result)
+            if isinstance(result, Quote):
+                quotes.append(result)
+            else:
+                missing.append(symbol)
 
-        if not name:
+        if not quotes:
+            return await ctx.send("Not found" if len(entered) == 1 else "None of those were found")
+        if len(entered) == 1:
+            return await ctx.send(embed=quote_embed(quotes[0]))
+        return await ctx.send(embed=table_embed(quotes, missing))
+
+    @stocks.command()
+    async def chart(self, ctx: commands.Context, entered: str, period: str = "1d"):
+        """Charts a stock over the last day, 5 days or month (1d, 5d or 1m)"""
+        chart_range = CHART_RANGES.get(period.lower())
+        if chart_range is None:
+            return await ctx.send("Pick one of: {}".format(", ".join(CHART_RANGES)))
+        resolved = await self.symbols.get_or_load(entered.upper(), lambda: self._resolve(entered.upper()))
+        if resolved is None:
             return await ctx.send("Not found")
+        name, symbol = resolved
+        try:
+            png = await self.chart_png(symbol, period.lower())
+        except Exception as error:
+            logger.warning("Could not chart %s: %s", symbol, error)
+            png = None
+        if png is None:
+            return await ctx.send("I couldn't get a chart for {}.".format(symbol))
+        embed = discord.Embed(title="{} ({}) {}".format(name, symbol, period.lower()))
+        embed.set_image(url="attachment://chart.png")
+        return await ctx.send(embed=embed, file=discord.File(io.BytesIO(png), filename="chart.png"))
+
+    async def chart_png(self, symbol: str, period: str) -> Optional[bytes]:
+        chart_range = CHART_RANGES[period]
+        bucket = int(time.time() // chart_range.bucket)
+        return await self.charts.get_or_load((symbol, period, bucket),
+                                             lambda: self._render_chart(symbol, chart_range, bucket))
+
+    async def _render_chart(self, symbol: str, chart_range: ChartRange, bucket: int) -> Optional[bytes]:
+        # The end of the bucket, so every request in it asks for the same candles
+        end = (bucket + 1) * chart_range.bucket
+        await self.finnhub.acquire(self.key, timeout=BUDGET_WAIT_SECONDS)
+        async with self.bot.session.get(CANDLE_URL, params={
+            "symbol": symbol, "resolution": chart_range.resolution, "from": end - chart_range.seconds, "to": end,
+            "token": self.key or ""}) as response:
+            response.raise_for_status()
+            data = await response.json()
+        if data.get("s") != "ok" or not data.get("c"):
+            return None
+        # Rendering is pure Python, a thread keeps it from holding up the loop in one go
+        return await asyncio.to_thread(render_line_chart, data["c"], CHART_WIDTH, CHART_HEIGHT)
+
+    @commands.command()
+    @commands.guild_only()
+    async def watch(self, ctx: commands.Context, entered: str, threshold: str):
+        """Pings you here when a stock moves more than threshold (like 5%) from the day's open"""
+        match = THRESHOLD_PATTERN.match(threshold)
+        if not match or not 0 < float(match.group(1)) <= 100:
+            return await ctx.send("Give the threshold as a percent, like `!watch TSLA 5%`.")
+        await self._load_watches()
+        mine = self.watches.for_user(ctx.guild.id, ctx.author.id)
+        if len(mine) >= WATCH_MAX_PER_USER:
+            return await ctx.send("You're watching {} stocks already, `!unwatch` some first.".format(len(mine)))
+        resolved = await self.symbols.get_or_load(entered.upper(), lambda: self._resolve(entered.upper()))
+        if resolved is None:
+            return await ctx.send("Not found")
+        watch = Watch(ctx.guild.id, ctx.channel.id, ctx.author.id, resolved[1], float(match.group(1)))
+        async with self.bot.coordination.pipeline(transaction=True) as pipe:
+            pipe.hset(WATCHES_KEY, watch.id, watch.to_json())
+            pipe.incr(WATCH_VERSION_KEY)
+            await pipe.execute()
+        self.watches.add(watch)
+        return await ctx.send("I'll ping you here when {} moves {:g}% from its open.".format(watch.symbol,
+                                                                                            watch.threshold))
+
+    @commands.command()
+    @commands.guild_only()
+    async def unwatch(self, ctx: commands.Context, symbol: str):
+        """Stops watching a stock"""
+        await self._load_watches()
+        symbol = symbol.upper()
+        if symbol not in {watch.symbol for watch in self.watches.for_user(ctx.guild.id, ctx.author.id)}:
+            # Watches are stored under the resolved ticker, so "apple" finds AAPL the way !watch did
+            resolved = await self.symbols.get_or_load(symbol, lambda: self._resolve(symbol))
+            if resolved is not None:
+                symbol = resolved[1]
+        key = watch_id(ctx.guild.id, ctx.author.id, symbol)
+        async with self.bot.coordination.pipeline(transaction=True) as pipe:
+            pipe.hdel(WATCHES_KEY, key)
+            pipe.incr(WATCH_VERSION_KEY)
+            removed, _ = await pipe.execute()
+        self.watches.remove(key)
+        return await ctx.send("Stopped watching {}.".format(symbol) if removed else
+                              "You weren't watching {}.".format(symbol))
+
+    @commands.command()
+    @commands.guild_only()
+    async def watchlist(self, ctx: commands.Context):
+        """Lists the stocks you're watching"""
+        await self._load_watches()
+        mine = self.watches.for_user(ctx.guild.id, ctx.author.id)
+        if not mine:
+            return await ctx.send("You aren't watching any stocks, try `!watch TSLA 5%`.")
+        return await ctx.send(embed=discord.Embed(title="Your watchlist", description="\n".join(
+            "{} {:g}%".format(watch.symbol, watch.threshold) for watch in mine)))
+
+    async def _load_watches(self):
+        """Reloads the watches if another process changed them since the last load"""
+        version = await self.bot.coordination.get(WATCH_VERSION_KEY)
+        if version == self._watch_version and self._watch_version is not None:
+            return
+        watches = await self.bot.coordination.hgetall(WATCHES_KEY)
+        self.watches = WatchIndex(Watch.from_json(data) for data in watches.values())
+        self._watch_version = version
 
-        stock_lookup = requests.get(
-            "https://finnhub.io/api/v1/quote?symbol={}&token={}".format(
-                entered_symbol, self.key))
+    async def _load_marks(self):
+        """Every tick, since the process that won the last one may have marked moves since"""
+        marks = await self.bot.coordination.hgetall(WATCH_MARKS_KEY)
+        self.watches.marks = {symbol: tuple(json.loads(mark)) for symbol, mark in marks.items()}
 
-        if stock_lookup.json().get('Error Message'):
-            return await ctx.send('Please enter a valid stock symbol')
+    async def watch_tick(self):
+        """Polls every watched symbol within the budget and alerts on the moves that passed a threshold"""
+        await self._load_watches()
+        symbols = self.watches.symbols()
+        if not symbols:
+            return
+        await self._load_marks()
+        per_tick = max(1, int(FINNHUB_CALLS_PER_MINUTE * WATCH_TICK_SECONDS / 60 * WATCH_BUDGET_SHARE))
+        if len(symbols) > per_tick:
+            start = self._watch_cursor % len(symbols)
+            symbols = (symbols[start:] + symbols[:start])[:per_tick]
+            self._watch_cursor = start + per_tick
+        results = await asyncio.gather(*(self.quotes.get_or_load(symbol, lambda symbol=symbol: self._fetch_quote(
+            symbol)) for symbol in symbols), return_exceptions=True)
 
-        start_value: float = float(stock_lookup.json()['o'])
-        current_value: float = float(stock_lookup.json()['c'])
-        change_dollars: float = current_value - start_value
-        change_pct: float = (change_dollars / start_value) * 100
+        day = datetime.now(MARKET_TZ).date().isoformat()
+        alerts: List[dict] = []
+        marks: Dict[str, str] = {}
+        for symbol, prices in zip(symbols, results):
+            if isinstance(prices, Exception):
+                logger.warning("Could not get a quote for watched %s: %s", symbol, prices)
+                continue
+            if prices is None or not prices[0]:
+                continue
+            move_pct = (prices[1] - prices[0]) / prices[0] * 100
+            passed = self.watches.check(symbol, day, move_pct)
+            if passed:
+                marks[symbol] = json.dumps(self.watches.marks[symbol])
+                alerts.extend({"channel": watch.channel, "user": watch.user, "symbol": symbol,
+                               "move": move_pct, "price": prices[1]} for watch in passed)
+        if not alerts:
+            return
+        # Marked before sending, a crash in between loses an alert rather than repeating it
+        await self.bot.coordination.hset(WATCH_MARKS_KEY, mapping=marks)
+        await send_reminders(self.bot, "stock alerts", alerts, lambda alert: "**{}** is {} {:.2f}% today, $ {:.2f}"
+                             .format(alert["symbol"], "up" if alert["move"] > 0 else "down", abs(alert["move"]),
+                                     alert["price"]))
 
-        color = 0x000000 if abs(change_pct) < .5 else 0x007d15 if change_dollars > 0 else 0x7d0000
+    async def quote(self, entered: str) -> Optional[Quote]:
+        resolved = await self.symbols.get_or_load(entered, lambda: self._resolve(entered))
+        if resolved is None:
+            return None
+        name, symbol = resolved
+        prices = await self.quotes.get_or_load(symbol, lambda: self._fetch_quote(symbol))
+        if prices is None:
+            return None
+        return Quote(symbol, name, *prices)
 
-        start = '$ {0:.2f}'.format(start_value)
-        current = '$ {0:.2f}'.format(current_value)
-        change = '$ {0:.2f} / {1:.2f} %'.format(change_dollars, change_pct)
+    async def _resolve(self, entered: str) -> Optional[Tuple[str, str]]:
+        """Name and symbol for what the user typed, from Redis if it's been looked up recently"""
+        try:
+            stored = await self.bot.coordination.hget(SYMBOLS_KEY, entered)
+        except Exception as error:
+            logger.warning("Could not read cached symbols: %s", error)
+            stored = None
+        if stored is not None:
+            name, symbol, resolved_at = json.loads(stored)
+            if time.time() - resolved_at < (SYMBOL_TTL_SECONDS if symbol else SYMBOL_MISS_TTL_SECONDS):
+                return (name, symbol) if symbol else None
 
-        embed: discord.Embed = discord.Embed(title="{name} ({symbol})".format(
-            name=name,
-            symbol=symbol
-        ), color=color)
-        embed.add_field(name="Open", value=start, inline=False)
-        embed.add_field(name="Now", value=current, inline=False)
-        embed.add_field(name="Change ", value=change, inline=False)
+        await self.yahoo.acquire(timeout=BUDGET_WAIT_SECONDS)
+        resolved = await symbol_lookup(self.bot.session, entered)
+        try:
+            await self.bot.coordination.hset(SYMBOLS_KEY, entered, json.dumps([*(resolved or ("", "")), time.time()]))
+        except Exception as error:
+            logger.warning("Could not cache the symbol for %s: %s", entered, error)
+        return resolved
 
-        return await ctx.send(embed=embed)
+    async def _fetch_quote(self, symbol: str) -> Optional[Tuple[float, float]]:
+        """(open, current), or None if Finnhub doesn't know the symbol"""
+        await self.finnhub.acquire(self.key, timeout=BUDGET_WAIT_SECONDS)
+        async with self.bot.session.get(QUOTE_URL, params={"symbol": symbol, "token": self.key or ""}) as response:
+            response.raise_for_status()
+            data = await response.json()
+        if data.get('Error Message') or not data.get('c'):
+            return None
+        return float(data['o']), float(data['c'])
 
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Stocks(bot))
 
 
-def symbol_lookup(symb: str) -> Tuple[Optional[str], Optional[str]]:
-    s = requests.get(
-        "https://query2.finance.yahoo.com/v1/finance/search?q={}&lang=en-US&region=US&quotesCount=3&newsCount=0".format(
-            symb), headers={'User-Agent': 'brobot/discord.bot'}).json()
+async def symbol_lookup(session: aiohttp.ClientSession, symb: str) -> Optional[Tuple[str, str]]:
+    params = {"q": symb, "lang": "en-US", "region": "US", "quotesCount": 3, "newsCount": 0}
+    async with session.get(SEARCH_URL, params=params, headers={'User-Agent': 'brobot/discord.bot'}) as response:
+        response.raise_for_status()
+        s = await response.json()
     if not s['quotes']:
-        return None, None
+        return None
     return (s['quotes'][0].get('shortname') or s['quotes'][0]['longname']), s['quotes'][0]['symbol']
@@ -1,44 +1,152 @@
+import logging
+import os
 import re
+from typing import List, NamedTuple, Optional, Sequence
 
-import requests
+import aiohttp
 import discord
 from discord.ext import commands
-from requests.utils import requote_uri
+
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+UD_URL = os.getenv("URBANDICT_URL", "https://api.urbandictionary.com/v0/define")
+# A term's definitions are fetched once in this long, paging through them never fetches
+CACHE_SECONDS = float(os.getenv("URBANDICT_CACHE_SECONDS", "3600"))
+CACHE_SIZE = 500
+# Longer definitions are split over several pages, well under the 4096 an embed description allows
+PAGE_CHARACTERS = 1500
+# Embed field limit
+EXAMPLE_CHARACTERS = 1024
+# Buttons stop working after this long without being pressed
+VIEW_TIMEOUT_SECONDS = 300
+BRACKETS = re.compile(r'([\[\]])')
+
+
+class Page(NamedTuple):
+    title: str
+    text: str
+    example: str
+    footer: str
+
+    def embed(self) -> discord.Embed:
+        embed = discord.Embed(title=self.title, description=self.text)
+        if self.example:
+            embed.add_field(name="Example", value=self.example, inline=False)
+        embed.set_footer(text=self.footer)
+        return embed
+
+
+def normalize(term: str) -> str:
+    return " ".join(term.split()).casefold()
+
+
+def split_text(text: str, limit: int = PAGE_CHARACTERS) -> List[str]:
+    """Splits text into pieces of at most limit characters, at a paragraph or word break where there is one"""
+    pieces = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut < limit // 2:
+            cut = text.rfind(" ", 0, limit)
+        if cut < limit // 2:
+            cut = limit
+        pieces.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    pieces.append(text)
+    return pieces
+
+
+def build_pages(term: str, definitions: Sequence[dict]) -> List[Page]:
+    """Every definition of exactly term, cleaned and split into pages once, when they're fetched"""
+    matching = [definition for definition in definitions if normalize(definition['word']) == normalize(term)]
+    pages = []
+    for number, definition in enumerate(matching, start=1):
+        parts = split_text(BRACKETS.sub('', definition['definition']).strip())
+        example = BRACKETS.sub('', definition.get('example') or '').strip()
+        if len(example) > EXAMPLE_CHARACTERS:
+            example = example[:EXAMPLE_CHARACTERS - 1] + "…"
+        for part_number, part in enumerate(parts, start=1):
+            footer = "Definition {}/{}".format(number, len(matching))
+            if len(parts) > 1:
+                footer += ", part {}/{}".format(part_number, len(parts))
+            footer += " · 👍 {} 👎 {}".format(definition.get('thumbs_up', 0), definition.get('thumbs_down', 0))
+            # The example goes under the definition's last part
+            pages.append(Page(definition['word'].strip(), part, example if part_number == len(parts) else "", footer))
+    return pages
+
+
+async def fetch_pages(session: aiohttp.ClientSession, term: str) -> List[Page]:
+    async with session.get(UD_URL, params={"term": term}) as response:
+        response.raise_for_status()
+        data = await response.json()
+    return build_pages(term, data.get('list') or [])
+
+
+class DefinitionsView(discord.ui.View):
+    """Previous and next buttons over pages that are already built"""
+
+    def __init__(self, pages: Sequence[Page], *, timeout: float = VIEW_TIMEOUT_SECONDS):
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.index = 0
+        self.message: Optional[discord.Message] = None
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.previous.disabled = self.index == 0
+        self.next.disabled = self.index == len(self.pages) - 1
+
+    async def _show(self, interaction: discord.Interaction, index: int):
+        self.index = index
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.pages[index].embed(), view=self)
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, max(0, self.index - 1))
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, min(len(self.pages) - 1, self.index + 1))
+
+    async def on_timeout(self):
+        if self.message is None:
+            return
+        self.previous.disabled = self.next.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass
 
 
 class UrbanDict(commands.Cog, name="Urban Dictionary Module"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.definitions: TTLCache[List[Page]] = TTLCache(bot.metrics, "urbandict", CACHE_SECONDS, CACHE_SIZE)
 
     @commands.command()
     @commands.guild_only()
     async def ud(self, ctx: commands.Context, *, term: str = None):
-        """Gets the first urban dictionary definition for the given string."""
+        """Gets the urban dictionary definitions for the given string."""
 
         if not term:
             return await ctx.send("Error, usage: !ud <term>")
 
-        data: dict = requests.get(requote_uri("http://api.urbandictionary.com/v0/define?term={0}".format(term))).json()
-
-        if not data['list']:
-            return await ctx.send("No results found for {0}".format(term))
-
-        # Only find definitions where the term matches
         try:
-            result: dict = list(filter(lambda x: x['word'].lower() == term.lower(), data['list']))[0]
-        except IndexError:
-            return await ctx.send("No results found for {0}".format(term))
+            pages = await self.definitions.get_or_load(normalize(term), lambda: fetch_pages(self.bot.session, term))
+        except Exception as error:
+            logger.warning("Could not look up %s on Urban Dictionary: %s", term, error)
+            return await ctx.send("I couldn't reach Urban Dictionary, try again in a bit.")
 
-        # Provides a url to access
-        # Discord will basically repeat the definition with an embed if this is used
-        # url: str = 'http://{}.urbanup.com'.format(term.replace(" ", "-"))
-
-        definition: str = re.sub(r'([\[\]])', '', result['definition'])
-
-        response: discord.Embed = discord.Embed(title=term)
-        response.add_field(name="Definition", value=definition, inline=False)
+        if not pages:
+            return await ctx.send("No results found for {0}".format(term))
+        if len(pages) == 1:
+            return await ctx.send(embed=pages[0].embed())
 
-        return await ctx.send(embed=response)
+        view = DefinitionsView(pages)
+        view.message = await ctx.send(embed=pages[0].embed(), view=view)
+        return view.message
 
 
 async def setup(bot: commands.Bot):
@@ -0,0 +1,110 @@
+"""Stock charts: the PNG encoder, min/max downsampling, and the per-bucket chart cache against the local stand-in."""
+import asyncio
+import struct
+import zlib
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+import aiohttp
+
+from benchmarks.fakes import AsyncMemoryRedis, MemoryRedis
+from benchmarks.stocks_quotes import start_server
+from modules import stocks
+from utils.charts import LINE, PADDING, PALETTES, downsample, render_line_chart
+from utils.metrics import Metrics
+
+
+def read_png(data: bytes) -> Tuple[Dict[str, tuple], List[bytes]]:
+    """The IHDR fields and the filtered rows, checking the signature and every chunk's CRC on the way"""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    offset, chunks = 8, []
+    while offset < len(data):
+        length, = struct.unpack(">I", data[offset:offset + 4])
+        kind, body = data[offset + 4:offset + 8], data[offset + 8:offset + 8 + length]
+        crc, = struct.unpack(">I", data[offset + 8 + length:offset + 12 + length])
+        assert zlib.crc32(kind + body) & 0xffffffff == crc
+        chunks.append((kind, body))
+        offset += 12 + length
+    assert [kind for kind, _ in chunks] == [b"IHDR", b"PLTE", b"IDAT", b"IEND"]
+    width, height, depth, colour_type, _, _, _ = struct.unpack(">IIBBBBB", chunks[0][1])
+    raw = zlib.decompress(chunks[2][1])
+    rows = [raw[row * (width + 1):(row + 1) * (width + 1)] for row in range(height)]
+    assert len(raw) == height * (width + 1)
+    return {"size": (width, height), "format": (depth, colour_type), "palette": chunks[1][1]}, rows
+
+
+def test_renders_a_valid_png():
+    header, rows = read_png(render_line_chart([float(value % 17) for value in range(1000)], 600, 240))
+    assert header["size"] == (600, 240)
+    # 8-bit indexed colour
+    assert header["format"] == (8, 3)
+    assert len(header["palette"]) == 3 * len(PALETTES["up"])
+    for row in rows:
+        assert row[0] == 0
+        assert max(row[1:]) < len(PALETTES["up"])
+
+
+def test_colour_follows_the_move():
+    rising, _ = read_png(render_line_chart([1.0, 2.0], 10, 10))
+    falling, _ = read_png(render_line_chart([2.0, 1.0], 10, 10))
+    assert rising["palette"] == b"".join(bytes(colour) for colour in PALETTES["up"])
+    assert falling["palette"] == b"".join(bytes(colour) for colour in PALETTES["down"])
+
+
+def test_downsample_keeps_the_extremes():
+    values = [100.0] * 10_000
+    values[1234], values[8765] = 250.0, 3.0
+    columns = downsample(values, 600)
+    assert len(columns) == 600
+    assert max(high for _, high in columns) == 250.0
+    assert min(low for low, _ in columns) == 3.0
+    assert sum(1 for low, high in columns if (low, high) != (100.0, 100.0)) == 2
+
+
+def test_downsample_short_series_is_unchanged():
+    assert downsample([1.0, 3.0, 2.0], 600) == [(1.0, 1.0), (3.0, 3.0), (2.0, 2.0)]
+
+
+def test_spike_reaches_the_top_of_the_chart():
+    values = [100.0] * 5000
+    values[2500] = 200.0
+    _, rows = read_png(render_line_chart(values, 100, 50))
+    # Only the spike's column reaches the top of the plot, where an average would have flattened it
+    assert 1 <= rows[PADDING][1:].count(LINE) <= 2
+
+
+def test_chart_cache_skips_fetch_and_render_within_a_bucket(monkeypatch):
+    renders = []
+
+    def counting_render(values, width, height):
+        renders.append(len(values))
+        return render_line_chart(values, width, height)
+
+    clock = [1_700_000_000.0]
+    monkeypatch.setattr(stocks, "render_line_chart", counting_render)
+    monkeypatch.setattr(stocks, "time", SimpleNamespace(time=lambda: clock[0]))
+
+    async def scenario():
+        runner, calls, base_url = await start_server(0.0)
+        monkeypatch.setattr(stocks, "CANDLE_URL", base_url + "/stock/candle")
+        try:
+            async with aiohttp.ClientSession() as session:
+                cog = stocks.Stocks(SimpleNamespace(metrics=Metrics(), session=session,
+                                                    coordination=AsyncMemoryRedis(MemoryRedis())))
+                first = await cog.chart_png("AAPL", "1d")
+                # A burst and a later request in the same bucket
+                again = await asyncio.gather(*(cog.chart_png("AAPL", "1d") for _ in range(5)))
+                clock[0] += 60
+                later = await cog.chart_png("AAPL", "1d")
+                assert calls["candle"] == 1 and len(renders) == 1
+                assert all(png is first for png in again) and later is first
+
+                # Another range, and the next bucket, are charts of their own
+                await cog.chart_png("AAPL", "5d")
+                clock[0] += stocks.CHART_RANGES["1d"].bucket
+                await cog.chart_png("AAPL", "1d")
+                assert calls["candle"] == 3 and len(renders) == 3
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(scenario())
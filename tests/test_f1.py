@@ -0,0 +1,109 @@
+"""The F1 calendar, fetched from the local Ergast stand-in in benchmarks/f1_stub.py and its recorded 2024 season."""
+import asyncio
+from datetime import datetime, timezone
+
+import aiohttp
+import pytest
+
+from benchmarks.f1_stub import start_stub
+from modules.f1 import (RACE_LENGTH_SECONDS, Calendar, countdown, fetch_calendar, load_calendar, next_race_embed,
+                        save_calendar)
+
+
+def utc(*args) -> float:
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+async def fetch_from_stub() -> Calendar:
+    runner, base_url = await start_stub()
+    try:
+        async with aiohttp.ClientSession() as session:
+            return await fetch_calendar(session, base_url)
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture(scope="module")
+def calendar() -> Calendar:
+    return asyncio.run(fetch_from_stub())
+
+
+def test_parses_the_season(calendar):
+    assert calendar.season == "2024"
+    assert len(calendar.races) == 24
+    assert [race.round for race in calendar.races] == list(range(1, 25))
+    bahrain = calendar.races[0]
+    assert (bahrain.name, bahrain.locality) == ("Bahrain Grand Prix", "Sakhir")
+    assert bahrain.start == utc(2024, 3, 2, 15)
+
+
+def test_regular_weekend_sessions(calendar):
+    bahrain = calendar.races[0]
+    assert [key for key, _ in bahrain.sessions] == ["FirstPractice", "SecondPractice", "ThirdPractice",
+                                                   "Qualifying", "Race"]
+    starts = [start for _, start in bahrain.sessions]
+    assert starts == sorted(starts)
+
+
+def test_sprint_weekend_sessions(calendar):
+    china = calendar.races[4]
+    assert china.name == "Chinese Grand Prix"
+    assert [key for key, _ in china.sessions] == ["FirstPractice", "SprintQualifying", "Sprint", "Qualifying",
+                                                 "Race"]
+    assert china.session_start("Sprint") == utc(2024, 4, 20, 10)
+    assert china.session_start("ThirdPractice") is None
+    assert [race.round for race in calendar.races if race.session_start("Sprint")] == [5, 6, 11, 19, 21, 23]
+
+
+def test_standings(calendar):
+    assert calendar.drivers[0] == (1, "Max Verstappen", "Red Bull", 437.0)
+    assert calendar.constructors[0] == (1, "McLaren", 666.0)
+
+
+def test_next_race(calendar):
+    miami = calendar.races[5]
+    assert calendar.next_race(utc(2024, 5, 1)) == miami
+    # Still the next race while it's being run
+    assert calendar.next_race(miami.start + RACE_LENGTH_SECONDS - 1) == miami
+    assert calendar.next_race(miami.start + RACE_LENGTH_SECONDS).round == 7
+    assert calendar.next_race(utc(2025, 1, 1)) is None
+
+
+def test_next_race_embed_counts_down_to_the_next_session(calendar):
+    embeds = {}
+    embed = next_race_embed(calendar, embeds, utc(2024, 5, 3, 12))
+    assert embed.title == "[#6] 2024 **Miami Grand Prix**"
+    assert embed.fields[-1].name == "Next up"
+    assert embed.fields[-1].value.startswith("Sprint Qualifying in ")
+    # The cached embed isn't touched by the countdown
+    assert [field.name for field in embeds[6].fields] == ["Circuit", "Location", "Sessions"]
+
+
+def test_cache_round_trip(calendar, tmp_path):
+    path = str(tmp_path / "f1_cache.json")
+    save_calendar(calendar, path)
+    loaded = load_calendar(path)
+    assert loaded.season == calendar.season
+    assert loaded.races == calendar.races
+    assert loaded.drivers == calendar.drivers
+    assert loaded.constructors == calendar.constructors
+    assert loaded.fetched_at == calendar.fetched_at
+    assert loaded.next_race(utc(2024, 5, 1)) == calendar.next_race(utc(2024, 5, 1))
+
+
+def test_missing_or_broken_cache(tmp_path):
+    assert load_calendar(str(tmp_path / "missing.json")) is None
+    broken = tmp_path / "broken.json"
+    broken.write_text('{"season": "2024"')
+    assert load_calendar(str(broken)) is None
+
+
+@pytest.mark.parametrize("seconds, expected", [
+    (-5, "now"),
+    (0, "now"),
+    (59, "in 0m"),
+    (3 * 60 * 60 + 5 * 60, "in 3h 5m"),
+    (2 * 24 * 60 * 60 + 7 * 60, "in 2d 0h 7m"),
+])
+def test_countdown(seconds, expected):
+    assert countdown(seconds) == expected
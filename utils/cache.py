@@ -0,0 +1,105 @@
+"""In-process caches and rate budgets for calls to outside APIs.
+
+TTLCache keeps results for a fixed time, bounded as an LRU, and shares one load between every caller asking for the
+same key while it's in flight, so a burst of identical commands reaches the API once. RateBudget is a token bucket per
+key, for APIs that allow so many calls a minute.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+from utils.metrics import Metrics
+
+T = TypeVar("T")
+
+
+class TTLCache(Generic[T]):
+    def __init__(self, metrics: Metrics, name: str, ttl: float, max_size: int = 1000, *,
+                 empty_ttl: Optional[float] = None):
+        self.name = name
+        self.ttl = ttl
+        # How long a load that found nothing (None) is kept, if not ttl
+        self.empty_ttl = empty_ttl
+        self.max_size = max_size
+        # key -> (expires at on the monotonic clock, value)
+        self._entries: "OrderedDict[Hashable, Tuple[float, T]]" = OrderedDict()
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        self._requests = metrics.counter("brobot_cache_requests_total", "Cache lookups by outcome",
+                                         ["cache", "result"])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[T]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: Hashable, value: T, ttl: Optional[float] = None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, load: Callable[[], Awaitable[T]]) -> T:
+        """The cached value, or load's result, which callers arriving while it runs wait on too.
+
+        Exceptions from load reach every waiting caller and aren't cached.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self._requests.inc(self.name, "hit")
+            return entry[1]
+        loading = self._loading.get(key)
+        if loading is not None:
+            self._requests.inc(self.name, "joined")
+            return await asyncio.shield(loading)
+        self._requests.inc(self.name, "miss")
+        loading = self._loading[key] = asyncio.ensure_future(load())
+        try:
+            value = await asyncio.shield(loading)
+        finally:
+            if self._loading.get(key) is loading:
+                del self._loading[key]
+        self.put(key, value, self.empty_ttl if value is None else None)
+        return value
+
+
+class RateBudget:
+    """Allows rate calls per period for each key, with bursts of up to burst calls"""
+
+    def __init__(self, metrics: Metrics, name: str, rate: int, period: float = 60.0, burst: Optional[int] = None):
+        self.name = name
+        self.interval = period / rate
+        self.burst = burst or rate
+        # key -> (tokens, when they were counted on the monotonic clock)
+        self._buckets: Dict[Any, Tuple[float, float]] = {}
+        self._wait = metrics.histogram("brobot_rate_budget_wait_seconds", "Time calls waited for their rate budget",
+                                       ["budget"])
+
+    def _take(self, key: Any) -> float:
+        """Takes a token now, or reserves the next one and returns how long until it's there"""
+        now = time.monotonic()
+        tokens, counted = self._buckets.get(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - counted) / self.interval) - 1
+        self._buckets[key] = (tokens, now)
+        return 0.0 if tokens >= 0 else -tokens * self.interval
+
+    async def acquire(self, key: Any = None, timeout: Optional[float] = None):
+        """Waits for the next call key is allowed. Raises asyncio.TimeoutError rather than wait past timeout."""
+        delay = self._take(key)
+        if timeout is not None and delay > timeout:
+            # Give the reservation back
+            tokens, counted = self._buckets[key]
+            self._buckets[key] = (tokens + 1, counted)
+            raise asyncio.TimeoutError("{} budget exhausted for {:.1f}s".format(self.name, delay))
+        self._wait.observe(self.name, value=delay)
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,80 @@
+"""Line charts rendered straight to PNG, without an imaging library.
+
+Series are downsampled to one (low, high) pair per pixel column before drawing. Keeping each column's extremes, rather
+than averaging, means spikes still show up however many points were squeezed into it. The image is an indexed-colour
+PNG, one byte per pixel, compressed with zlib.
+"""
+import struct
+import zlib
+from typing import List, Sequence, Tuple
+
+# Palette indexes
+BACKGROUND, GRID, FILL, LINE = range(4)
+PALETTES = {
+    "up": [(0x2f, 0x31, 0x36), (0x40, 0x44, 0x4b), (0x1c, 0x4a, 0x2c), (0x3b, 0xa5, 0x5d)],
+    "down": [(0x2f, 0x31, 0x36), (0x40, 0x44, 0x4b), (0x52, 0x22, 0x22), (0xed, 0x42, 0x45)],
+}
+GRID_LINES = 4
+PADDING = 4
+
+
+def downsample(values: Sequence[float], width: int) -> List[Tuple[float, float]]:
+    """The lowest and highest value falling in each of width columns, or fewer columns if there are fewer values"""
+    if len(values) <= width:
+        return [(value, value) for value in values]
+    columns = []
+    for column in range(width):
+        bucket = values[column * len(values) // width:(column + 1) * len(values) // width]
+        columns.append((min(bucket), max(bucket)))
+    return columns
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+
+def encode_png(width: int, height: int, pixels: bytearray, palette: Sequence[Tuple[int, int, int]]) -> bytes:
+    """pixels holds a palette index per pixel, row by row"""
+    raw = b"".join(b"\x00" + bytes(pixels[row * width:(row + 1) * width]) for row in range(height))
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)),
+        _chunk(b"PLTE", b"".join(bytes(colour) for colour in palette)),
+        _chunk(b"IDAT", zlib.compress(raw, 6)),
+        _chunk(b"IEND", b""),
+    ])
+
+
+def render_line_chart(values: Sequence[float], width: int, height: int) -> bytes:
+    """A PNG of values across the whole width, green if the series ended higher than it started and red if not"""
+    pixels = bytearray([BACKGROUND]) * (width * height)
+    for line in range(1, GRID_LINES):
+        y = line * height // GRID_LINES
+        pixels[y * width:(y + 1) * width] = bytes([GRID]) * width
+
+    columns = downsample(values, width)
+    if columns:
+        low = min(column[0] for column in columns)
+        high = max(column[1] for column in columns)
+        span = (high - low) or 1.0
+        usable = height - 1 - 2 * PADDING
+
+        def y_of(value: float) -> int:
+            return PADDING + round((high - value) / span * usable)
+
+        previous = None
+        for index, (column_low, column_high) in enumerate(columns):
+            left = index * width // len(columns)
+            right = max(left + 1, (index + 1) * width // len(columns))
+            top, bottom = y_of(column_high), y_of(column_low)
+            # Join up with the previous column so steep moves don't leave gaps
+            if previous is not None:
+                top, bottom = min(top, previous[0]), max(bottom, previous[1])
+            previous = (y_of(column_high), y_of(column_low))
+            for x in range(left, right):
+                for y in range(bottom + 1, height):
+                    pixels[y * width + x] = FILL
+                for y in range(top, bottom + 1):
+                    pixels[y * width + x] = LINE
+    palette = PALETTES["up" if not values or values[-1] >= values[0] else "down"]
+    return encode_png(width, height, pixels, palette)
@@ -0,0 +1,132 @@
+"""Runs the CPU-heavy scrapers in utils/parsers.py off the event loop.
+
+Parsers are called by name with the page bytes, so only the name, the bytes and the resulting tuples get pickled.
+PARSE_MODE picks where they run:
+  * process (default): a small multiprocessing pool, started and warmed up in setup_hook. A parse that overruns
+    PARSE_TIMEOUT_SECONDS gets the pool torn down and replaced, so a runaway page can't hold a worker forever.
+  * thread: a thread pool. Keeps the loop responsive for parsers that release the GIL, but pure-Python parsing still
+    competes with the loop for it. Timeouts stop the wait but not the parse.
+  * inline: on the event loop, as before. Handy for debugging.
+"""
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Set
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+PARSE_MODE = os.getenv("PARSE_MODE", "process")
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))
+PARSE_TIMEOUT_SECONDS = float(os.getenv("PARSE_TIMEOUT_SECONDS", "10"))
+
+
+class ParseTimeout(Exception):
+    pass
+
+
+def _init_worker():
+    # Pay for the bs4 import once per worker, while prewarming, rather than on the first real parse
+    import bs4  # noqa: F401
+    import utils.parsers  # noqa: F401
+
+
+def _call(name: str, args: tuple) -> Any:
+    from utils.parsers import PARSERS
+    return PARSERS[name](*args)
+
+
+class ParseExecutor:
+    def __init__(self, metrics: Metrics, *, mode: str = PARSE_MODE, workers: int = PARSE_WORKERS,
+                 timeout: float = PARSE_TIMEOUT_SECONDS):
+        if mode not in ("process", "thread", "inline"):
+            raise ValueError("Unknown PARSE_MODE {!r}".format(mode))
+        self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self._pool: Optional[multiprocessing.pool.Pool] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        # Parses waiting on the process pool, failed all at once if it has to be restarted
+        self._pending: Set[asyncio.Future] = set()
+        self._restarting = asyncio.Lock()
+        self._duration = metrics.histogram("brobot_parse_duration_seconds",
+                                           "Time from submitting a parse to getting its result", ["parser", "mode"])
+        self._timeouts = metrics.counter("brobot_parse_timeouts_total", "Parses that ran past the timeout",
+                                         ["parser"])
+
+    async def start(self):
+        """Starts the workers and waits until every one of them is ready to parse"""
+        if self.mode == "process" and self._pool is None:
+            # spawn rather than fork: forking a process with a running event loop and live sockets isn't safe
+            context = multiprocessing.get_context("spawn")
+            self._pool = context.Pool(self.workers, initializer=_init_worker)
+        elif self.mode == "thread" and self._threads is None:
+            self._threads = ThreadPoolExecutor(self.workers, thread_name_prefix="parse", initializer=_init_worker)
+        if self.mode != "inline":
+            await asyncio.gather(*(self._submit("ping", ()) for _ in range(self.workers)))
+
+    async def run(self, name: str, *args) -> Any:
+        """Runs the parser registered under name and returns its result"""
+        started = time.perf_counter()
+        try:
+            if self.mode == "inline":
+                return _call(name, args)
+            return await asyncio.wait_for(self._submit(name, args), self.timeout)
+        except asyncio.TimeoutError:
+            self._timeouts.inc(name)
+            if self.mode == "process":
+                await self._restart_pool()
+            raise ParseTimeout("{} took longer than {}s".format(name, self.timeout)) from None
+        finally:
+            self._duration.observe(name, self.mode, value=time.perf_counter() - started)
+
+    def _submit(self, name: str, args: tuple) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            return loop.run_in_executor(self._threads, _call, name, args)
+        if self._pool is None:
+            raise RuntimeError("The parse pool hasn't been started")
+        future = loop.create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+
+        def resolve(result):
+            if not future.done():
+                future.set_result(result)
+
+        def fail(error):
+            if not future.done():
+                future.set_exception(error)
+
+        # The pool calls these from its result-handler thread
+        self._pool.apply_async(_call, (name, args),
+                               callback=lambda result: loop.call_soon_threadsafe(resolve, result),
+                               error_callback=lambda error: loop.call_soon_threadsafe(fail, error))
+        return future
+
+    async def _restart_pool(self):
+        """Kills every worker, the stuck one included, and starts a fresh warmed-up pool"""
+        async with self._restarting:
+            pool, self._pool = self._pool, None
+            if pool is None:
+                # Closed while we waited for the lock
+                return
+            logger.warning("A parse timed out, restarting the parse pool")
+            for future in list(self._pending):
+                if not future.done():
+                    future.set_exception(RuntimeError("The parse pool was restarted"))
+            await asyncio.to_thread(pool.terminate)
+            await self.start()
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.terminate)
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
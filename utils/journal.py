@@ -0,0 +1,169 @@
+"""A local write-ahead journal for Redis writes that can wait out an outage.
+
+While Redis answers, writes go straight through in a MULTI/EXEC. Once it stops answering, every write is appended to a
+bounded in-memory queue and a JSON-lines file instead, and a background loop replays the queue in order when Redis is
+back. Each entry carries an op id, and the replay script marks the id as applied in the same atomic step as the
+writes, so replaying an entry twice (say after a crash halfway through a replay) never counts it twice.
+
+The file is written off the event loop. Lines collect in memory and one task at a time appends them from a worker
+thread, so a burst of journaled writes costs one file append rather than one each. A crash can lose the lines still
+waiting for that append.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import deque
+from typing import Deque, List, Optional, Sequence, Tuple
+
+import redis
+
+from utils.metrics import Metrics
+from utils.redis_service import UNAVAILABLE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# One write: (command, key, first argument, second argument), in Redis argument order,
+# e.g. ("ZINCRBY", key, 1, member) or ("HSET", key, field, value)
+Op = Tuple[str, str, object, object]
+
+# KEYS[1] is the op marker, KEYS[2..] the keys written. ARGV[1] is how long to keep the marker, then a command and
+# its two arguments for each key.
+APPLY_SCRIPT = """
+if not redis.call('set', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+for i = 2, #KEYS do
+    local arg = 2 + (i - 2) * 3
+    redis.call(ARGV[arg], KEYS[i], ARGV[arg + 1], ARGV[arg + 2])
+end
+return 1
+"""
+
+# Long enough to cover a crash during a replay and the restart after it
+MARKER_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+class Journal:
+    def __init__(self, name: str, path: str, max_entries: int, metrics: Metrics, *, retry_seconds: float = 5.0):
+        self.name = name
+        self.path = path
+        self.retry_seconds = retry_seconds
+        self._entries: Deque[dict] = deque(maxlen=max_entries)
+        self._task: Optional[asyncio.Task] = None
+        # Journal lines not in the file yet, and the task appending them
+        self._unwritten: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        # Appends and the truncate after a replay mustn't overlap
+        self._file_lock = asyncio.Lock()
+        self._pending = metrics.gauge("brobot_journal_pending", "Writes waiting for Redis to come back", ["journal"])
+        self._dropped = metrics.counter("brobot_journal_dropped_total", "Journaled writes lost to the size cap",
+                                        ["journal"])
+        self._replayed = metrics.counter("brobot_journal_replayed_total", "Journaled writes applied after an outage",
+                                         ["journal"])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self._entries)
+
+    def load(self):
+        """Picks up whatever an earlier process journaled but never replayed"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    self._append(json.loads(line))
+        if self._entries:
+            logger.info("Journal %s: %d writes from an earlier run to replay", self.name, len(self._entries))
+
+    def start(self, client):
+        if self._task is None:
+            self._task = asyncio.create_task(self._replay_loop(client), name="journal:{}".format(self.name))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def write(self, client, scope: str, ops: Sequence[Op]):
+        """Applies ops atomically, or journals them if Redis is unavailable.
+
+        scope is the key prefix the op marker goes under. On a cluster it has to carry the same hash tag as the keys.
+        """
+        if not self._entries:
+            try:
+                pipe = client.pipeline(transaction=True)
+                for op in ops:
+                    pipe.execute_command(*op)
+                await pipe.execute()
+                return
+            except UNAVAILABLE_ERRORS as error:
+                logger.warning("Journal %s: Redis is unavailable (%s), buffering writes", self.name, error)
+        entry = {"id": "{}:{}".format(scope, uuid.uuid4().hex), "ops": [list(op) for op in ops]}
+        self._append(entry)
+        self._unwritten.append(json.dumps(entry) + "\n")
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.flush(), name="journal:{}:flush".format(self.name))
+
+    async def flush(self):
+        """Appends the journal lines that aren't in the file yet"""
+        async with self._file_lock:
+            while self._unwritten:
+                lines, self._unwritten = self._unwritten, []
+                try:
+                    await asyncio.to_thread(self._write_file, "a", lines)
+                except OSError as error:
+                    # The entries are still in memory and replay from there, only a restart would lose them
+                    logger.error("Journal %s: could not append %d writes to %s: %s", self.name, len(lines),
+                                 self.path, error)
+
+    def _write_file(self, mode: str, lines: Sequence[str]):
+        with open(self.path, mode, encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def _append(self, entry: dict):
+        if len(self._entries) == self._entries.maxlen:
+            self._dropped.inc(self.name)
+        self._entries.append(entry)
+        self._pending.set(self.name, value=len(self._entries))
+
+    async def replay(self, client) -> int:
+        """Applies journaled writes in order until the journal is empty or Redis fails again"""
+        applied = 0
+        while self._entries:
+            entry = self._entries[0]
+            ops: List[list] = entry["ops"]
+            keys = [entry["id"]] + [op[1] for op in ops]
+            args = [MARKER_TTL_SECONDS] + [value for op in ops for value in (op[0], op[2], op[3])]
+            try:
+                await client.eval(APPLY_SCRIPT, len(keys), *keys, *args)
+            except redis.ResponseError as error:
+                # Redis itself rejected it, so retrying won't help. Don't let it hold up everything behind it
+                logger.error("Journal %s: dropping %s: %s", self.name, entry["id"], error)
+            self._entries.popleft()
+            self._pending.set(self.name, value=len(self._entries))
+            self._replayed.inc(self.name)
+            applied += 1
+        # Everything in the file, and everything still on its way there, has been applied now
+        async with self._file_lock:
+            self._unwritten.clear()
+            await asyncio.to_thread(self._write_file, "w", ())
+        return applied
+
+    async def _replay_loop(self, client):
+        while True:
+            await asyncio.sleep(self.retry_seconds)
+            if not self._entries:
+                continue
+            try:
+                applied = await self.replay(client)
+            except UNAVAILABLE_ERRORS:
+                continue
+            logger.info("Journal %s: Redis is back, replayed %d writes", self.name, applied)
@@ -0,0 +1,55 @@
+"""Redis key layout for per-guild state.
+
+Per-guild keys look like ``slots:{1234}:leaderboard``. The braces are a Redis Cluster hash tag, so every key belonging
+to one guild hashes to the same slot and pipelines and MULTI/EXEC within a guild keep working on a cluster, while
+different guilds spread across the nodes.
+"""
+import logging
+import os
+from typing import Iterable, Optional, Tuple
+
+import redis
+from discord.ext import commands
+
+logger = logging.getLogger(__name__)
+
+# The guild that inherits the keys written before they were scoped per guild
+HOME_GUILD_ID: Optional[int] = int(os.getenv("BROBOT_HOME_GUILD_ID", "0")) or None
+
+
+def guild_key(namespace: str, guild_id: int, *parts) -> str:
+    return ":".join([namespace, "{{{}}}".format(guild_id), *(str(part) for part in parts)])
+
+
+def home_guild_id(bot: commands.Bot) -> Optional[int]:
+    """The guild to move legacy keys into, or None to leave them where they are"""
+    if HOME_GUILD_ID:
+        return HOME_GUILD_ID
+    if os.getenv("SHARD_COUNT"):
+        # A process only sees its own shards' guilds, so being in one guild says nothing about which one owns the keys
+        logger.warning("Not migrating legacy keys: set BROBOT_HOME_GUILD_ID to say which guild they belong to")
+        return None
+    if len(bot.guilds) == 1:
+        return bot.guilds[0].id
+    return None
+
+
+async def migrate_keys(client, renames: Iterable[Tuple[str, str]]) -> Tuple[int, int]:
+    """Moves legacy keys to their new names with RENAMENX, so it's safe to run while the bot is serving.
+
+    Returns (moved, conflicts). A conflict means the new key was already written, in which case the old key is left
+    alone for someone to look at rather than overwriting newer data. The old keys carry no hash tag, so run this
+    against the single node the bot used before moving to a cluster.
+    """
+    moved = conflicts = 0
+    for old, new in renames:
+        try:
+            if await client.renamenx(old, new):
+                moved += 1
+            else:
+                conflicts += 1
+                logger.warning("Not migrating %s, %s already exists", old, new)
+        except redis.ResponseError:
+            # Already migrated, or it never existed
+            continue
+    return moved, conflicts
@@ -0,0 +1,160 @@
+"""Redis leases, so duties that must only run once across every bot process have exactly one owner.
+
+A lease is a key set with NX and a TTL, holding a token unique to the process. Renewing and releasing go through small
+Lua scripts that check the token first, so a process that stalled past its TTL can't extend or drop a lease that
+someone else has since taken.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in lease values, handy when looking at who holds what with redis-cli
+PROCESS_ID = "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class Lease:
+    def __init__(self, client, name: str, ttl: float = 15.0):
+        self.client = client
+        self.name = name
+        self.key = "lease:{}".format(name)
+        self.ttl = ttl
+        self.token = PROCESS_ID
+        self.held = False
+        # Until when the lease is ours even if Redis stops answering, going by the last successful renewal
+        self.expires_at = 0.0
+
+    async def acquire(self) -> bool:
+        """Takes the lease if it's free, or renews it if this process already holds it"""
+        if self.held and await self.renew():
+            return True
+        # Also when a renewal missed because the key ran out, say while Redis was down: it's ours again if it's free
+        started = time.monotonic()
+        self.held = bool(await self.client.set(self.key, self.token, px=int(self.ttl * 1000), nx=True))
+        if self.held:
+            self.expires_at = started + self.ttl
+        return self.held
+
+    async def renew(self) -> bool:
+        started = time.monotonic()
+        self.held = bool(await self.client.eval(RENEW_SCRIPT, 1, self.key, self.token, int(self.ttl * 1000)))
+        if self.held:
+            self.expires_at = started + self.ttl
+        return self.held
+
+    def still_valid(self) -> bool:
+        return self.held and time.monotonic() < self.expires_at
+
+    async def release(self):
+        if self.held:
+            self.held = False
+            await self.client.eval(RELEASE_SCRIPT, 1, self.key, self.token)
+
+    async def holder(self) -> Optional[str]:
+        return await self.client.get(self.key)
+
+
+class Singleton:
+    """Runs a coroutine every interval seconds in whichever process holds the lease for it.
+
+    Every process runs the loop, but only the lease holder calls work(). The others keep trying to take the lease
+    each interval, so one of them picks the duty up within a TTL of the holder going away.
+
+    When Redis can't be reached, the holder normally carries on only until its last renewal runs out. With
+    hold_through_outage it carries on until Redis answers again and says someone else holds the lease, for duties
+    where nobody doing them is worse than two processes doing them for a moment. The others then wait a TTL after
+    Redis comes back before competing, so the holder from before the outage gets the lease back rather than both
+    holding the duty at once.
+    """
+
+    def __init__(self, lease: Lease, work: Callable[[], Awaitable[None]], interval: float, *,
+                 wait: Optional[Callable[[], Awaitable[None]]] = None,
+                 on_change: Optional[Callable[[str, bool], None]] = None, hold_through_outage: bool = False):
+        self.lease = lease
+        self.work = work
+        self.interval = interval
+        self.wait = wait
+        self.on_change = on_change
+        self.hold_through_outage = hold_through_outage
+        self.runs = 0
+        # Set while a process that isn't the holder waits out the outage, then when Redis first answered again
+        self._outage = False
+        self._back_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def name(self) -> str:
+        return self.lease.name
+
+    @property
+    def leader(self) -> bool:
+        return self.lease.held
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="singleton:{}".format(self.name))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.lease.release()
+        except Exception as error:
+            logger.warning("Could not release lease %s: %s", self.name, error)
+
+    async def _loop(self):
+        if self.wait is not None:
+            await self.wait()
+        while True:
+            was_leader = self.lease.held
+            try:
+                leader = await self._attempt()
+            except Exception as error:
+                logger.warning("Lease %s unavailable: %s", self.name, error)
+                if self.hold_through_outage:
+                    self._outage, self._back_at = True, None
+                    leader = self.lease.held
+                else:
+                    # Nobody else can take the lease before it expires, so the holder carries on until then
+                    leader = self.lease.held = self.lease.still_valid()
+            if leader != was_leader and self.on_change:
+                self.on_change(self.name, leader)
+            if leader:
+                try:
+                    await self.work()
+                    self.runs += 1
+                except Exception as error:
+                    logger.exception("Singleton %s failed: %s", self.name, error)
+            await asyncio.sleep(self.interval)
+
+    async def _attempt(self) -> bool:
+        if self._outage and not self.lease.held:
+            # Raises while Redis is still down
+            await self.lease.holder()
+            if self._back_at is None:
+                self._back_at = time.monotonic()
+            if time.monotonic() - self._back_at < self.lease.ttl:
+                return False
+        self._outage = False
+        return await self.lease.acquire()
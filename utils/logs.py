@@ -0,0 +1,167 @@
+"""Logging that keeps formatting and I/O off the event loop.
+
+setup_logging() puts a QueueHandler on the root logger. A record costs the caller one put on a bounded queue, and a
+listener thread formats it and writes it to stderr and, with LOG_FILE set, to a size-rotated file. Records are queued
+unformatted, so arguments passed to a log call must not be mutated afterwards. When the queue is full (the disk or
+terminal can't keep up), records are dropped and counted rather than blocking the loop.
+
+event() logs a structured event: a name plus fields, written as one JSON object per line with LOG_FORMAT=json (or to
+the file) and as "name key=value ..." otherwise. LOG_SAMPLE_RATES keeps only a share of the noisy ones, e.g.
+"spin=0.1,command=0.5". Warnings and errors are never sampled.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" or "json", for stderr. The file is always JSON lines.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Turns "spin=0.1,command=0.5" into {"spin": 0.1, "command": 0.5}"""
+    rates = {}
+    for part in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = part.partition("=")
+        rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+SAMPLE_RATES: Dict[str, float] = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+events = logging.getLogger("brobot.events")
+
+
+def event(name: str, level: int = logging.INFO, /, **fields):
+    """Logs a structured event, subject to its sample rate"""
+    if not events.isEnabledFor(level):
+        return
+    rate = SAMPLE_RATES.get(name, 1.0) if level < logging.WARNING else 1.0
+    if rate < 1.0:
+        if random.random() >= rate:
+            return
+        # So whoever reads the logs can scale counts back up
+        fields["sample_rate"] = rate
+    events.log(level, name, extra={"event": name, "fields": fields})
+
+
+class TextFormatter(logging.Formatter):
+    """The format discord.py uses, with an event's fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__("[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join("{}={}".format(key, value) for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        if hasattr(record, "event"):
+            entry["event"] = record.event
+            entry.update(record.fields)
+        else:
+            entry["msg"] = record.getMessage()
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queues records as they are, leaving all the formatting to the listener thread"""
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock handler formats here, on the caller's thread. The listener's handlers do it instead.
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Counted without a lock, an off-by-one under contention doesn't matter here
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than fail when stopping with a full queue
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    def __init__(self, handler: DroppingQueueHandler, listener: _Listener):
+        self.handler = handler
+        self.listener = listener
+        self._stopped = threading.Event()
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
+
+    def stop(self):
+        """Writes out everything still queued and stops the listener thread"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+        if self.dropped:
+            print("Logging dropped {} records, the queue was full".format(self.dropped), file=sys.stderr)
+
+
+def build_handlers(log_format: str = LOG_FORMAT, log_file: str = LOG_FILE, max_bytes: int = LOG_MAX_BYTES,
+                   backups: int = LOG_BACKUPS) -> list:
+    """The handlers the listener thread writes through"""
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+    handlers = [stream]
+    if log_file:
+        rotating = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backups,
+                                                        encoding="utf-8", delay=True)
+        rotating.setFormatter(JsonFormatter())
+        handlers.append(rotating)
+    return handlers
+
+
+def setup_logging(level: str = LOG_LEVEL, handlers: Optional[list] = None,
+                  queue_size: int = LOG_QUEUE_SIZE) -> LogPipeline:
+    """Routes every logger through the queue and starts the listener thread"""
+    records: queue.Queue = queue.Queue(queue_size)
+    handler = DroppingQueueHandler(records)
+    listener = _Listener(records, *(handlers or build_handlers()), respect_handler_level=True)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    listener.start()
+    pipeline = LogPipeline(handler, listener)
+    atexit.register(pipeline.stop)
+    return pipeline
@@ -0,0 +1,74 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+# Discord answers a REQUEST_GUILD_MEMBERS for at most 100 user ids at a time
+QUERY_BATCH_SIZE = 100
+
+
+class MemberResolver:
+    """Resolves user ids to display names without needing the whole member list in the cache.
+
+    Names come from a bounded LRU that message authors keep warm. Misses fall back to the member cache, then one
+    gateway query per 100 ids, then individual REST fetches.
+    """
+
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max_size
+        self._names: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def remember(self, member: discord.Member):
+        key = (member.guild.id, member.id)
+        self._names[key] = member.display_name
+        self._names.move_to_end(key)
+        if len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+
+    def get(self, guild_id: int, user_id: int) -> Optional[str]:
+        name = self._names.get((guild_id, user_id))
+        if name is not None:
+            self._names.move_to_end((guild_id, user_id))
+        return name
+
+    async def display_name(self, guild: discord.Guild, user_id: int) -> str:
+        return (await self.display_names(guild, [user_id]))[user_id]
+
+    async def display_names(self, guild: discord.Guild, user_ids: Iterable[int]) -> Dict[int, str]:
+        names: Dict[int, str] = {}
+        missing: List[int] = []
+        for user_id in user_ids:
+            name = self.get(guild.id, user_id)
+            if name is None:
+                member = guild.get_member(user_id)
+                if member is not None:
+                    self.remember(member)
+                    name = member.display_name
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+
+        for start in range(0, len(missing), QUERY_BATCH_SIZE):
+            try:
+                found = await guild.query_members(user_ids=missing[start:start + QUERY_BATCH_SIZE], cache=False)
+            except (asyncio.TimeoutError, discord.ClientException):
+                found = []
+            for member in found:
+                self.remember(member)
+                names[member.id] = member.display_name
+
+        # Whatever the gateway couldn't answer has probably left, give REST one try before giving up on it
+        leftover = [user_id for user_id in missing if user_id not in names]
+        fetched = await asyncio.gather(*(guild.fetch_member(user_id) for user_id in leftover), return_exceptions=True)
+        for user_id, member in zip(leftover, fetched):
+            if isinstance(member, discord.Member):
+                self.remember(member)
+                names[user_id] = member.display_name
+            else:
+                names[user_id] = "Unknown user"
+        return names
@@ -0,0 +1,194 @@
+import bisect
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+# Prometheus' default latency buckets plus a few sub-millisecond ones, in seconds
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                                      0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = ['{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names: Tuple[str, ...] = tuple(labels)
+
+    def render(self) -> List[str]:
+        return ["# HELP {} {}".format(self.name, self.documentation), "# TYPE {} {}".format(self.name, self.kind)]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in self.values.items():
+            lines.append("{}{} {}".format(self.name, _format_labels(self.label_names, labels), value))
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float):
+        self.values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self.values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, *labels: str, value: float):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def count(self, *labels: str) -> int:
+        series = self.values.get(labels)
+        return sum(series[0]) if series else 0
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        """Estimates a quantile by linear interpolation inside the matching bucket, like histogram_quantile()"""
+        series = self.values.get(labels)
+        if not series:
+            return None
+        counts = series[0]
+        rank = q * sum(counts)
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * ((rank - seen) / bucket_count)
+            seen += bucket_count
+        return None
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="{}"'.format("+Inf" if bound == float("inf") else bound)
+                lines.append("{}_bucket{} {}".format(self.name, _format_labels(self.label_names, labels, le),
+                                                     cumulative))
+            lines.append("{}_sum{} {}".format(self.name, _format_labels(self.label_names, labels), total[0]))
+            lines.append("{}_count{} {}".format(self.name, _format_labels(self.label_names, labels), cumulative))
+        return lines
+
+
+class Metrics:
+    """Bot-wide metric registry, rendered in the Prometheus text format on /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Awaitable[None]]] = []
+        self._runner: Optional[web.AppRunner] = None
+
+        self.command_duration = self.histogram("brobot_command_duration_seconds",
+                                               "Time spent running a command", ["command"])
+        self.command_errors = self.counter("brobot_command_errors_total", "Commands that raised an error",
+                                           ["command"])
+        self.command_in_flight = self.gauge("brobot_commands_in_flight", "Commands currently running", ["command"])
+        self.listener_duration = self.histogram("brobot_listener_duration_seconds",
+                                                "Time spent in an event listener", ["event", "listener"])
+        self.listener_errors = self.counter("brobot_listener_errors_total", "Event listeners that raised an error",
+                                            ["event", "listener"])
+        self.redis_roundtrip = self.histogram("brobot_redis_roundtrip_seconds", "Redis PING round-trip time",
+                                              ["client"])
+        self.redis_command_duration = self.histogram("brobot_redis_command_duration_seconds",
+                                                     "Time for a Redis command or pipeline round trip",
+                                                     ["db", "command"])
+        self.redis_errors = self.counter("brobot_redis_errors_total", "Redis commands that failed", ["db", "command"])
+        self.gateway_latency = self.gauge("brobot_gateway_latency_seconds", "Heartbeat latency to the gateway",
+                                          ["shard"])
+        self.gateway_events = self.counter("brobot_gateway_events_total", "Events dispatched, by shard",
+                                           ["shard", "event"])
+        self.shard_up = self.gauge("brobot_shard_up", "1 while the shard's gateway connection is open", ["shard"])
+        self.shard_disconnects = self.counter("brobot_shard_disconnects_total", "Gateway disconnects", ["shard"])
+        self.singleton_leader = self.gauge("brobot_singleton_leader",
+                                           "1 when this process holds the lease for the duty", ["name"])
+        self.cache_entries = self.gauge("brobot_cache_entries", "Objects held in the discord.py cache", ["cache"])
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def _register(self, metric):
+        # Extensions can be reloaded, so registering the same name again hands back the existing metric
+        return self._metrics.setdefault(metric.name, metric)
+
+    def add_collector(self, collector: Callable[[], Awaitable[None]]):
+        """Registers a coroutine that refreshes point-in-time gauges right before each scrape"""
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], Awaitable[None]]):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    async def render(self) -> str:
+        for collector in list(self._collectors):
+            try:
+                await collector()
+            except Exception:
+                # A broken collector shouldn't take the whole endpoint down
+                pass
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=await self.render(), content_type="text/plain", charset="utf-8")
+
+    async def start_server(self, host: str, port: int):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop_server(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
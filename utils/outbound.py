@@ -0,0 +1,188 @@
+"""A shared queue for outbound Discord REST calls.
+
+Cogs hand over calls, or whole batches of them, instead of awaiting each one in turn. Calls are grouped by route,
+which follows Discord's rate-limit buckets: every member edit in a guild shares one bucket, reactions share one per
+channel, and so on. Each route keeps a few requests in flight, so discord.py's own rate limiter always has the next
+request ready instead of waiting on us. When there's more waiting than capacity, interactive work (someone is
+looking at the result) goes ahead of bulk jobs.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from utils.metrics import Metrics
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# How many requests in a route can be in flight at once, by the route's first element. Enough to keep a bucket busy
+# across the round trip, but no more: anything past that just lines up inside discord.py's limiter, where an
+# interactive call can't get ahead of it. Reactions go one at a time so they land in order.
+ROUTE_LIMITS = {
+    "member": 3,
+    "reaction": 1,
+    "message": 3,
+}
+DEFAULT_ROUTE_LIMIT = 3
+OUTBOUND_MAX_IN_FLIGHT = int(os.getenv("OUTBOUND_MAX_IN_FLIGHT", "50"))
+# Jobs report progress at most this often
+PROGRESS_INTERVAL = 2.0
+
+# A route is a tuple like ("member", guild_id) or ("reaction", channel_id)
+Route = Tuple[Hashable, ...]
+Call = Callable[[], Awaitable[Any]]
+
+
+class Job:
+    """A batch of calls submitted together, with progress and an estimate of when it'll be done"""
+
+    def __init__(self, name: str, total: int):
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.futures: List[asyncio.Future] = []
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.done
+
+    def eta(self) -> Optional[float]:
+        """Seconds until the job finishes at the rate it's been going, None until anything has finished"""
+        if not self.done:
+            return None
+        return self.remaining * (time.monotonic() - self.started_at) / self.done
+
+    def describe(self) -> str:
+        text = "{}/{} done".format(self.done, self.total)
+        if self.failed:
+            text += ", {} failed".format(self.failed)
+        eta = self.eta()
+        if self.remaining and eta is not None:
+            text += ", about {}s left".format(max(1, round(eta)))
+        return text
+
+    async def wait(self, return_exceptions: bool = False) -> List[Any]:
+        """Results in submission order. Like asyncio.gather, the first failure raises unless return_exceptions is set"""
+        return list(await asyncio.gather(*self.futures, return_exceptions=return_exceptions))
+
+
+class OutboundQueue:
+    def __init__(self, metrics: Metrics, *, max_in_flight: int = OUTBOUND_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        # route -> heap of (priority, sequence, call, future, queued at)
+        self._waiting: Dict[Route, list] = {}
+        self._active: Dict[Route, int] = {}
+        self._tasks = set()
+        self._reports = set()
+        self._sequence = itertools.count()
+        self._queued = metrics.gauge("brobot_outbound_queued", "Discord calls waiting in the outbound queue",
+                                     ["route"])
+        self._wait = metrics.histogram("brobot_outbound_wait_seconds",
+                                       "Time a Discord call waited in the outbound queue", ["route", "priority"])
+        self._errors = metrics.counter("brobot_outbound_errors_total", "Discord calls from the queue that failed",
+                                       ["route"])
+
+    def __len__(self) -> int:
+        return sum(len(waiting) for waiting in self._waiting.values())
+
+    @staticmethod
+    def limit(route: Route) -> int:
+        return ROUTE_LIMITS.get(route[0], DEFAULT_ROUTE_LIMIT)
+
+    def submit(self, route: Route, call: Call, *, priority: int = INTERACTIVE) -> asyncio.Future:
+        """Queues one call and returns a future for its result"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting.setdefault(route, []),
+                       (priority, next(self._sequence), call, future, time.monotonic()))
+        self._queued.inc(str(route[0]))
+        self._pump()
+        return future
+
+    def batch(self, name: str, route: Route, calls: Sequence[Call], *, priority: int = BULK,
+              on_progress: Optional[Callable[[Job], Awaitable[None]]] = None) -> Job:
+        """Queues a batch of calls on one route as a job.
+
+        on_progress, if given, is awaited with the job every PROGRESS_INTERVAL seconds while it runs, and once more at
+        the end.
+        """
+        job = Job(name, len(calls))
+        reported = [time.monotonic()]
+
+        def finished(future: asyncio.Future):
+            job.done += 1
+            if future.cancelled() or future.exception() is not None:
+                job.failed += 1
+            now = time.monotonic()
+            if on_progress is not None and (not job.remaining or now - reported[0] >= PROGRESS_INTERVAL):
+                reported[0] = now
+                task = asyncio.create_task(on_progress(job))
+                self._reports.add(task)
+                task.add_done_callback(self._reports.discard)
+
+        for call in calls:
+            future = self.submit(route, call, priority=priority)
+            future.add_done_callback(finished)
+            job.futures.append(future)
+        return job
+
+    async def close(self):
+        """Drops whatever is still waiting and cancels what's in flight"""
+        for waiting in self._waiting.values():
+            for _, _, _, future, _ in waiting:
+                future.cancel()
+        self._waiting.clear()
+        self._queued.values.clear()
+        tasks = list(self._tasks | self._reports)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _pump(self):
+        """Starts waiting calls while there's capacity, best priority first across every route"""
+        while len(self._tasks) < self.max_in_flight:
+            ready = [(waiting[0], route) for route, waiting in self._waiting.items()
+                     if waiting and self._active.get(route, 0) < self.limit(route)]
+            if not ready:
+                return
+            _, route = min(ready, key=lambda item: item[0][:2])
+            priority, _, call, future, queued_at = heapq.heappop(self._waiting[route])
+            if not self._waiting[route]:
+                del self._waiting[route]
+            self._queued.dec(str(route[0]))
+            if future.cancelled():
+                continue
+            self._wait.observe(str(route[0]), PRIORITY_NAMES.get(priority, str(priority)),
+                               value=time.monotonic() - queued_at)
+            self._active[route] = self._active.get(route, 0) + 1
+            task = asyncio.create_task(self._run(route, call, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        # The slot this call held is free, hand it on
+        self._pump()
+
+    async def _run(self, route: Route, call: Call, future: asyncio.Future):
+        try:
+            result = await call()
+        except Exception as error:
+            self._errors.inc(str(route[0]))
+            if not future.done():
+                future.set_exception(error)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self._active[route] -= 1
+            if not self._active[route]:
+                del self._active[route]
@@ -0,0 +1,167 @@
+"""HTML scrapers that run in the parse pool, see utils/executor.py.
+
+Each parser takes the raw page bytes (plus any small arguments) and returns plain tuples and strings, so only compact
+data crosses the process boundary in either direction. They're registered by name, and the pool's worker processes
+import this module to look them up.
+
+The streaming extractors further down are fed a page a chunk at a time as it downloads and say when they've seen
+enough, so the rest of the page needn't be downloaded or parsed at all. Being incremental they run inline rather than
+in the pool, so they aren't registered.
+"""
+import codecs
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from utils.lazy import lazy_import
+
+# Cogs import this module for its types, which shouldn't drag bs4 into startup
+bs4 = lazy_import("bs4")
+
+PARSERS: Dict[str, Callable] = {}
+
+# One GDQ run: (start as "%Y-%m-%dT%H:%M:%SZ", game, runners, estimate as "H:MM:SS", category)
+ScheduleRow = Tuple[str, str, str, str, str]
+
+
+def parser(func: Callable) -> Callable:
+    PARSERS[func.__name__] = func
+    return func
+
+
+@parser
+def ping() -> bool:
+    """Used to spin the workers up before the first real parse"""
+    return True
+
+
+@parser
+def gdq_next_event(page: bytes) -> Optional[str]:
+    """The date line under the next event's heading on the GDQ home page, e.g. "January 5th - 12th, 2025" """
+    bs = bs4.BeautifulSoup(page, "html.parser")
+    if bs.h5 is None:
+        return None
+    paragraph = bs.h5.findNext("p")
+    return paragraph.text if paragraph is not None else None
+
+
+@parser
+def gdq_schedule(page: bytes) -> Tuple[ScheduleRow, ...]:
+    """Every run in the schedule table, in order.
+
+    Each run is two table rows: the first has the start time, game and runners, the second (class "second-row") the
+    estimate and category. A run missing its second row is left out.
+    """
+    bs = bs4.BeautifulSoup(page, "html.parser")
+    table = bs.find("table", {"id": "runTable"})
+    if table is None or table.tbody is None:
+        return ()
+    rows = []
+    for row in table.tbody.find_all("tr", attrs={"class": None}):
+        details = row.find_next_sibling("tr")
+        if details is None:
+            continue
+        first, second = row.find_all("td"), details.find_all("td")
+        if len(first) < 3 or len(second) < 2:
+            continue
+        rows.append((first[0].getText().strip(), first[1].getText().strip(), first[2].getText().strip(),
+                     second[0].getText().strip(), second[1].getText().strip()))
+    return tuple(rows)
+
+
+@parser
+def hltb_results(page: bytes, count: int) -> Tuple[Tuple[str, ...], ...]:
+    """(name, main story, main + extras, completionist) for the first count search results"""
+    bs = bs4.BeautifulSoup(page, "html.parser")
+    results = []
+    for listing in bs.findAll("div", {"class": "search_list_details"})[:count]:
+        times = listing.findAll("div", {"class": lambda f: f and f.startswith("time_")})
+        results.append((listing.a.text, *(item.text for item in times)))
+    return tuple(results)
+
+
+class _Done(Exception):
+    """Raised from a handler to stop HTMLParser partway through a chunk"""
+
+
+class StreamingExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.done = False
+        self.bytes_read = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def feed_bytes(self, chunk: bytes) -> bool:
+        """Parses the next chunk of the page, returns True once nothing more is needed"""
+        if not self.done:
+            self.bytes_read += len(chunk)
+            try:
+                self.feed(self._decoder.decode(chunk))
+            except _Done:
+                self.done = True
+        return self.done
+
+    def finish(self):
+        """Stops for good, there's no more page"""
+        self.done = True
+
+    def stop(self):
+        self.done = True
+        raise _Done()
+
+
+class HeadMeta(StreamingExtractor):
+    """The content of the <meta property=...> tags wanted, reading no further than the end of <head>"""
+
+    def __init__(self, properties: Iterable[str]):
+        super().__init__()
+        self.wanted = set(properties)
+        self.found: Dict[str, str] = {}
+
+    def handle_starttag(self, tag: str, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            name = attrs.get("property")
+            if name in self.wanted and name not in self.found:
+                self.found[name] = attrs.get("content") or ""
+                if len(self.found) == len(self.wanted):
+                    self.stop()
+        elif tag == "body":
+            self.stop()
+
+    def handle_endtag(self, tag: str):
+        if tag == "head":
+            self.stop()
+
+
+class FirstResultLink(StreamingExtractor):
+    """The href of the first link in the first cell of the first row of the first <tbody>"""
+
+    def __init__(self):
+        super().__init__()
+        self.href: Optional[str] = None
+        # How far into tbody > tr > td we are
+        self._depth = 0
+
+    def handle_starttag(self, tag: str, attrs):
+        if (self._depth, tag) in ((0, "tbody"), (1, "tr"), (2, "td")):
+            self._depth += 1
+        elif self._depth == 3 and tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.href = href
+                self.stop()
+
+    def handle_endtag(self, tag: str):
+        # The first cell ended without a link, there's no result to find
+        if self._depth and tag in ("tbody", "tr", "td"):
+            self.stop()
+
+
+KYM_PROPERTIES = ("og:title", "og:description", "og:url")
+
+
+def kym_entry_from_meta(found: Dict[str, str]) -> Optional[Tuple[str, str, str]]:
+    if not all(name in found for name in KYM_PROPERTIES):
+        return None
+    title, about, uri = (found[name] for name in KYM_PROPERTIES)
+    return title, about, uri
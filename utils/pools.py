@@ -0,0 +1,107 @@
+"""Shuffle bags of questions kept in Redis, so commands like !rather answer without fetching anything.
+
+Each pool is a Redis set of questions not yet asked and a set of those already asked. Drawing pops a random question
+from the first and moves it to the second, so nothing repeats until the pool runs out. When fewer than low_water
+questions are left, a refill runs in the background. It fetches a fresh batch and adds whatever hasn't been asked
+yet. Only when every question fetched has already been asked and the bag is empty does the cycle start over. Both
+steps are Lua scripts, so every process shares one rotation.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# KEYS: bag, asked. ARGV: seconds to keep the asked set, then the questions
+REFILL_SCRIPT = """
+local added = 0
+for i = 2, #ARGV do
+    if redis.call('sismember', KEYS[2], ARGV[i]) == 0 then
+        added = added + redis.call('sadd', KEYS[1], ARGV[i])
+    end
+end
+if added == 0 and redis.call('scard', KEYS[1]) == 0 then
+    redis.call('del', KEYS[2])
+    for i = 2, #ARGV do
+        added = added + redis.call('sadd', KEYS[1], ARGV[i])
+    end
+end
+redis.call('expire', KEYS[2], ARGV[1])
+return added
+"""
+
+# KEYS: bag, asked. Returns the question, or nil if the bag is empty, and how many are left.
+DRAW_SCRIPT = """
+local question = redis.call('spop', KEYS[1])
+if question then
+    redis.call('sadd', KEYS[2], question)
+end
+return {question, redis.call('scard', KEYS[1])}
+"""
+
+# Questions asked are remembered this long at most, so the asked set can't grow forever
+ASKED_TTL_SECONDS = 30 * 24 * 60 * 60
+
+
+class QuestionPool:
+    def __init__(self, metrics: Metrics, client: Callable[[], object], name: str,
+                 fetch: Callable[[], Awaitable[List[str]]], *, low_water: int = 20, min_interval: float = 300.0):
+        # A callable rather than a client, the Redis service can be swapped out after the pool is made
+        self.client = client
+        self.name = name
+        self.fetch = fetch
+        self.low_water = low_water
+        # A pool that's low because its source has nothing new shouldn't fetch on every draw
+        self.min_interval = min_interval
+        self._refilled_at = float("-inf")
+        # A hash tag, so both keys stay in one slot on a cluster
+        self.bag_key = "questions:{{{}}}:bag".format(name)
+        self.asked_key = "questions:{{{}}}:asked".format(name)
+        self._refilling: Optional[asyncio.Task] = None
+        self._size = metrics.gauge("brobot_question_pool_size", "Questions left before a pool repeats", ["pool"])
+        self._draws = metrics.counter("brobot_question_pool_draws_total", "Questions drawn, by whether the pool had "
+                                      "one ready", ["pool", "result"])
+        self._refills = metrics.counter("brobot_question_pool_refills_total", "Pool refills", ["pool"])
+
+    async def draw(self) -> Optional[str]:
+        """A question not asked since the pool last started over, refilling first only if the pool is empty"""
+        question, left = await self.client().eval(DRAW_SCRIPT, 2, self.bag_key, self.asked_key)
+        if question is None:
+            self._draws.inc(self.name, "empty")
+            await self.refill()
+            question, left = await self.client().eval(DRAW_SCRIPT, 2, self.bag_key, self.asked_key)
+        else:
+            self._draws.inc(self.name, "ready")
+        self._size.set(self.name, value=left)
+        if left < self.low_water and time.monotonic() - self._refilled_at >= self.min_interval:
+            self.refill_soon()
+        return question
+
+    def refill_soon(self) -> asyncio.Task:
+        """Starts a refill in the background, unless one is already running"""
+        if self._refilling is None or self._refilling.done():
+            self._refilling = asyncio.create_task(self._refill_logged(), name="pool:{}".format(self.name))
+        return self._refilling
+
+    async def refill(self):
+        """Refills now, joining a refill that's already running"""
+        await asyncio.shield(self.refill_soon())
+
+    async def _refill_logged(self):
+        self._refilled_at = time.monotonic()
+        try:
+            questions = await self.fetch()
+            if questions:
+                await self.client().eval(REFILL_SCRIPT, 2, self.bag_key, self.asked_key, ASKED_TTL_SECONDS,
+                                         *questions)
+            self._refills.inc(self.name)
+        except Exception as error:
+            logger.warning("Could not refill the %s question pool: %s", self.name, error)
+
+    async def size(self) -> int:
+        left = await self.client().scard(self.bag_key)
+        self._size.set(self.name, value=left)
+        return left
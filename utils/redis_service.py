@@ -0,0 +1,127 @@
+"""The bot's shared async Redis connections.
+
+Cogs ask for a logical database by name, ``bot.redis.db("slots")``, rather than building their own clients. Names
+that map to the same database number share one connection pool. Every command and pipeline is timed into the metrics,
+and anything slower than REDIS_SLOW_MS is logged.
+"""
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+REDIS_SLOW_MS = float(os.getenv("REDIS_SLOW_MS", "50"))
+
+# What a command raises when Redis can't be reached, as opposed to Redis rejecting the command
+UNAVAILABLE_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+# Logical name -> database number
+DATABASES = {
+    "default": int(os.getenv("REDIS_DB", "0")),
+    "slots": int(os.getenv("REDIS_DB", "0")),
+    "activity": int(os.getenv("REDIS_ACTIVITY_DB", "6")),
+}
+
+
+class TimedRedis(redis.Redis):
+    """A client that reports how long each command took"""
+
+    service: "RedisService"
+    db_name: str
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except redis.RedisError:
+            self.service.metrics.redis_errors.inc(self.db_name, str(args[0]))
+            raise
+        finally:
+            self.service.observe(self.db_name, str(args[0]), time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> "TimedPipeline":
+        pipe = TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.service, pipe.db_name = self.service, self.db_name
+        return pipe
+
+
+class TimedPipeline(Pipeline):
+    """Times the whole round trip of a pipeline, rather than each queued command"""
+
+    service: "RedisService"
+    db_name: str
+
+    async def execute(self, raise_on_error: bool = True):
+        command = "MULTI" if self.is_transaction else "PIPELINE"
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        except redis.RedisError:
+            self.service.metrics.redis_errors.inc(self.db_name, command)
+            raise
+        finally:
+            self.service.observe(self.db_name, command, time.perf_counter() - start)
+
+
+class RedisService:
+    def __init__(self, metrics: Metrics, *, host: str = REDIS_HOST, port: int = REDIS_PORT,
+                 databases: Optional[Dict[str, int]] = None, max_connections: int = REDIS_MAX_CONNECTIONS,
+                 slow_ms: float = REDIS_SLOW_MS):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.databases = dict(databases or DATABASES)
+        self.max_connections = max_connections
+        self.slow_seconds = slow_ms / 1000
+        self._pools: Dict[int, redis.BlockingConnectionPool] = {}
+        self._clients: Dict[str, TimedRedis] = {}
+        self.metrics.add_collector(self._collect_metrics)
+
+    def db(self, name: str) -> TimedRedis:
+        client = self._clients.get(name)
+        if client is None:
+            number = self.databases[name]
+            pool = self._pools.get(number)
+            if pool is None:
+                # Blocking, so a burst waits for a free connection instead of failing with "Too many connections"
+                pool = self._pools[number] = redis.BlockingConnectionPool(
+                    host=self.host, port=self.port, db=number, decode_responses=True,
+                    max_connections=self.max_connections, timeout=5, socket_connect_timeout=5, socket_timeout=5,
+                    socket_keepalive=True, health_check_interval=30)
+            client = self._clients[name] = TimedRedis(connection_pool=pool)
+            client.service, client.db_name = self, name
+        return client
+
+    def observe(self, db_name: str, command: str, elapsed: float):
+        self.metrics.redis_command_duration.observe(db_name, command, value=elapsed)
+        if elapsed >= self.slow_seconds:
+            logger.warning("Slow Redis %s on %s: %.1f ms", command, db_name, elapsed * 1000)
+
+    async def _collect_metrics(self):
+        """Health check: one PING per logical database in use"""
+        for name, client in list(self._clients.items()):
+            start = time.perf_counter()
+            try:
+                await client.ping()
+            except redis.RedisError as error:
+                logger.warning("Redis %s failed its health check: %s", name, error)
+                continue
+            self.metrics.redis_roundtrip.observe(name, value=time.perf_counter() - start)
+
+    async def close(self):
+        self.metrics.remove_collector(self._collect_metrics)
+        for client in self._clients.values():
+            await client.aclose()
+        for pool in self._pools.values():
+            await pool.disconnect()
+        self._clients.clear()
+        self._pools.clear()
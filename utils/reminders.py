@@ -0,0 +1,69 @@
+"""Sends fired reminder timers (see utils/timers.py) as channel messages.
+
+Reminders fire in batches. Everyone waiting on the same thing in the same channel gets pinged in one message, split
+over several when the mentions don't fit, and the messages go through the outbound queue. Channels are addressed by
+id, so reminders for a guild on another process's shard still go out. A message is only given up on when Discord says
+the channel is gone or off limits; anything else gets one more try.
+"""
+import functools
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+import discord
+from discord.ext import commands
+
+logger = logging.getLogger(__name__)
+
+# Discord's limit on a message's length
+MESSAGE_LIMIT = 2000
+# Extra tries for messages that failed for any reason but the channel being gone
+RETRIES = 1
+# What Discord answers when the channel was deleted or the bot can't post there any more
+GONE = (discord.NotFound, discord.Forbidden)
+
+
+def mention_chunks(text: str, user_ids: List[int], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """text followed by a mention for each user, split into messages of at most limit characters"""
+    chunks, current = [], text
+    for user_id in dict.fromkeys(user_ids):
+        mention = "<@{}>".format(user_id)
+        if len(current) + 1 + len(mention) > limit:
+            chunks.append(current)
+            current = mention
+        else:
+            current += ("\n" if current == text else " ") + mention
+    chunks.append(current)
+    return chunks
+
+
+async def send_reminders(bot: commands.Bot, name: str, timers: List[dict], describe: Callable[[dict], str]):
+    """Pings each timer's "user" in its "channel", with the text describe gives for it"""
+    grouped: Dict[Tuple[int, str], List[int]] = defaultdict(list)
+    for timer in timers:
+        grouped[(timer["channel"], describe(timer))].append(timer["user"])
+    pending: Dict[int, List[str]] = defaultdict(list)
+    for (channel_id, text), user_ids in grouped.items():
+        pending[channel_id].extend(mention_chunks(text, user_ids))
+    error = None
+    for _ in range(RETRIES + 1):
+        jobs = []
+        for channel_id, chunks in pending.items():
+            # Not in the cache when the guild is on another shard, the id is enough to send
+            channel = bot.get_channel(channel_id) or bot.get_partial_messageable(channel_id)
+            jobs.append((channel_id, chunks, bot.outbound.batch(name, ("message", channel_id), [
+                functools.partial(channel.send, chunk) for chunk in chunks])))
+        pending = defaultdict(list)
+        for channel_id, chunks, job in jobs:
+            results = await job.wait(return_exceptions=True)
+            gone = [result for result in results if isinstance(result, GONE)]
+            if gone:
+                logger.warning("Dropping %d %s reminder messages for channel %s: %s", len(gone), name, channel_id,
+                               gone[0])
+            for chunk, result in zip(chunks, results):
+                if isinstance(result, Exception) and not isinstance(result, GONE):
+                    pending[channel_id].append(chunk)
+                    error = result
+        if not pending:
+            return
+    logger.warning("%d %s reminder messages failed: %s", sum(map(len, pending.values())), name, error)
@@ -0,0 +1,242 @@
+"""The bot's scheduler for periodic background work.
+
+Jobs run on a fixed interval or on a cron expression in a given timezone. Each job can add random jitter, so several
+processes (or several jobs due at the same moment) don't all fire at once. A run that's still going when the next one
+is due makes the scheduler skip that run rather than stack a second one on top.
+
+With lease=True a job runs in at most one process per scheduled time. The first process to fire takes a Redis lease
+named after the job and that time, and the others see it's taken and skip. The lease isn't released after the run, so
+a process that fires late can't run the same slot again.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, tzinfo
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from utils.leases import Lease
+from utils.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+Work = Callable[[], Awaitable[None]]
+
+# How long a per-run lease key outlives the time it's for, on top of the job's jitter. Covers clock skew between
+# processes and a slow event loop.
+LEASE_GRACE_SECONDS = 60.0
+# Sleep at most this long at a time, so a clock jump (a suspended host, an NTP step) is noticed soon after
+MAX_SLEEP_SECONDS = 60.0
+
+_CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 6))
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> Set[int]:
+    values = set()
+    for part in field.split(","):
+        spec, _, step = part.partition("/")
+        if spec == "*":
+            first, last = low, high
+        else:
+            start, _, end = spec.partition("-")
+            first = int(start)
+            last = int(end) if end else (high if step else first)
+        if not low <= first <= last <= high + (1 if high == 6 else 0):
+            raise ValueError("{!r} is out of range {}-{}".format(part, low, high))
+        values.update(range(first, last + 1, int(step or 1)))
+    return values
+
+
+class Cron:
+    """A five-field cron expression (minute hour day month weekday) evaluated in a timezone.
+
+    Supports *, lists, ranges and steps. Weekdays run 0-6 from Sunday, and 7 is Sunday too. As in cron, when both
+    day and weekday are restricted a time matches if either does.
+    """
+
+    def __init__(self, expression: str, tz: tzinfo):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expressions have 5 fields, got {!r}".format(expression))
+        self.expression = expression
+        self.tz = tz
+        minutes, hours, days, months, weekdays = (
+            _parse_cron_field(field, low, high) for field, (_, low, high) in zip(fields, _CRON_FIELDS))
+        self.minutes, self.hours, self.days, self.months = minutes, hours, days, months
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def __str__(self) -> str:
+        return "cron {} {}".format(self.expression, self.tz)
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        # isoweekday() is 1-7 from Monday, cron counts 0-6 from Sunday
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, timestamp: float) -> float:
+        """The first matching minute after timestamp, as a unix time"""
+        # Walk local wall-clock time, skipping a whole month, day or hour whenever that field can't match
+        moment = datetime.fromtimestamp(timestamp, self.tz).replace(second=0, microsecond=0, tzinfo=None)
+        moment += timedelta(minutes=1)
+        for _ in range(100_000):
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.replace(tzinfo=self.tz).timestamp()
+        raise ValueError("{} never matches".format(self))
+
+
+class Every:
+    """A fixed interval, aligned to the epoch so every process agrees on when runs are due"""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Intervals must be positive")
+        self.seconds = seconds
+
+    def __str__(self) -> str:
+        return "every {:g}s".format(self.seconds)
+
+    def next_after(self, timestamp: float) -> float:
+        return (timestamp // self.seconds + 1) * self.seconds
+
+
+class Job:
+    def __init__(self, name: str, schedule, work: Work, *, jitter: float = 0.0, lease: bool = False):
+        self.name = name
+        self.schedule = schedule
+        self.work = work
+        self.jitter = jitter
+        self.lease = lease
+        # Unix times
+        self.next_run: Optional[float] = None
+        self.last_started: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self._run: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._run is not None and not self._run.done()
+
+
+class Scheduler:
+    def __init__(self, metrics: Metrics, coordination: Callable[[], object], *,
+                 wait: Optional[Callable[[], Awaitable[None]]] = None):
+        # A callable rather than a client, the Redis service can be swapped out before the scheduler starts
+        self.coordination = coordination
+        self.wait = wait
+        self.jobs: Dict[str, Job] = {}
+        self._started = False
+        self._duration = metrics.histogram("brobot_job_duration_seconds", "Time a scheduled job took to run",
+                                           ["job"])
+        self._failures = metrics.counter("brobot_job_failures_total", "Scheduled job runs that raised", ["job"])
+        self._skipped = metrics.counter("brobot_job_skipped_total", "Scheduled job runs that didn't happen",
+                                        ["job", "reason"])
+
+    def every(self, name: str, seconds: float, work: Work, *, jitter: float = 0.0, lease: bool = False) -> Job:
+        return self.add(Job(name, Every(seconds), work, jitter=jitter, lease=lease))
+
+    def cron(self, name: str, expression: str, work: Work, *, tz: tzinfo, jitter: float = 0.0,
+             lease: bool = False) -> Job:
+        return self.add(Job(name, Cron(expression, tz), work, jitter=jitter, lease=lease))
+
+    def add(self, job: Job) -> Job:
+        if job.name in self.jobs:
+            raise ValueError("A job named {} is already scheduled".format(job.name))
+        self.jobs[job.name] = job
+        if self._started:
+            self._start(job)
+        return job
+
+    async def cancel(self, name: str):
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            await self._cancel(job)
+
+    def start(self):
+        self._started = True
+        for job in self.jobs.values():
+            self._start(job)
+
+    async def stop(self):
+        self._started = False
+        await asyncio.gather(*(self._cancel(job) for job in self.jobs.values()))
+
+    def _start(self, job: Job):
+        if job._task is None:
+            job._task = asyncio.create_task(self._loop(job), name="job:{}".format(job.name))
+
+    @staticmethod
+    async def _cancel(job: Job):
+        tasks = [task for task in (job._task, job._run) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        job._task = job._run = None
+
+    async def _loop(self, job: Job):
+        if self.wait is not None:
+            await self.wait()
+        while True:
+            due = job.schedule.next_after(time.time())
+            job.next_run = due + random.uniform(0, job.jitter)
+            while (remaining := job.next_run - time.time()) > 0:
+                await asyncio.sleep(min(remaining, MAX_SLEEP_SECONDS))
+            if job.running:
+                self._skip(job, "overlap")
+                continue
+            if job.lease and not await self._take_lease(job, due):
+                continue
+            job._run = asyncio.create_task(self._run(job), name="job-run:{}".format(job.name))
+
+    async def _take_lease(self, job: Job, due: float) -> bool:
+        lease = Lease(self.coordination(), "job:{}:{}".format(job.name, int(due)),
+                      ttl=job.jitter + LEASE_GRACE_SECONDS)
+        try:
+            if await lease.acquire():
+                return True
+        except Exception as error:
+            logger.warning("Job %s: lease unavailable, skipping this run: %s", job.name, error)
+            self._skip(job, "lease_error")
+            return False
+        self._skip(job, "other_process")
+        return False
+
+    def _skip(self, job: Job, reason: str):
+        job.skipped += 1
+        self._skipped.inc(job.name, reason)
+
+    async def _run(self, job: Job):
+        job.last_started = time.time()
+        started = time.perf_counter()
+        try:
+            await job.work()
+            job.last_error = None
+        except Exception as error:
+            job.failures += 1
+            job.last_error = "{}: {}".format(type(error).__name__, error)
+            self._failures.inc(job.name)
+            logger.exception("Job %s failed: %s", job.name, job.last_error)
+        finally:
+            job.runs += 1
+            job.last_duration = time.perf_counter() - started
+            self._duration.observe(job.name, value=job.last_duration)
+
+    def status(self) -> List[Job]:
+        return sorted(self.jobs.values(), key=lambda job: (job.next_run is None, job.next_run or 0, job.name))
@@ -0,0 +1,42 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class StartupProfile:
+    """Collects where time-to-ready goes: module imports, extension setup, and the gateway login/chunking"""
+
+    def __init__(self, process_started: float):
+        self.process_started = process_started
+        # module -> (import seconds, setup seconds)
+        self.modules: Dict[str, Tuple[float, float]] = {}
+        self.failed: List[str] = []
+        self.setup_hook_started: Optional[float] = None
+        self.extensions_loaded: Optional[float] = None
+        self.connected: Optional[float] = None
+        self.ready: Optional[float] = None
+
+    @staticmethod
+    def now() -> float:
+        return time.perf_counter()
+
+    def render(self) -> str:
+        ready = self.ready or self.now()
+        lines = ["Startup profile:"]
+        if self.setup_hook_started:
+            lines.append("  process start -> setup_hook:      {:7.3f}s".format(
+                self.setup_hook_started - self.process_started))
+        if self.modules:
+            imports = sum(import_time for import_time, _ in self.modules.values())
+            setups = sum(setup_time for _, setup_time in self.modules.values())
+            lines.append("  extensions: {:.3f}s wall ({:.3f}s importing, {:.3f}s in setup)".format(
+                (self.extensions_loaded or ready) - self.setup_hook_started, imports, setups))
+            for module, (import_time, setup_time) in sorted(self.modules.items(), key=lambda item: -sum(item[1])):
+                lines.append("    {:<26} import {:7.3f}s  setup {:7.3f}s".format(module, import_time, setup_time))
+        if self.failed:
+            lines.append("  failed to load: {}".format(", ".join(self.failed)))
+        if self.connected and self.extensions_loaded:
+            lines.append("  login -> gateway connect:         {:7.3f}s".format(self.connected - self.extensions_loaded))
+        if self.connected:
+            lines.append("  connect -> ready (incl. chunking): {:6.3f}s".format(ready - self.connected))
+        lines.append("  time to ready:                    {:7.3f}s".format(ready - self.process_started))
+        return "\n".join(lines)
@@ -0,0 +1,219 @@
+"""Persistent one-shot timers, for reminders and the like.
+
+Timers are kept in Redis, so they survive restarts and any process can fire them. Each kind of timer has a sorted set
+of timer ids scored by due time, plus a hash of their payloads. Every process keeps a heap of the due times it knows
+about and one task that sleeps until the earliest, however many timers are pending. When it wakes, it claims
+everything due for that kind with a Lua script that removes the timers as it returns them, so each timer fires once
+across processes. The heap is topped up from Redis every TIMER_SYNC_SECONDS, which picks up timers added by other
+processes and everything pending after a restart.
+
+Firing is at most once: a timer whose handler raises is gone, not retried.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+TIMER_SYNC_SECONDS = float(os.getenv("TIMER_SYNC_SECONDS", "60"))
+# Timers claimed per script call. Anything left over is claimed straight after.
+CLAIM_BATCH = 500
+# How long to wait before trying again when Redis didn't answer a claim
+RETRY_SECONDS = 5.0
+
+# KEYS[1] is the kind's sorted set, KEYS[2] its payload hash. Returns the claimed ids with their scores, and the
+# payloads in the same order.
+CLAIM_SCRIPT = """
+local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+if #due == 0 then
+    return {{}, {}}
+end
+local ids = {}
+for i = 1, #due, 2 do
+    ids[#ids + 1] = due[i]
+end
+redis.call('zrem', KEYS[1], unpack(ids))
+local payloads = redis.call('hmget', KEYS[2], unpack(ids))
+redis.call('hdel', KEYS[2], unpack(ids))
+return {due, payloads}
+"""
+
+# Gets a list of timer payloads, each with its "id" and "due" filled in
+Fire = Callable[[List[dict]], Awaitable[None]]
+
+
+def timer_keys(kind: str) -> Tuple[str, str]:
+    # The hash tag keeps both keys in one cluster slot, the claim script touches both
+    return "timers:{{{}}}:due".format(kind), "timers:{{{}}}:data".format(kind)
+
+
+class Timers:
+    def __init__(self, metrics: Metrics, client: Callable[[], object], *,
+                 wait: Optional[Callable[[], Awaitable[None]]] = None, active: Callable[[], bool] = lambda: True):
+        # A callable rather than a client, like the scheduler's
+        self.client = client
+        self.wait = wait
+        # A standby process leaves the timers to the active one
+        self.active = active
+        self._handlers: Dict[str, Fire] = {}
+        # (due, kind), one entry per distinct due time, so a thousand timers for the same run are one entry
+        self._heap: List[Tuple[float, str]] = []
+        self._queued: Set[Tuple[float, str]] = set()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Handlers run in their own tasks, so a slow one doesn't hold up the next timer
+        self._firing: Set[asyncio.Task] = set()
+        self._pending = metrics.gauge("brobot_timers_pending", "Timers waiting to fire, as of the last sync", ["kind"])
+        self._fired = metrics.counter("brobot_timers_fired_total", "Timers fired", ["kind"])
+        self._lateness = metrics.histogram("brobot_timer_lateness_seconds", "How long after its due time a timer fired",
+                                           ["kind"])
+
+    def register(self, kind: str, fire: Fire):
+        """Fires kind's timers through fire. Only registered kinds are loaded and fired by this process."""
+        self._handlers[kind] = fire
+        self._wake.set()
+
+    def unregister(self, kind: str):
+        self._handlers.pop(kind, None)
+
+    async def add(self, kind: str, timer_id: str, due: float, payload: dict):
+        """Adds a timer, or moves and replaces one with the same id"""
+        due_key, data_key = timer_keys(kind)
+        async with self.client().pipeline(transaction=True) as pipe:
+            pipe.zadd(due_key, {timer_id: due})
+            pipe.hset(data_key, timer_id, json.dumps(payload))
+            await pipe.execute()
+        self._push(due, kind)
+
+    async def cancel(self, kind: str, timer_id: str) -> bool:
+        due_key, data_key = timer_keys(kind)
+        async with self.client().pipeline(transaction=True) as pipe:
+            pipe.zrem(due_key, timer_id)
+            pipe.hdel(data_key, timer_id)
+            removed, _ = await pipe.execute()
+        # Its heap entry is left behind and just wakes the loop for nothing
+        return bool(removed)
+
+    async def reschedule(self, kind: str, moves: Dict[str, float]):
+        """Moves timers to new due times, skipping any that already fired or were cancelled"""
+        if not moves:
+            return
+        due_key, _ = timer_keys(kind)
+        async with self.client().pipeline(transaction=False) as pipe:
+            for timer_id, due in moves.items():
+                pipe.zadd(due_key, {timer_id: due}, xx=True)
+            await pipe.execute()
+        for due in set(moves.values()):
+            self._push(due, kind)
+
+    async def pending(self, kind: str) -> List[dict]:
+        """Every timer of kind that hasn't fired, soonest first"""
+        due_key, data_key = timer_keys(kind)
+        async with self.client().pipeline(transaction=True) as pipe:
+            pipe.zrange(due_key, 0, -1, withscores=True)
+            pipe.hgetall(data_key)
+            scored, payloads = await pipe.execute()
+        return [dict(json.loads(payloads[timer_id]), id=timer_id, due=float(due))
+                for timer_id, due in scored if timer_id in payloads]
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="timers")
+
+    async def stop(self):
+        tasks = [task for task in (self._task, *self._firing) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def _push(self, due: float, kind: str):
+        if (due, kind) in self._queued:
+            return
+        self._queued.add((due, kind))
+        heapq.heappush(self._heap, (due, kind))
+        if self._heap[0] == (due, kind):
+            self._wake.set()
+
+    async def sync(self):
+        """Loads every timer due before the next sync into the heap"""
+        horizon = time.time() + TIMER_SYNC_SECONDS * 2
+        for kind in list(self._handlers):
+            due_key, _ = timer_keys(kind)
+            async with self.client().pipeline(transaction=False) as pipe:
+                pipe.zrangebyscore(due_key, "-inf", horizon, withscores=True)
+                pipe.zcard(due_key)
+                soon, total = await pipe.execute()
+            self._pending.set(kind, value=total)
+            for due in {due for _, due in soon}:
+                self._push(float(due), kind)
+
+    async def _loop(self):
+        if self.wait is not None:
+            await self.wait()
+        next_sync = 0.0
+        while True:
+            now = time.time()
+            if now >= next_sync:
+                try:
+                    await self.sync()
+                except Exception as error:
+                    logger.warning("Could not load timers: %s", error)
+                next_sync = now + TIMER_SYNC_SECONDS
+            kinds = set()
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                self._queued.discard(entry)
+                kinds.add(entry[1])
+            for kind in kinds:
+                if self.active():
+                    await self._fire(kind, now)
+                else:
+                    self._push(now + RETRY_SECONDS, kind)
+            # The earliest timer, or the next sync, whichever comes first
+            wake_at = min(self._heap[0][0] if self._heap else next_sync, next_sync)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, wake_at - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, kind: str, now: float):
+        fire = self._handlers.get(kind)
+        if fire is None:
+            return
+        due_key, data_key = timer_keys(kind)
+        try:
+            scored, payloads = await self.client().eval(CLAIM_SCRIPT, 2, due_key, data_key, now, CLAIM_BATCH)
+        except Exception as error:
+            logger.warning("Could not claim %s timers, retrying in %ss: %s", kind, RETRY_SECONDS, error)
+            self._push(now + RETRY_SECONDS, kind)
+            return
+        if len(payloads) >= CLAIM_BATCH:
+            self._push(now, kind)
+        timers = []
+        for index, payload in enumerate(payloads):
+            if payload is None:
+                continue
+            timer_id, due = scored[index * 2], float(scored[index * 2 + 1])
+            self._lateness.observe(kind, value=max(0.0, time.time() - due))
+            timers.append(dict(json.loads(payload), id=timer_id, due=due))
+        if not timers:
+            return
+        self._fired.inc(kind, amount=len(timers))
+        task = asyncio.create_task(self._run(kind, fire, timers), name="timers:{}".format(kind))
+        self._firing.add(task)
+        task.add_done_callback(self._firing.discard)
+
+    @staticmethod
+    async def _run(kind: str, fire: Fire, timers: List[dict]):
+        try:
+            await fire(timers)
+        except Exception:
+            logger.exception("Firing %d %s timers failed", len(timers), kind)
@@ -0,0 +1,124 @@
+import itertools
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+NON_TEXT_MATCH = re.compile(r"[^a-z]")
+
+# Flags that can be scoped to a single alternative of the combined pattern
+_INLINE_FLAGS = ((re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x"))
+
+Handler = Callable[..., Any]
+
+
+def simplify_text(text: str) -> str:
+    """Lowercases, strips everything but letters and collapses repeats, so "Everybodyyyy!!" == "everybody" """
+    text = NON_TEXT_MATCH.sub("", text.lower())
+    return "".join(c for c, _ in itertools.groupby(text))
+
+
+def trigger(*phrases: str, pattern: Optional[str] = None, flags: int = 0):
+    """Registers a cog method as a message handler.
+
+    Phrases are compared against the simplified message text, patterns are matched from the start of the raw message
+    like re.match. The decorated method is called with the message only when one of them hits.
+    """
+
+    def decorator(func):
+        specs: List[Tuple[str, str, int]] = list(getattr(func, "__triggers__", []))
+        specs.extend(("phrase", phrase, 0) for phrase in phrases)
+        if pattern is not None:
+            specs.append(("pattern", pattern, flags))
+        func.__triggers__ = specs
+        return func
+
+    return decorator
+
+
+class TriggerEngine:
+    """Matches every registered trigger against a message in one pass.
+
+    Phrases live in a dict keyed by their simplified text, so the message is normalized once and looked up once.
+    Patterns without groups are also folded into one alternation, which turns away the messages none of them match
+    in a single call. Only when it hits is each pattern run on its own, so every trigger that matches fires. Patterns
+    with groups keep their own numbering and backreferences and are always run on their own.
+    """
+
+    def __init__(self):
+        # owner -> [(kind, text, flags, handler)]
+        self._owners: Dict[Any, List[Tuple[str, str, int, Handler]]] = {}
+        self._phrases: Dict[str, List[Tuple[int, Handler]]] = {}
+        self._longest_phrase = 0
+        self._prefilter: Optional[re.Pattern] = None
+        # (pattern, behind the prefilter, handler), in registration order
+        self._patterns: List[Tuple[re.Pattern, bool, Handler]] = []
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._owners.values())
+
+    def add_cog(self, cog, *, wrap: Optional[Callable[[Handler], Handler]] = None):
+        entries = []
+        for cls in reversed(type(cog).__mro__):
+            for name, func in cls.__dict__.items():
+                for kind, text, flags in getattr(func, "__triggers__", ()):
+                    handler = getattr(cog, name)
+                    entries.append((kind, text, flags, wrap(handler) if wrap else handler))
+        if entries:
+            self.add(cog, entries)
+
+    def remove_cog(self, cog):
+        self.remove(cog)
+
+    def add(self, owner, entries: List[Tuple[str, str, int, Handler]]):
+        self._owners[owner] = entries
+        self._dirty = True
+
+    def remove(self, owner):
+        if self._owners.pop(owner, None) is not None:
+            self._dirty = True
+
+    def _compile(self):
+        self._phrases = {}
+        patterns: List[Tuple[re.Pattern, Handler]] = []
+        alternatives = []
+        for entries in self._owners.values():
+            for kind, text, flags, handler in entries:
+                if kind == "phrase":
+                    self._phrases.setdefault(simplify_text(text), []).append((len(text), handler))
+                    continue
+                compiled = re.compile(text, flags)
+                patterns.append((compiled, handler))
+                if not compiled.groups:
+                    inline = "".join(letter for flag, letter in _INLINE_FLAGS if flags & flag)
+                    alternatives.append("(?{}:{})".format(inline, text))
+        self._longest_phrase = max((length for handlers in self._phrases.values() for length, _ in handlers),
+                                   default=0)
+        try:
+            self._prefilter = re.compile("|".join(alternatives)) if alternatives else None
+        except re.error:
+            # e.g. a pattern with global inline flags, which only work at the start of the whole expression
+            self._prefilter = None
+        self._patterns = [(compiled, self._prefilter is not None and not compiled.groups, handler)
+                          for compiled, handler in patterns]
+        self._dirty = False
+
+    def match(self, content: str, mention_count: int = 0) -> List[Handler]:
+        """Returns the handlers whose triggers hit the given message text"""
+        if self._dirty:
+            self._compile()
+
+        hits: List[Handler] = []
+        # A message much longer than a phrase obviously isn't that phrase, so don't bother normalizing it
+        slack = mention_count * 30
+        if self._phrases and len(content) <= self._longest_phrase * 5 + slack:
+            for length, handler in self._phrases.get(simplify_text(content), ()):
+                if len(content) <= length * 5 + slack:
+                    hits.append(handler)
+
+        if self._patterns:
+            candidates = self._prefilter is not None and self._prefilter.match(content) is not None
+            for compiled, filtered, handler in self._patterns:
+                if (candidates or not filtered) and compiled.match(content):
+                    hits.append(handler)
+
+        return hits
@@ -0,0 +1,96 @@
+"""Stock watch subscriptions, indexed so each polled quote is checked against its watchers in one pass.
+
+A watch fires when a symbol's move since the day's open passes the watcher's threshold, in either direction, once a
+day. Each symbol keeps its watchers' thresholds sorted, along with the biggest move already alerted on that day. A new
+quote only has to find the thresholds between that mark and the new move with two bisects, so a tick costs the same
+however many people watch a symbol, plus whatever actually fires.
+"""
+import bisect
+import json
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class Watch(NamedTuple):
+    guild: int
+    channel: int
+    user: int
+    symbol: str
+    # Percent move from the day's open
+    threshold: float
+
+    @property
+    def id(self) -> str:
+        return watch_id(self.guild, self.user, self.symbol)
+
+    def to_json(self) -> str:
+        return json.dumps(list(self))
+
+    @classmethod
+    def from_json(cls, data: str) -> "Watch":
+        return cls(*json.loads(data))
+
+
+def watch_id(guild: int, user: int, symbol: str) -> str:
+    return "{}:{}:{}".format(guild, user, symbol)
+
+
+class WatchIndex:
+    def __init__(self, watches: Iterable[Watch] = (), marks: Optional[Dict[str, Tuple[str, float]]] = None):
+        self.watches: Dict[str, Watch] = {}
+        # symbol -> thresholds in ascending order, with the matching watch ids alongside
+        self._thresholds: Dict[str, List[float]] = {}
+        self._ids: Dict[str, List[str]] = {}
+        # symbol -> (day, biggest move alerted on that day)
+        self.marks: Dict[str, Tuple[str, float]] = dict(marks or {})
+        for watch in watches:
+            self.add(watch)
+
+    def __len__(self) -> int:
+        return len(self.watches)
+
+    def symbols(self) -> List[str]:
+        return sorted(self._thresholds)
+
+    def for_user(self, guild: int, user: int) -> List[Watch]:
+        prefix = "{}:{}:".format(guild, user)
+        return sorted((watch for key, watch in self.watches.items() if key.startswith(prefix)),
+                      key=lambda watch: watch.symbol)
+
+    def add(self, watch: Watch):
+        """Adds a watch, replacing the same user's earlier watch on the symbol"""
+        self.remove(watch.id)
+        self.watches[watch.id] = watch
+        thresholds = self._thresholds.setdefault(watch.symbol, [])
+        position = bisect.bisect_right(thresholds, watch.threshold)
+        thresholds.insert(position, watch.threshold)
+        self._ids.setdefault(watch.symbol, []).insert(position, watch.id)
+
+    def remove(self, key: str) -> Optional[Watch]:
+        watch = self.watches.pop(key, None)
+        if watch is None:
+            return None
+        thresholds, ids = self._thresholds[watch.symbol], self._ids[watch.symbol]
+        start = bisect.bisect_left(thresholds, watch.threshold)
+        position = ids.index(key, start)
+        del thresholds[position], ids[position]
+        if not ids:
+            del self._thresholds[watch.symbol], self._ids[watch.symbol]
+            self.marks.pop(watch.symbol, None)
+        return watch
+
+    def moved(self, symbol: str, day: str) -> float:
+        """The biggest move already alerted on for symbol today"""
+        marked_day, mark = self.marks.get(symbol, (day, 0.0))
+        return mark if marked_day == day else 0.0
+
+    def check(self, symbol: str, day: str, move_pct: float) -> List[Watch]:
+        """The watches on symbol that move_pct newly passes today, marking them as alerted"""
+        move = abs(move_pct)
+        mark = self.moved(symbol, day)
+        thresholds = self._thresholds.get(symbol)
+        if not thresholds or move <= mark:
+            return []
+        self.marks[symbol] = (day, move)
+        ids = self._ids[symbol]
+        return [self.watches[key] for key in ids[bisect.bisect_right(thresholds, mark):
+                                                  bisect.bisect_right(thresholds, move)]]